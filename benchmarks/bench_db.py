@@ -0,0 +1,297 @@
+"""
+Воспроизводимые замеры путей работы с медиа в БД.
+
+Поднимает временный Postgres (initdb + pg_ctl во временном каталоге) или
+использует уже запущенный сервер из BENCH_DSN, и измеряет:
+  - задержку установки соединения в Database.__aenter__ (без пула и с пулом);
+  - задержку Database.fetchval на мелкой вставке;
+  - пропускную способность upload_video_to_db / stream_media / get_video
+    и пиковый RSS на размерах от 1 МБ до 1 ГБ;
+  - масштабирование get_latest_media_meta по числу одновременных клиентов.
+
+Результат пишется в JSON (--output), чтобы сравнивать версии между собой.
+
+Запуск: python -m benchmarks.bench_db --sizes 1,16,128,1024 --output bench_results.json
+"""
+import os
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import config
+from config import DATE_BASE_CONNECT, DB_POOL, TRANSCODE_RENDITIONS
+from database.database import Database
+from database.functions import init_db
+from metrics import process_rss
+from functions import get_latest_media_meta, stream_media, get_video
+from server.uploader import upload_video_to_db
+
+MB = 1024 * 1024
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def summarize(latencies: List[float]) -> Dict[str, Optional[float]]:
+    """Сводка задержек в миллисекундах"""
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": max(latencies) if latencies else None,
+        "mean_ms": sum(latencies) / len(latencies) if latencies else None,
+    }
+
+
+@contextmanager
+def rss_peak(result: dict, interval: float = 0.01):
+    """Пиковый прирост RSS за время блока (опрос в фоновом потоке)"""
+    baseline = process_rss()
+    peak = [baseline]
+    stop = threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak[0] = max(peak[0], process_rss())
+            stop.wait(interval)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        sampler.join()
+        peak[0] = max(peak[0], process_rss())
+        result["peak_rss_delta_mb"] = round((peak[0] - baseline) / MB, 2)
+
+
+class ThrowawayPostgres:
+    """Временный кластер Postgres на свободном порту; удаляется после замеров"""
+
+    def __init__(self, max_connections: Optional[int] = None):
+        self.data_dir = tempfile.mkdtemp(prefix="bench-pg-")
+        self.port = self._free_port()
+        self.max_connections = max_connections
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def __enter__(self) -> dict:
+        try:
+            if not shutil.which("initdb") or not shutil.which("pg_ctl"):
+                raise RuntimeError("initdb/pg_ctl не найдены: установите Postgres или задайте BENCH_DSN")
+            subprocess.run(["initdb", "-D", self.data_dir, "-U", "bench", "--auth=trust"],
+                           check=True, capture_output=True)
+            subprocess.run(["pg_ctl", "-D", self.data_dir, "-w", "-l", os.path.join(self.data_dir, "log"),
+                            "-o", f"-p {self.port} -k {self.data_dir} -c listen_addresses=127.0.0.1"
+                                  + (f" -c max_connections={self.max_connections}" if self.max_connections else ""),
+                            "start"],
+                           check=True, capture_output=True)
+        except BaseException:
+            # __exit__ не вызывается, если упал __enter__: убираем кластер сами
+            if shutil.which("pg_ctl"):
+                subprocess.run(["pg_ctl", "-D", self.data_dir, "-m", "immediate", "stop"], capture_output=True)
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+            raise
+        return {"host": "127.0.0.1", "port": self.port, "user": "bench", "password": None, "database": "postgres"}
+
+    def __exit__(self, *exc):
+        subprocess.run(["pg_ctl", "-D", self.data_dir, "-m", "immediate", "stop"], capture_output=True)
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+def connection_from_dsn(dsn: str) -> dict:
+    url = urlsplit(dsn)
+    return {"host": url.hostname, "port": url.port or 5432, "user": url.username,
+            "password": url.password, "database": url.path.lstrip("/") or "postgres"}
+
+
+async def bench_connect(iterations: int) -> dict:
+    results = {}
+    for pooled in (False, True):
+        DB_POOL["enabled"] = pooled
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            async with Database(readonly=True) as db:
+                latencies.append((time.perf_counter() - started) * 1000)
+                await db.execute("SELECT 1")
+        results["pool" if pooled else "no_pool"] = summarize(latencies)
+    return results
+
+
+async def bench_fetchval(iterations: int) -> dict:
+    async with Database() as db:
+        await db.execute("CREATE TABLE IF NOT EXISTS bench_fetchval (id bigint GENERATED ALWAYS AS IDENTITY, v int)")
+    latencies = []
+    for i in range(iterations):
+        async with Database() as db:
+            started = time.perf_counter()
+            await db.fetchval("INSERT INTO bench_fetchval (v) VALUES ($1)", (i,))
+            latencies.append((time.perf_counter() - started) * 1000)
+    return summarize(latencies)
+
+
+def make_file(directory: str, size: int) -> str:
+    path = os.path.join(directory, f"blob-{size}.bin")
+    with open(path, "wb") as file:
+        remaining = size
+        while remaining > 0:
+            file.write(os.urandom(min(MB, remaining)))
+            remaining -= MB
+    return path
+
+
+async def bench_blobs(sizes_mb: List[int], work_dir: str) -> List[dict]:
+    import functions
+    results = []
+    for size_mb in sizes_mb:
+        size = size_mb * MB
+        path = make_file(work_dir, size)
+        entry = {"size_mb": size_mb}
+
+        upload = {}
+        with rss_peak(upload):
+            started = time.perf_counter()
+            media_id = await upload_video_to_db(path)
+            upload["seconds"] = time.perf_counter() - started
+        upload["mb_per_s"] = size_mb / upload["seconds"]
+        entry["upload"] = upload
+        os.remove(path)
+        if media_id is None:
+            entry["error"] = "upload failed"
+            results.append(entry)
+            continue
+
+        stream = {}
+        with rss_peak(stream):
+            started = time.perf_counter()
+            received = 0
+            async for chunk in stream_media("videos", media_id):
+                received += len(chunk)
+            stream["seconds"] = time.perf_counter() - started
+        stream["mb_per_s"] = size_mb / stream["seconds"]
+        stream["bytes"] = received
+        entry["stream_media"] = stream
+
+        # get_video собирает весь файл в памяти — для сравнения пикового RSS
+        functions.last_video_id = -1
+        whole = {}
+        with rss_peak(whole):
+            started = time.perf_counter()
+            data = await get_video()
+            whole["seconds"] = time.perf_counter() - started
+        whole["mb_per_s"] = size_mb / whole["seconds"]
+        whole["bytes"] = len(data or b"")
+        del data
+        entry["get_video"] = whole
+
+        results.append(entry)
+        print(f"  {size_mb} МБ: upload {upload['mb_per_s']:.1f} МБ/с, "
+              f"stream {stream['mb_per_s']:.1f} МБ/с, get_video {whole['mb_per_s']:.1f} МБ/с")
+    return results
+
+
+async def bench_concurrency(levels: List[int], requests_per_client: int) -> List[dict]:
+    results = []
+    DB_POOL["enabled"] = True
+    for clients in levels:
+        await Database.close_pool()
+        DB_POOL["max_size"] = max(clients, DB_POOL["min_size"])
+        latencies: List[float] = []
+        errors = 0
+
+        async def client():
+            nonlocal errors
+            for _ in range(requests_per_client):
+                started = time.perf_counter()
+                meta = await get_latest_media_meta("videos", -1)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if meta is None:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+        results.append({"clients": clients, "requests_per_s": len(latencies) / elapsed,
+                        "errors": errors, **summarize(latencies)})
+        print(f"  {clients} клиентов: {len(latencies) / elapsed:.0f} запросов/с, "
+              f"p99 {results[-1]['p99_ms']:.1f} мс")
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> dict:
+    # Замеры касаются хранения, а не перекодирования
+    TRANSCODE_RENDITIONS.clear()
+    await init_db()
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"sizes_mb": args.sizes, "concurrency": args.concurrency,
+                   "chunk_size": config.MEDIA_CHUNK_SIZE},
+    }
+    print("Соединение:")
+    report["connect"] = await bench_connect(args.iterations)
+    print(f"  без пула p50 {report['connect']['no_pool']['p50_ms']:.2f} мс, "
+          f"с пулом p50 {report['connect']['pool']['p50_ms']:.2f} мс")
+    report["fetchval"] = await bench_fetchval(args.iterations)
+    print("Размеры:")
+    with tempfile.TemporaryDirectory(prefix="bench-blobs-") as work_dir:
+        report["blobs"] = await bench_blobs(args.sizes, work_dir)
+    print("Параллельные клиенты:")
+    report["concurrency"] = await bench_concurrency(args.concurrency, args.requests)
+    await Database.close_pool()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры путей работы с медиа в БД")
+    parser.add_argument("--sizes", default="1,16,128,1024", help="Размеры файлов в МБ через запятую")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Число клиентов через запятую")
+    parser.add_argument("--iterations", type=int, default=200, help="Повторов для замеров задержки")
+    parser.add_argument("--requests", type=int, default=50, help="Запросов на клиента")
+    parser.add_argument("--output", default="bench_results.json", help="Файл с результатами (JSON)")
+    args = parser.parse_args()
+    args.sizes = [int(item) for item in args.sizes.split(",") if item]
+    args.concurrency = [int(item) for item in args.concurrency.split(",") if item]
+
+    dsn = os.getenv("BENCH_DSN")
+    with nullcontext(connection_from_dsn(dsn)) if dsn else ThrowawayPostgres() as db_connect:
+        DATE_BASE_CONNECT.clear()
+        DATE_BASE_CONNECT.update(db_connect)
+        report = asyncio.run(run(args))
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,372 @@
+"""
+Нагрузочная модель парка киосков: сколько дисплеев выдержит один Postgres.
+
+Запускает сотни безголовых клиентов (без Qt), которые повторяют путь
+DisplayZone.load_and_play_video (main.py): подписка LISTEN (database.listener),
+резервный опрос get_latest_media_meta, выбор версии get_best_rendition и
+скачивание download_media_ranges. Процесс моделирует один киоск: как у
+ContentHub в main.py, у него свой пул соединений (Database), свой circuit
+breaker (DB_HEALTH) и одно соединение LISTEN. По умолчанию --processes
+равно --clients — каждый клиент отдельный киоск с одной зоной, и число
+соединений, волна переподключений после рестарта и поведение breaker
+соответствуют настоящему парку (ценой процесса на клиента). При
+--processes меньше --clients клиенты процесса — зоны одного киоска: они
+делят пул, breaker и слушателя.
+
+Сценарий:
+  1. initial — все клиенты получают первое видео;
+  2. update  — загружается новое видео, ждём, пока его получат все;
+  3. restart — все соединения клиентов обрываются через
+     pg_terminate_backend (имитация перезапуска БД), затем загружается ещё
+     одно видео: клиенты должны переподключиться и получить его.
+
+Отчёт: число соединений с БД (pg_stat_activity), p50/p99 проверки
+метаданных и скачивания, байты, отданные клиентам, и время, за которое
+новое видео получили все клиенты в каждой фазе; в per_process — те же
+показатели отдельно по каждому процессу-киоску.
+
+Postgres — как в bench_db: временный кластер или BENCH_DSN.
+
+Запуск: python -m benchmarks.fleet_sim --clients 200 --output fleet_results.json
+"""
+import os
+import json
+import time
+import queue
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import multiprocessing
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+
+from benchmarks.bench_db import (MB, ThrowawayPostgres, connection_from_dsn, git_revision,
+                                 make_file, percentile, summarize)
+from config import DATE_BASE_CONNECT, DB_POOL, TRANSCODE_RENDITIONS
+from database.database import Database
+from database.functions import init_db
+from database.health import DB_HEALTH, Backoff
+from database.listener import MediaListener
+from functions import download_media_ranges, get_best_rendition, get_latest_media_meta
+from server.uploader import upload_video_to_db
+
+# Разрешение экрана симулируемого киоска (для выбора версии видео)
+SCREEN_WIDTH, SCREEN_HEIGHT = 1920, 1080
+
+
+class SimClient:
+    """Одна видеозона киоска: та же последовательность запросов, что у DisplayZone"""
+
+    def __init__(self, name: str, work_dir: str, events, poll: float):
+        self.name = name
+        self.work_dir = work_dir
+        self.events = events
+        self.poll = poll
+        self.current_id: Optional[int] = None
+        self.meta_ms: List[float] = []
+        self.download_ms: List[float] = []
+        self.bytes = 0
+        self.errors = 0
+        self._wake = asyncio.Event()
+        self._backoff = Backoff(base=5)
+
+    def on_notification(self, payload: Optional[dict]) -> None:
+        if payload is None or payload.get("table") == "videos":
+            self._wake.set()
+
+    async def run(self) -> None:
+        # Киоски включаются не одновременно
+        await asyncio.sleep(random.uniform(0, self.poll))
+        while True:
+            self._wake.clear()
+            if await self.check():
+                self._backoff.reset()
+                timeout = self.poll
+            else:
+                # Как schedule_retry: не раньше, чем circuit breaker разрешит проверку
+                timeout = max(self._backoff.next(), DB_HEALTH.retry_after())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def check(self) -> bool:
+        """Проверка и скачивание нового видео; False — ошибка, нужен повтор"""
+        started = time.perf_counter()
+        meta = await get_latest_media_meta("videos", self.current_id)
+        self.meta_ms.append((time.perf_counter() - started) * 1000)
+        if meta is None:
+            self.errors += 1
+            return False
+        if not meta:
+            return True
+
+        started = time.perf_counter()
+        rendition = await get_best_rendition("videos", meta["id"], SCREEN_WIDTH, SCREEN_HEIGHT) or meta
+        path = os.path.join(self.work_dir, f"{self.name}-{rendition['id']}.mp4")
+        size = await download_media_ranges("videos", rendition["id"], path)
+        if size is None:
+            self.errors += 1
+            return False
+        self.download_ms.append((time.perf_counter() - started) * 1000)
+        self.bytes += size
+        os.remove(path)
+        self.current_id = meta["id"]
+        self.events.put(("content", self.name, meta["id"], time.time()))
+        return True
+
+
+async def _run_clients(index: int, clients: int, work_dir: str, events, stop, poll: float, listen: bool) -> dict:
+    fleet = [SimClient(f"{index}-{number}", work_dir, events, poll) for number in range(clients)]
+    listener_connects = 0
+
+    def on_notification(payload: Optional[dict]) -> None:
+        # Одно соединение LISTEN на киоск, как у ContentHub: уведомление будит все его зоны
+        nonlocal listener_connects
+        if payload is None:
+            listener_connects += 1
+        for client in fleet:
+            client.on_notification(payload)
+
+    listener = MediaListener(on_notification) if listen else None
+    if listener:
+        listener.start()
+    tasks = [asyncio.create_task(client.run()) for client in fleet]
+    while not stop.is_set():
+        await asyncio.sleep(0.2)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if listener:
+        await listener.stop()
+    await Database.close_pool()
+    return {
+        "index": index,
+        "clients": clients,
+        "meta_ms": [value for client in fleet for value in client.meta_ms],
+        "download_ms": [value for client in fleet for value in client.download_ms],
+        "bytes": sum(client.bytes for client in fleet),
+        "errors": sum(client.errors for client in fleet),
+        "listener_connects": listener_connects,
+    }
+
+
+def worker_main(index: int, clients: int, db_connect: dict, pool: dict, work_dir: str,
+                events, stop, poll: float, listen: bool) -> None:
+    """Процесс с группой клиентов (точка входа multiprocessing)"""
+    DATE_BASE_CONNECT.clear()
+    DATE_BASE_CONNECT.update(db_connect)
+    DB_POOL.update(pool)
+    stats = asyncio.run(_run_clients(index, clients, work_dir, events, stop, poll, listen))
+    events.put(("stats", index, stats))
+
+
+class Collector:
+    """Сбор событий от процессов-клиентов в фоновом потоке"""
+
+    def __init__(self, events):
+        self.events = events
+        self.arrivals: Dict[int, Dict[str, float]] = {}
+        self.stats: List[dict] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                event = self.events.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if event[0] == "content":
+                _, name, media_id, timestamp = event
+                self.arrivals.setdefault(media_id, {}).setdefault(name, timestamp)
+            elif event[0] == "stats":
+                self.stats.append(event[2])
+
+
+async def sample_connections(samples: List[int], interval: float = 0.5) -> None:
+    """Число соединений с БД (без собственного соединения замера)"""
+    while True:
+        async with Database(readonly=True) as db:
+            result = await db.execute(
+                """SELECT count(*) AS connections FROM pg_stat_activity
+                    WHERE datname = current_database() AND pid <> pg_backend_pid()"""
+            )
+        if result:
+            samples.append(result["connections"])
+        await asyncio.sleep(interval)
+
+
+async def converge(collector: Collector, media_id: int, started: float, total: int, timeout: float) -> dict:
+    """Ждёт, пока media_id получат все клиенты; задержки считаются от started"""
+    deadline = time.time() + timeout
+    while len(collector.arrivals.get(media_id, {})) < total and time.time() < deadline:
+        await asyncio.sleep(0.1)
+    delays = [timestamp - started for timestamp in collector.arrivals.get(media_id, {}).values()]
+    result = {
+        "media_id": media_id,
+        "clients_converged": len(delays),
+        "p50_s": percentile(delays, 0.50),
+        "p99_s": percentile(delays, 0.99),
+        # None — за timeout новое видео получили не все клиенты
+        "all_clients_s": max(delays) if len(delays) == total else None,
+    }
+    print(f"  получили {len(delays)}/{total}, p50 {result['p50_s'] or 0:.2f} с, "
+          f"все — {result['all_clients_s'] if result['all_clients_s'] is not None else 'не дождались'}")
+    return result
+
+
+async def terminate_backends() -> Optional[int]:
+    """Обрыв всех соединений с базой, кроме текущего (имитация перезапуска БД)"""
+    async with Database(readonly=True) as db:
+        result = await db.execute(
+            """SELECT count(pg_terminate_backend(pid)) AS terminated FROM pg_stat_activity
+                WHERE datname = current_database() AND pid <> pg_backend_pid()"""
+        )
+    return result["terminated"] if result else None
+
+
+async def run(args, db_connect: dict) -> dict:
+    # Моделируется раздача, а не перекодирование
+    TRANSCODE_RENDITIONS.clear()
+    await init_db()
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"clients": args.clients, "processes": args.processes, "poll_s": args.poll,
+                   "listen": args.listen, "media_mb": args.media_mb, "pool_max_size": args.pool_size},
+        "phases": {},
+    }
+
+    work_dir = tempfile.mkdtemp(prefix="fleet-sim-")
+    source = make_file(work_dir, args.media_mb * MB)
+
+    async def upload() -> int:
+        media_id = await upload_video_to_db(source)
+        if media_id is None:
+            raise RuntimeError("Не удалось загрузить видео")
+        return media_id
+
+    context = multiprocessing.get_context("spawn")
+    events = context.Queue()
+    stop = context.Event()
+    collector = Collector(events)
+    collector.start()
+    pool = {"max_size": args.pool_size, "min_size": min(DB_POOL["min_size"], args.pool_size)}
+    shares = [args.clients // args.processes + (index < args.clients % args.processes)
+              for index in range(args.processes)]
+    processes = [
+        context.Process(target=worker_main, args=(index, share, db_connect, pool, work_dir,
+                                                  events, stop, args.poll, args.listen))
+        for index, share in enumerate(shares) if share
+    ]
+
+    connection_samples: List[int] = []
+    sampler = asyncio.create_task(sample_connections(connection_samples))
+    try:
+        print("initial:")
+        media_id = await upload()
+        started = time.time()
+        for process in processes:
+            process.start()
+        report["phases"]["initial"] = await converge(collector, media_id, started, args.clients, args.timeout)
+
+        print("update:")
+        media_id = await upload()
+        report["phases"]["update"] = await converge(collector, media_id, time.time(), args.clients, args.timeout)
+
+        print("restart:")
+        report["terminated_connections"] = await terminate_backends()
+        await asyncio.sleep(args.restart_pause)
+        media_id = await upload()
+        report["phases"]["restart"] = await converge(collector, media_id, time.time(), args.clients, args.timeout)
+    finally:
+        sampler.cancel()
+        stop.set()
+        for process in processes:
+            await asyncio.to_thread(process.join, 30)
+        # Статистика процессов приходит после их завершения
+        await asyncio.sleep(0.5)
+        collector.stop()
+        await Database.close_pool()
+        for name in os.listdir(work_dir):
+            os.remove(os.path.join(work_dir, name))
+        os.rmdir(work_dir)
+
+    meta_ms = [value for stats in collector.stats for value in stats["meta_ms"]]
+    download_ms = [value for stats in collector.stats for value in stats["download_ms"]]
+    report["connections"] = {
+        "peak": max(connection_samples) if connection_samples else None,
+        "mean": sum(connection_samples) / len(connection_samples) if connection_samples else None,
+    }
+    report["meta_check"] = summarize(meta_ms)
+    report["download"] = summarize(download_ms)
+    report["bytes_served"] = sum(stats["bytes"] for stats in collector.stats)
+    report["errors"] = sum(stats["errors"] for stats in collector.stats)
+    report["listener_connects"] = sum(stats["listener_connects"] for stats in collector.stats)
+    report["processes_reported"] = len(collector.stats)
+    # Пул и breaker общие для клиентов процесса, поэтому процесс — единица сравнения
+    report["per_process"] = [
+        {
+            "index": stats["index"],
+            "clients": stats["clients"],
+            "meta_check": summarize(stats["meta_ms"]),
+            "download": summarize(stats["download_ms"]),
+            "bytes_served": stats["bytes"],
+            "errors": stats["errors"],
+            "listener_connects": stats["listener_connects"],
+        }
+        for stats in sorted(collector.stats, key=lambda stats: stats["index"])
+    ]
+
+    print(f"Соединения: пик {report['connections']['peak']}, "
+          f"проверка метаданных p50 {report['meta_check']['p50_ms'] or 0:.1f} мс / "
+          f"p99 {report['meta_check']['p99_ms'] or 0:.1f} мс, "
+          f"отдано {report['bytes_served'] / MB:.0f} МБ, ошибок {report['errors']}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочная модель парка киосков")
+    parser.add_argument("--clients", type=int, default=200, help="Число симулируемых клиентов")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="Процессов (киосков); по умолчанию по одному на клиента")
+    parser.add_argument("--poll", type=float, default=30, help="Интервал резервного опроса клиента, с")
+    parser.add_argument("--no-listen", dest="listen", action="store_false", help="Без LISTEN, только опрос")
+    parser.add_argument("--media-mb", type=int, default=4, help="Размер раздаваемого видео в МБ")
+    parser.add_argument("--pool-size", type=int, default=DB_POOL["max_size"], help="Размер пула на процесс")
+    parser.add_argument("--timeout", type=float, default=300, help="Сколько ждать схождения фазы, с")
+    parser.add_argument("--restart-pause", type=float, default=0, help="Пауза после обрыва соединений, с")
+    parser.add_argument("--output", default="fleet_results.json", help="Файл с результатами (JSON)")
+    args = parser.parse_args()
+    args.processes = max(1, min(args.processes or args.clients, args.clients))
+
+    dsn = os.getenv("BENCH_DSN")
+    # Сотни киосков не помещаются в max_connections по умолчанию (100): на каждый —
+    # пул до --pool-size соединений и LISTEN, плюс запас на загрузчик и замеры
+    max_connections = args.processes * (args.pool_size + 1) + 50
+    server = nullcontext(connection_from_dsn(dsn)) if dsn else ThrowawayPostgres(max_connections=max_connections)
+    with server as db_connect:
+        DATE_BASE_CONNECT.clear()
+        DATE_BASE_CONNECT.update(db_connect)
+        report = asyncio.run(run(args, db_connect))
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
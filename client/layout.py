@@ -0,0 +1,66 @@
+"""
+Раскладка дисплеев: окна по экранам и зоны внутри окон.
+
+DISPLAY_LAYOUT — JSON (строкой или путём к файлу):
+
+    [{"screen": 0, "zones": [{"name": "main", "mode": "video", "rect": [0, 0, 0.7, 1]},
+                             {"name": "side", "mode": "slideshow", "rect": [0.7, 0, 0.3, 1]}]},
+     {"screen": 1, "zones": [{"name": "hall", "mode": "video"}]}]
+
+screen — номер экрана (QGuiApplication.screens()), rect — доли окна
+[x, y, ширина, высота] (по умолчанию всё окно), mode — video или slideshow.
+Пустой DISPLAY_LAYOUT — одно окно на основном экране с одной зоной
+DISPLAY_MODE, как раньше.
+"""
+import os
+import json
+from typing import List, Optional
+from config import logger
+
+ZONE_MODES = ("video", "slideshow")
+
+
+def _parse(value: str):
+    if os.path.isfile(value):
+        with open(value, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    return json.loads(value)
+
+
+def load_layout(value: str, default_mode: str) -> List[dict]:
+    """
+    Список окон {"screen", "zones": [{"name", "mode", "rect"}]}.
+
+    Ошибка в раскладке не должна оставлять киоск с чёрным экраном: в этом
+    случае используется раскладка по умолчанию.
+    """
+    default = [{"screen": 0, "zones": [{"name": None, "mode": default_mode, "rect": (0.0, 0.0, 1.0, 1.0)}]}]
+    if not value:
+        return default
+    try:
+        windows = []
+        for window_index, window in enumerate(_parse(value)):
+            zones = []
+            for zone_index, zone in enumerate(window["zones"]):
+                mode = zone.get("mode", default_mode)
+                if mode not in ZONE_MODES:
+                    raise ValueError(f"неизвестный режим зоны {mode}")
+                x, y, width, height = (float(item) for item in zone.get("rect", (0, 0, 1, 1)))
+                if not (0 <= x < 1 and 0 <= y < 1 and 0 < width <= 1 - x + 1e-9 and 0 < height <= 1 - y + 1e-9):
+                    raise ValueError(f"зона {zone_index} окна {window_index} выходит за пределы окна")
+                zones.append({"name": str(zone.get("name") or f"{window_index}-{zone_index}"),
+                              "mode": mode, "rect": (x, y, width, height)})
+            if not zones:
+                raise ValueError(f"в окне {window_index} нет зон")
+            windows.append({"screen": int(window.get("screen", window_index)), "zones": zones})
+        if not windows:
+            raise ValueError("нет ни одного окна")
+        return windows
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error(f"Некорректная раскладка DISPLAY_LAYOUT, используется одно окно {default_mode}: {e}")
+        return default
+
+
+def zone_slot(zone: dict, table: str) -> Optional[str]:
+    """Ключ зоны в индексе кэша (последнее видео, закреплённые слайды); None — общий ключ таблицы"""
+    return f"{table}@{zone['name']}" if zone["name"] else None
@@ -0,0 +1,309 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from config import MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES, logger
+from database.media import file_sha256
+
+
+class MediaCache:
+    """
+    Постоянный дисковый кэш медиа, адресуемый по содержимому.
+    
+    Файлы хранятся под именем sha256 содержимого, записи индекса связывают
+    "таблица:id" с хэшем. Индекс сохраняется в index.json, поэтому после
+    перезагрузки киоска уже скачанное видео не качается повторно. При
+    превышении max_bytes удаляются давно не использованные записи (LRU);
+    последняя показанная запись каждой таблицы и закреплённые записи не
+    вытесняются.
+    
+    Запись файлов, подсчёт sha256 и fsync выполняются в пуле потоков, чтобы
+    загрузка большого видео не останавливала цикл событий (и UI).
+    """
+    INDEX_FILE = "index.json"
+
+    def __init__(self, root: str = MEDIA_CACHE_DIR, max_bytes: int = MEDIA_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+        self.entries: Dict[str, dict] = {}
+        self.latest_keys: Dict[str, str] = {}
+        self.pinned_keys: Dict[str, List[str]] = {}
+        self._index_lock = threading.Lock()
+        self._index_version = 0
+        self._index_written = 0
+        self._stores: Dict[str, asyncio.Future] = {}
+        self._load_index()
+
+    @staticmethod
+    def _key(table: str, media_id: int) -> str:
+        return f"{table}:{media_id}"
+
+    def _path(self, entry: dict) -> str:
+        return os.path.join(self.root, entry["file"])
+
+    def _load_index(self) -> None:
+        index_path = os.path.join(self.root, self.INDEX_FILE)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as file:
+                index = json.load(file)
+            self.entries = index.get("entries", {})
+            self.latest_keys = index.get("latest", {})
+            self.pinned_keys = index.get("pinned", {})
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Индекс кэша повреждён, кэш начинается с нуля: {e}")
+            self.entries, self.latest_keys, self.pinned_keys = {}, {}, {}
+
+        # Записи без файла (например, удалённого вручную) выбрасываем
+        self.entries = {key: entry for key, entry in self.entries.items()
+                        if os.path.exists(self._path(entry))}
+        self.latest_keys = {table: key for table, key in self.latest_keys.items()
+                            if key in self.entries}
+        self.pinned_keys = {table: [key for key in keys if key in self.entries]
+                            for table, keys in self.pinned_keys.items()}
+
+    def _snapshot_index(self) -> Tuple[int, str]:
+        """Снимок индекса в цикле событий (дальше его можно писать из другого потока)"""
+        self._index_version += 1
+        data = json.dumps({"entries": self.entries, "latest": self.latest_keys, "pinned": self.pinned_keys})
+        return self._index_version, data
+
+    def _write_index(self, version: int, data: str) -> None:
+        """Атомарная запись индекса: сбой посреди записи не портит старый индекс"""
+        index_path = os.path.join(self.root, self.INDEX_FILE)
+        tmp_path = f"{index_path}.tmp"
+        with self._index_lock:
+            # Более новый снимок уже записан другим потоком
+            if version <= self._index_written:
+                return
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as file:
+                    file.write(data)
+                    file.flush()
+                    os.fsync(file.fileno())
+                os.replace(tmp_path, index_path)
+                self._index_written = version
+            except OSError as e:
+                logger.error(f"Не удалось сохранить индекс кэша: {e}")
+
+    def _save_index(self) -> None:
+        self._write_index(*self._snapshot_index())
+
+    async def _save_index_async(self) -> None:
+        await asyncio.to_thread(self._write_index, *self._snapshot_index())
+
+    def _schedule_save(self) -> None:
+        """Сохранение индекса в фоне, если вызвано из цикла событий, иначе сразу"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._save_index()
+            return
+        asyncio.ensure_future(self._save_index_async())
+
+    def get(self, table: str, media_id: int) -> Optional[str]:
+        """Путь к файлу медиа в кэше или None"""
+        entry = self.entries.get(self._key(table, media_id))
+        if not entry:
+            return None
+        if not os.path.exists(self._path(entry)):
+            self.entries.pop(self._key(table, media_id))
+            self._schedule_save()
+            return None
+        # last_used сохраняется вместе со следующим изменением индекса:
+        # fsync на каждое чтение из кэша слишком дорог для цикла событий
+        entry["last_used"] = time.time()
+        return self._path(entry)
+
+    def get_sha256(self, table: str, media_id: int) -> Optional[str]:
+        entry = self.entries.get(self._key(table, media_id))
+        return entry["sha256"] if entry else None
+
+    def latest(self, table: str, slot: Optional[str] = None) -> Optional[Tuple[int, str]]:
+        """
+        ID и путь последнего показанного медиа таблицы (переживает перезапуск).
+        slot — отдельный ключ для зоны экрана, если зон с этой таблицей несколько.
+        """
+        key = self.latest_keys.get(slot or table)
+        if not key:
+            return None
+        media_id = int(key.split(":", 1)[1])
+        path = self.get(table, media_id)
+        return (media_id, path) if path else None
+
+    def set_latest(self, table: str, media_id: int, slot: Optional[str] = None) -> None:
+        key = self._key(table, media_id)
+        if key in self.entries:
+            self.latest_keys[slot or table] = key
+            self._schedule_save()
+
+    def pin(self, table: str, media_ids: List[int], slot: Optional[str] = None) -> None:
+        """Закрепление набора записей таблицы (например, слайдов в ротации) от вытеснения"""
+        self.pinned_keys[slot or table] = [self._key(table, media_id) for media_id in media_ids
+                                           if self._key(table, media_id) in self.entries]
+        self._schedule_save()
+
+    def pinned(self, table: str, slot: Optional[str] = None) -> List[Tuple[int, str]]:
+        """ID и пути закреплённых записей таблицы, которые есть на диске"""
+        result = []
+        for key in self.pinned_keys.get(slot or table, []):
+            media_id = int(key.split(":", 1)[1])
+            path = self.get(table, media_id)
+            if path:
+                result.append((media_id, path))
+        return result
+
+    async def store(self, table: str, media_id: int, chunks: AsyncIterator[bytes],
+                    suffix: str = "", expected_sha256: Optional[str] = None) -> Optional[str]:
+        """
+        Сохраняет поток чанков в кэш, считая sha256 на лету.
+        
+        Каждый чанк пишется в пуле потоков, пока следующий читается из
+        источника, так что сеть/БД и диск работают параллельно, а в памяти
+        одновременно не больше двух чанков.
+        
+        Returns:
+            Путь к файлу в кэше или None в случае ошибки (в т.ч. несовпадения хэша)
+        """
+        return await self.once(table, media_id,
+                               lambda: self._store(table, media_id, chunks, suffix, expected_sha256))
+
+    async def once(self, table: str, media_id: int, factory: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """
+        Одна загрузка записи на процесс: если её уже качают (например,
+        предзагрузка по расписанию), ждём ту же загрузку, а не начинаем вторую.
+        """
+        key = self._key(table, media_id)
+        if key not in self._stores:
+            future = asyncio.ensure_future(factory())
+            self._stores[key] = future
+            future.add_done_callback(lambda _: self._stores.pop(key, None))
+        return await asyncio.shield(self._stores[key])
+
+    async def _store(self, table: str, media_id: int, chunks: AsyncIterator[bytes],
+                     suffix: str, expected_sha256: Optional[str]) -> Optional[str]:
+        part_path = os.path.join(self.root, f"{table}-{media_id}.part")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(part_path, 'wb') as file:
+                pending = None
+                try:
+                    async for chunk in chunks:
+                        if pending is not None:
+                            await pending
+                        pending = asyncio.ensure_future(asyncio.to_thread(self._write_chunk, file, digest, chunk))
+                        size += len(chunk)
+                finally:
+                    # Файл нельзя закрывать, пока в него пишет поток
+                    if pending is not None:
+                        await pending
+                if size == 0:
+                    raise ValueError("получены пустые данные")
+                await asyncio.to_thread(os.fsync, file.fileno())
+
+            sha256 = digest.hexdigest()
+            if expected_sha256 and sha256 != expected_sha256:
+                raise ValueError(f"sha256 не совпадает: {sha256} != {expected_sha256}")
+
+            file_name = f"{sha256}{suffix}"
+            if os.path.exists(os.path.join(self.root, file_name)):
+                # То же содержимое уже есть под другим id — переиспользуем файл
+                os.remove(part_path)
+            else:
+                os.replace(part_path, os.path.join(self.root, file_name))
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении {table} id={media_id} в кэш: {e}")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            return None
+
+        entry = {"file": file_name, "sha256": sha256, "size": size, "last_used": time.time()}
+        key = self._key(table, media_id)
+        self.entries[key] = entry
+        self._evict(keep=key)
+        await self._save_index_async()
+        return self._path(entry)
+
+    def download_path(self, table: str, media_id: int) -> str:
+        """Куда качать запись по частям (рядом лежат .part/.state для докачки)"""
+        return os.path.join(self.root, f"{table}-{media_id}.download")
+
+    async def store_file(self, table: str, media_id: int, path: str,
+                         sha256: Optional[str] = None, suffix: str = "") -> Optional[str]:
+        """
+        Переносит уже скачанный и проверенный файл в кэш.
+        
+        Returns:
+            Путь к файлу в кэше или None в случае ошибки
+        """
+        try:
+            if not sha256:
+                sha256 = await asyncio.to_thread(file_sha256, path)
+            size = os.path.getsize(path)
+            file_name = f"{sha256}{suffix}"
+            if os.path.exists(os.path.join(self.root, file_name)):
+                os.remove(path)
+            else:
+                os.replace(path, os.path.join(self.root, file_name))
+        except OSError as e:
+            logger.error(f"Ошибка при переносе {table} id={media_id} в кэш: {e}")
+            return None
+
+        entry = {"file": file_name, "sha256": sha256, "size": size, "last_used": time.time()}
+        key = self._key(table, media_id)
+        self.entries[key] = entry
+        self._evict(keep=key)
+        await self._save_index_async()
+        return self._path(entry)
+
+    @staticmethod
+    def _write_chunk(file, digest, chunk: bytes) -> None:
+        # hashlib и запись в файл отпускают GIL на больших буферах
+        file.write(chunk)
+        digest.update(chunk)
+
+    def total_size(self) -> int:
+        """Размер кэша на диске (файлы с одинаковым содержимым считаются один раз)"""
+        return sum({entry["file"]: entry["size"] for entry in self.entries.values()}.values())
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """
+        Вытеснение давно не использованных записей сверх max_bytes.
+
+        keep — только что сохранённая запись: она не вытесняется, даже если
+        одна не помещается в max_bytes (иначе вызывающий вернул бы путь к
+        удалённому файлу).
+        """
+        pinned = set(self.latest_keys.values())
+        pinned.update(key for keys in self.pinned_keys.values() for key in keys)
+        if keep is not None:
+            pinned.add(keep)
+        candidates = sorted(
+            (key for key in self.entries if key not in pinned),
+            key=lambda key: self.entries[key]["last_used"]
+        )
+        # Файлы с одинаковым содержимым занимают место один раз
+        users = {}
+        for entry in self.entries.values():
+            users[entry["file"]] = users.get(entry["file"], 0) + 1
+        total = self.total_size()
+        for key in candidates:
+            if total <= self.max_bytes:
+                break
+            entry = self.entries.pop(key)
+            users[entry["file"]] -= 1
+            if not users[entry["file"]]:
+                total -= entry["size"]
+                try:
+                    os.remove(self._path(entry))
+                except OSError as e:
+                    logger.error(f"Не удалось удалить файл кэша {entry['file']}: {e}")
+        if total > self.max_bytes:
+            logger.warning(f"Кэш медиа занимает {total} байт при лимите {self.max_bytes}: "
+                           f"оставшиеся записи закреплены или только что сохранены")
@@ -0,0 +1,186 @@
+import time
+from typing import Optional
+from PyQt6.QtCore import QUrl, pyqtSignal
+from PyQt6.QtWidgets import QStackedWidget, QSizePolicy
+from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
+from PyQt6.QtMultimediaWidgets import QVideoWidget
+from config import PLAYER_PRELOAD
+from metrics import REGISTRY
+
+
+class _PlayerSlot:
+    """Плеер, аудиовыход и видеовиджет одного буфера"""
+
+    def __init__(self, parent):
+        self.video_widget = QVideoWidget()
+        self.video_widget.setSizePolicy(
+            QSizePolicy.Policy.Expanding,
+            QSizePolicy.Policy.Expanding
+        )
+        self.media_player = QMediaPlayer(parent)
+        self.audio_output = QAudioOutput(parent)
+        self.audio_output.setVolume(0.0)
+
+        # Настройка медиаплеера: зацикливание средствами самого плеера, без опроса позиции
+        self.media_player.setPlaybackRate(1.0)
+        self.media_player.setLoops(QMediaPlayer.Loops.Infinite)
+        self.media_player.setAudioOutput(self.audio_output)
+        self.media_player.setVideoOutput(self.video_widget)
+
+        self._frame_handler = None
+
+    def watch_first_frame(self, handler) -> None:
+        """
+        Подписка на кадры до первого кадра нового видео. Сигнал кадра
+        приходит 25-60 раз в секунду, поэтому Python-обработчик подключён
+        только к готовящемуся плееру и отключается после подмены.
+        """
+        self.unwatch_frames()
+        self._frame_handler = lambda frame: handler(self)
+        self.video_widget.videoSink().videoFrameChanged.connect(self._frame_handler)
+
+    def unwatch_frames(self) -> None:
+        if self._frame_handler is not None:
+            try:
+                self.video_widget.videoSink().videoFrameChanged.disconnect(self._frame_handler)
+            except TypeError:
+                pass
+            self._frame_handler = None
+
+    def release(self):
+        self.unwatch_frames()
+        self.media_player.stop()
+        self.media_player.setSource(QUrl())
+
+
+class DoubleBufferedPlayer(QStackedWidget):
+    """
+    Видеоплеер с двойной буферизацией.
+    
+    Новое видео готовится во втором (скрытом) плеере и показывается только
+    после появления его первого кадра, поэтому при смене контента нет
+    чёрного экрана. Без preload используется один плеер (stop + setSource).
+    
+    Сигналы:
+        swapped(ttff_ms, gap_ms): новое видео на экране; время от load() до
+            первого кадра и пауза между последним кадром старого и первым кадром нового
+        failed(message): ошибка загрузки или воспроизведения
+    """
+    swapped = pyqtSignal(float, float)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, preload: bool = PLAYER_PRELOAD):
+        super().__init__(parent)
+        self.preload = preload
+        self.current_path: Optional[str] = None
+        self._slots = []
+        self._create_slots()
+        self._load_started_at = 0.0
+        self._gap_started_at: Optional[float] = None
+
+    def _create_slots(self) -> None:
+        self._slots = [_PlayerSlot(self)] + ([_PlayerSlot(self)] if self.preload else [])
+        for slot in self._slots:
+            self.addWidget(slot.video_widget)
+            slot.media_player.mediaStatusChanged.connect(
+                lambda status, slot=slot: self._on_media_status_changed(slot, status)
+            )
+            slot.media_player.errorOccurred.connect(self._on_error)
+        self._front = self._slots[0]
+        self._pending: Optional[_PlayerSlot] = None
+
+    @property
+    def media_player(self) -> QMediaPlayer:
+        """Плеер, который сейчас на экране"""
+        return self._front.media_player
+
+    @property
+    def position(self) -> int:
+        """Позиция воспроизведения на экране, мс (сторож сравнивает её между проверками)"""
+        return self._front.media_player.position()
+
+    @property
+    def loading_since(self) -> Optional[float]:
+        """Время начала загрузки, если новое видео ещё не показано"""
+        return self._load_started_at if self._pending is not None else None
+
+    def load(self, path: str) -> None:
+        """Подготовка и показ нового видео"""
+        self.current_path = path
+        self._load_started_at = time.perf_counter()
+        showing = self._front.media_player.source().isValid()
+        if self.preload and showing:
+            back = self._slots[1] if self._front is self._slots[0] else self._slots[0]
+            # Старое видео играет до первого кадра нового: паузы нет
+            self._gap_started_at = None
+        else:
+            back = self._front
+            back.media_player.stop()
+            self._gap_started_at = self._load_started_at if showing else None
+        if self._pending is not None and self._pending is not back:
+            self._pending.unwatch_frames()
+        self._pending = back
+        back.watch_first_frame(self._on_first_frame)
+        back.media_player.setSource(QUrl.fromLocalFile(path))
+
+    def _on_media_status_changed(self, slot: _PlayerSlot, status):
+        if status == QMediaPlayer.MediaStatus.LoadedMedia:
+            if slot is self._pending:
+                REGISTRY.histogram("player_load_seconds", "Время от load() до LoadedMedia").observe(
+                    time.perf_counter() - self._load_started_at
+                )
+            # Фоновый плеер начинает играть скрыто; на экран он попадёт с первым кадром
+            slot.media_player.play()
+        elif status == QMediaPlayer.MediaStatus.StalledMedia:
+            REGISTRY.counter("player_stalls_total", "Остановки воспроизведения из-за нехватки данных").inc()
+        elif status == QMediaPlayer.MediaStatus.InvalidMedia:
+            if slot is self._pending:
+                slot.unwatch_frames()
+                self._pending = None
+            REGISTRY.counter("player_errors_total", "Ошибки плеера", kind="invalid_media").inc()
+            self.failed.emit("Неверный медиафайл")
+
+    def _on_error(self, error, error_string: str):
+        REGISTRY.counter("player_errors_total", "Ошибки плеера", kind=error.name).inc()
+        self.failed.emit(f"{error}: {error_string}")
+
+    def _on_first_frame(self, slot: _PlayerSlot):
+        slot.unwatch_frames()
+        if slot is not self._pending:
+            return
+        now = time.perf_counter()
+        old = self._front
+        gap = (now - self._gap_started_at) * 1000 if self._gap_started_at is not None else 0.0
+        self.setCurrentWidget(slot.video_widget)
+        self._front = slot
+        self._pending = None
+        if old is not slot:
+            old.release()
+        REGISTRY.histogram("player_first_frame_seconds", "Время от load() до первого кадра").observe(
+            now - self._load_started_at
+        )
+        REGISTRY.histogram("player_swap_gap_seconds", "Пауза между кадрами старого и нового видео").observe(gap / 1000)
+        self.swapped.emit((now - self._load_started_at) * 1000, gap)
+
+    def rebuild(self, reason: str) -> None:
+        """
+        Пересоздание плееров и видеовиджетов с повторной загрузкой текущего
+        видео. Сбрасывает состояние декодера и освобождает память, которую
+        удерживают (или теряют) старые экземпляры QMediaPlayer.
+        """
+        REGISTRY.counter("player_rebuilds_total", "Пересоздания плеера", reason=reason).inc()
+        self.release()
+        for slot in self._slots:
+            self.removeWidget(slot.video_widget)
+            slot.video_widget.deleteLater()
+            slot.media_player.deleteLater()
+            slot.audio_output.deleteLater()
+        self._create_slots()
+        if self.current_path:
+            self.load(self.current_path)
+
+    def release(self):
+        """Остановка всех плееров и отключение вывода"""
+        for slot in self._slots:
+            slot.release()
+            slot.media_player.setVideoOutput(None)
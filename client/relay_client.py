@@ -0,0 +1,279 @@
+"""
+Клиент relay-сервера медиа (server/relay.py).
+
+Функции повторяют сигнатуры одноимённых функций из functions.py, поэтому
+дисплей может брать контент из relay вместо БД без изменения остального
+кода.
+RelayListener — замена database.listener.MediaListener на основе long
+polling.
+"""
+import os
+import json
+import asyncio
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlencode
+from database.media import MEDIA_TABLES, file_sha256
+from database.health import Backoff
+from config import (MEDIA_RELAY_URL, MEDIA_CHUNK_SIZE, MEDIA_DOWNLOAD_CONNECTIONS, RELAY_LONG_POLL,
+                    RELAY_READ_TIMEOUT, logger)
+
+
+async def _request(path: str, headers: Optional[dict] = None, timeout: float = RELAY_READ_TIMEOUT
+                   ) -> Tuple[int, Dict[str, str], asyncio.StreamReader, asyncio.StreamWriter]:
+    """
+    GET-запрос к relay; возвращает статус, заголовки и открытый поток с телом.
+
+    timeout ограничивает подключение и чтение заголовков целиком; тело
+    читается через _read_body/_read_chunk со своими пределами.
+    """
+    url = urlsplit(MEDIA_RELAY_URL)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(url.hostname, url.port or 80), timeout=timeout
+    )
+    request_headers = {"Host": url.netloc, "Connection": "close"}
+    request_headers.update(headers or {})
+    request = f"GET {url.path.rstrip('/')}{path} HTTP/1.1\r\n"
+    request += "".join(f"{name}: {value}\r\n" for name, value in request_headers.items())
+    writer.write((request + "\r\n").encode("latin-1"))
+
+    async def read_head() -> Tuple[int, Dict[str, str]]:
+        await writer.drain()
+        status_line = await reader.readline()
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        return int(status_line.split()[1]), response_headers
+
+    try:
+        status, response_headers = await asyncio.wait_for(read_head(), timeout=timeout)
+    except BaseException:
+        await _close(writer)
+        raise
+    return status, response_headers, reader, writer
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> bytes:
+    """Небольшое тело ответа (JSON) целиком, не дольше RELAY_READ_TIMEOUT"""
+    return await asyncio.wait_for(reader.readexactly(int(headers.get("content-length", 0))),
+                                  timeout=RELAY_READ_TIMEOUT)
+
+
+async def _read_chunk(reader: asyncio.StreamReader, remaining: int) -> bytes:
+    """Очередной блок файла; relay, переставший отдавать данные, считается обрывом"""
+    try:
+        return await asyncio.wait_for(reader.read(min(MEDIA_CHUNK_SIZE, remaining)), timeout=RELAY_READ_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ConnectionError(f"Relay не отдаёт данные {RELAY_READ_TIMEOUT:.0f} с, осталось {remaining} байт")
+
+
+async def _close(writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except Exception:
+        pass
+
+
+async def get_latest_media_meta(table: str, known_id: Optional[int] = None,
+                                known_sha256: Optional[str] = None, wait: float = 0) -> Optional[dict]:
+    """
+    Метаданные самой новой записи через relay (см. functions.get_latest_media_meta).
+
+    Args:
+        wait: Сколько секунд relay может держать запрос в ожидании изменения
+
+    Returns:
+        Словарь метаданных, пустой словарь, если новее ничего нет, или None в случае ошибки
+    """
+    query = {key: value for key, value in
+             (("known_id", known_id), ("known_sha256", known_sha256), ("wait", wait)) if value}
+    try:
+        status, headers, reader, writer = await _request(
+            f"/media/{table}/latest?{urlencode(query)}", timeout=wait + 30
+        )
+        try:
+            if status == 204:
+                return {}
+            body = await _read_body(reader, headers)
+            if status != 200:
+                logger.error(f"Relay вернул {status}: {body.decode('utf-8', 'replace')}")
+                return None
+            return json.loads(body)
+        finally:
+            await _close(writer)
+    except Exception as e:
+        logger.error(f"Ошибка запроса к relay: {e}")
+        return None
+
+
+async def _get_json(path: str):
+    """GET с JSON-ответом; None в случае ошибки"""
+    try:
+        status, headers, reader, writer = await _request(path)
+        try:
+            body = await _read_body(reader, headers)
+            if status != 200:
+                logger.error(f"Relay вернул {status}: {body.decode('utf-8', 'replace')}")
+                return None
+            return json.loads(body)
+        finally:
+            await _close(writer)
+    except Exception as e:
+        logger.error(f"Ошибка запроса к relay: {e}")
+        return None
+
+
+async def get_best_rendition(table: str, media_id: int, width: int, height: int) -> Optional[dict]:
+    """Метаданные версии под экран через relay (см. functions.get_best_rendition)"""
+    return await _get_json(f"/media/{table}/{media_id}/best?{urlencode({'width': width, 'height': height})}")
+
+
+async def get_recent_media_meta(table: str, limit: int) -> Optional[List[dict]]:
+    """Метаданные последних записей через relay (см. functions.get_recent_media_meta)"""
+    return await _get_json(f"/media/{table}/recent?{urlencode({'limit': limit})}")
+
+
+async def get_media_meta(table: str, media_id: int) -> Optional[dict]:
+    """Метаданные записи через relay (см. functions.get_media_meta)"""
+    return await _get_json(f"/media/{table}/{media_id}/meta")
+
+
+async def get_schedule_items() -> Optional[List[dict]]:
+    """Расписание показа через relay (см. functions.get_schedule_items)"""
+    return await _get_json("/schedule")
+
+
+async def stream_media(table: str, media_id: int, offset: int = 0) -> AsyncIterator[bytes]:
+    """
+    Потоково читает содержимое записи из relay (см. functions.stream_media).
+
+    Args:
+        offset: С какого байта начинать (докачка через Range)
+    """
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    status, response_headers, reader, writer = await _request(f"/media/{table}/{media_id}", headers)
+    try:
+        if status not in (200, 206):
+            raise ConnectionError(f"Relay вернул {status} для {table} id={media_id}")
+        remaining = int(response_headers.get("content-length", 0))
+        while remaining > 0:
+            chunk = await _read_chunk(reader, remaining)
+            if not chunk:
+                raise ConnectionError(f"Соединение с relay оборвалось, осталось {remaining} байт")
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await _close(writer)
+
+
+async def download_media_ranges(table: str, media_id: int, path: str,
+                                connections: int = MEDIA_DOWNLOAD_CONNECTIONS) -> Optional[int]:
+    """
+    Скачивание записи из relay с докачкой (см. functions.download_media_ranges).
+
+    Relay отдаёт файл с локального диска одним потоком, поэтому connections
+    не используется: после обрыва запрос повторяется с Range от конца
+    path + '.part', а If-Range по ETag гарантирует, что докачивается то же
+    содержимое. Готовый файл сверяется с ETag (sha256).
+
+    Returns:
+        Число байт или None в случае ошибки (недокачанный файл остаётся для продолжения)
+    """
+    part_path = f"{path}.part"
+    etag_path = f"{path}.etag"
+    backoff = Backoff(base=1)
+    for attempt in range(1, 4):
+        try:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            etag = None
+            if offset and os.path.exists(etag_path):
+                with open(etag_path, 'r', encoding='utf-8') as file:
+                    etag = file.read().strip()
+            headers = {"Range": f"bytes={offset}-", "If-Range": etag} if offset and etag else {}
+            status, response_headers, reader, writer = await _request(f"/media/{table}/{media_id}", headers)
+            try:
+                if status == 416 and etag:
+                    # .part уже скачан целиком — осталось проверить
+                    pass
+                elif status not in (200, 206):
+                    raise ConnectionError(f"Relay вернул {status} для {table} id={media_id}")
+                else:
+                    etag = response_headers.get("etag", "")
+                    with open(etag_path, 'w', encoding='utf-8') as file:
+                        file.write(etag)
+                    # 200 вместо 206 — содержимое сменилось, начинаем заново
+                    with open(part_path, 'ab' if status == 206 else 'wb') as file:
+                        remaining = int(response_headers.get("content-length", 0))
+                        while remaining > 0:
+                            chunk = await _read_chunk(reader, remaining)
+                            if not chunk:
+                                raise ConnectionError(f"Соединение с relay оборвалось, осталось {remaining} байт")
+                            await asyncio.to_thread(file.write, chunk)
+                            remaining -= len(chunk)
+            finally:
+                await _close(writer)
+
+            digest = await asyncio.to_thread(file_sha256, part_path)
+            if etag and digest != etag.strip('"'):
+                os.remove(part_path)
+                raise ValueError("sha256 файла не совпадает с ETag")
+            size = os.path.getsize(part_path)
+            os.replace(part_path, path)
+            os.remove(etag_path)
+            return size
+        except (ConnectionError, ValueError, OSError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка скачивания {table} id={media_id} из relay, попытка {attempt}: {e}")
+            await asyncio.sleep(backoff.next())
+    return None
+
+
+class RelayListener:
+    """
+    Уведомления о новом контенте через long polling relay.
+
+    Интерфейс совпадает с database.listener.MediaListener: callback
+    получает {"table", "id"} или None после (пере)подключения.
+    """
+
+    def __init__(self, callback: Callable[[Optional[dict]], None], wait: int = RELAY_LONG_POLL):
+        self.callback = callback
+        self.wait = wait
+        self._tasks = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._run(table)) for table in MEDIA_TABLES]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, table: str) -> None:
+        known: Optional[dict] = None
+        # Киоски здания не должны переподключаться к relay одновременно
+        backoff = Backoff(base=1)
+        while True:
+            meta = await get_latest_media_meta(
+                table, known and known["id"], known and known["sha256"],
+                wait=self.wait if known else 0
+            )
+            if meta is None:
+                known = None
+                await asyncio.sleep(backoff.next())
+                continue
+            backoff.reset()
+            if meta:
+                payload = {"table": table, "id": meta["id"]} if known else None
+                known = meta
+                try:
+                    self.callback(payload)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика уведомления: {e}")
+            elif known is None:
+                known = {"id": None, "sha256": None}
@@ -0,0 +1,149 @@
+"""
+Расписание показа (звонки, перемены, утро до уроков).
+
+Элементы расписания из таблицы schedule_items разворачиваются в недельную
+временную шкалу: отсортированный список границ, на каждом отрезке между
+которыми активен ровно один элемент (с наибольшим приоритетом) или ни
+одного. Поиск активного элемента — бинарный поиск по границам, а для
+смены контента взводится один таймер на ближайшую границу вместо
+периодического опроса БД.
+"""
+import bisect
+from datetime import datetime, time, timedelta
+from typing import Callable, List, Optional, Tuple, Union
+from PyQt6.QtCore import Qt, QTimer
+from config import SCHEDULE_PREFETCH_SECONDS, logger
+
+DAY = 24 * 60 * 60
+WEEK = 7 * DAY
+
+
+def _seconds(value: Union[time, str]) -> int:
+    """Секунды от полуночи для time или строки 'ЧЧ:ММ[:СС]' (ответ relay)"""
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+class Timeline:
+    """Недельная шкала расписания с поиском активного элемента за O(log n)"""
+
+    def __init__(self, items: List[dict]):
+        intervals = []
+        for item in items:
+            start = _seconds(item["start_time"])
+            duration = (_seconds(item["end_time"]) - start) % DAY or DAY
+            for weekday in range(7):
+                if item["weekdays"] & (1 << weekday):
+                    begin = weekday * DAY + start
+                    end = begin + duration
+                    # Окно воскресенья, уходящее за полночь, продолжается в понедельник
+                    if end > WEEK:
+                        intervals.append((begin, WEEK, item))
+                        intervals.append((0, end - WEEK, item))
+                    else:
+                        intervals.append((begin, end, item))
+
+        bounds = sorted({0, *(begin for begin, _, _ in intervals), *(end for _, end, _ in intervals)} - {WEEK})
+        self.starts: List[int] = []
+        self.items: List[Optional[dict]] = []
+        for index, begin in enumerate(bounds):
+            end = bounds[index + 1] if index + 1 < len(bounds) else WEEK
+            covering = [item for item_begin, item_end, item in intervals if item_begin <= begin and end <= item_end]
+            active = max(covering, key=lambda item: (item["priority"], item["id"])) if covering else None
+            # Соседние отрезки с одним и тем же элементом склеиваем
+            if self.items and self.items[-1] is active:
+                continue
+            self.starts.append(begin)
+            self.items.append(active)
+
+    def at(self, moment: datetime) -> Tuple[Optional[dict], datetime]:
+        """Активный элемент в момент moment и время следующей смены"""
+        week_start = (moment - timedelta(days=moment.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+        offset = int((moment - week_start).total_seconds())
+        index = bisect.bisect_right(self.starts, offset) - 1
+        if index + 1 < len(self.starts):
+            next_offset = self.starts[index + 1]
+        elif len(self.starts) > 1 and self.items[0] is self.items[index]:
+            # Последний отрезок недели продолжается в первом отрезке следующей
+            next_offset = WEEK + self.starts[1]
+        else:
+            next_offset = WEEK
+        return self.items[index], week_start + timedelta(seconds=next_offset)
+
+
+class ScheduleEngine:
+    """
+    Переключение контента по расписанию.
+
+    on_change(item) вызывается при смене активного элемента (None — по
+    расписанию ничего нет, показывается контент по умолчанию).
+    on_prefetch(item) вызывается за prefetch_seconds до начала слота, чтобы
+    медиа успело скачаться и переключение было мгновенным.
+    """
+
+    def __init__(self, on_change: Callable[[Optional[dict]], None], on_prefetch: Callable[[dict], None],
+                 media_table: Optional[str] = None, prefetch_seconds: int = SCHEDULE_PREFETCH_SECONDS):
+        self.on_change = on_change
+        self.on_prefetch = on_prefetch
+        self.media_table = media_table
+        self.prefetch_seconds = prefetch_seconds
+        self.timeline: Optional[Timeline] = None
+        self.current: Optional[dict] = None
+
+        # PreciseTimer: у грубого таймера по умолчанию погрешность до 5% интервала
+        self._transition_timer = QTimer()
+        self._transition_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._transition_timer.setSingleShot(True)
+        self._transition_timer.timeout.connect(self._on_transition)
+        self._prefetch_timer = QTimer()
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.timeout.connect(self._on_prefetch)
+        self._upcoming: Optional[dict] = None
+
+    def set_items(self, items: List[dict]) -> None:
+        """Новое расписание: перестраиваем шкалу и перевзводим таймеры"""
+        if self.media_table:
+            items = [item for item in items if item["media_table"] == self.media_table]
+        self.timeline = Timeline(items) if items else None
+        self._on_transition()
+
+    def _key(self, item: Optional[dict]):
+        return (item["media_table"], item["media_id"]) if item else None
+
+    def _on_transition(self) -> None:
+        self._transition_timer.stop()
+        self._prefetch_timer.stop()
+        if self.timeline is None:
+            self._set_current(None)
+            return
+
+        now = datetime.now()
+        item, next_at = self.timeline.at(now)
+        self._set_current(item)
+
+        # Один таймер на ближайшую границу; сработав чуть раньше, он просто перевзведётся
+        self._transition_timer.start(max(int((next_at - now).total_seconds() * 1000), 0) + 1)
+
+        upcoming, _ = self.timeline.at(next_at)
+        if upcoming is not None and self._key(upcoming) != self._key(item):
+            self._upcoming = upcoming
+            lead_ms = int((next_at - now).total_seconds() - self.prefetch_seconds) * 1000
+            self._prefetch_timer.start(max(lead_ms, 0))
+        title = (item.get("title") or f"#{item['id']}") if item else "по умолчанию"
+        logger.info(f"Расписание: активно {title}, следующая смена {next_at:%a %H:%M:%S}")
+
+    def _set_current(self, item: Optional[dict]) -> None:
+        if self._key(item) != self._key(self.current):
+            self.current = item
+            self.on_change(item)
+        else:
+            self.current = item
+
+    def _on_prefetch(self) -> None:
+        if self._upcoming is not None:
+            self.on_prefetch(self._upcoming)
+
+    def stop(self) -> None:
+        self._transition_timer.stop()
+        self._prefetch_timer.stop()
@@ -0,0 +1,174 @@
+import asyncio
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QImage, QImageIOHandler, QImageReader, QPixmap
+from PyQt6.QtWidgets import QLabel, QSizePolicy
+from config import SLIDESHOW_INTERVAL, SLIDESHOW_CACHE_SIZE, SLIDESHOW_DECODE_WORKERS, logger
+
+
+def decode_scaled(path: str, width: int, height: int) -> Optional[QImage]:
+    """
+    Декодирование изображения сразу в размер экрана (выполняется в пуле потоков).
+
+    Масштабирование задаётся декодеру через setScaledSize, поэтому JPEG
+    12+ Мп не разворачивается в памяти в полном размере.
+    """
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    size = reader.size()
+    if size.isValid():
+        # Поворот по EXIF применяется после масштабирования — учитываем его заранее
+        rotated = bool(reader.transformation() & QImageIOHandler.Transformation.TransformationRotate90)
+        if rotated:
+            size.transpose()
+        scaled = size.scaled(width, height, Qt.AspectRatioMode.KeepAspectRatio)
+        if rotated:
+            scaled.transpose()
+        reader.setScaledSize(scaled)
+    image = reader.read()
+    if image.isNull():
+        logger.error(f"Не удалось декодировать изображение {path}: {reader.errorString()}")
+        return None
+    # Формат, который рисуется без дополнительных преобразований
+    return image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+
+
+class ImageSlideshow(QLabel):
+    """
+    Слайд-шоу изображений.
+
+    Следующие слайды заранее декодируются и масштабируются под экран в пуле
+    потоков и хранятся в ограниченном кэше готовых кадров (не больше
+    cache_size). Смена слайда в цикле событий — только показ готового
+    кадра; если кадр ещё не готов, текущий слайд остаётся на экране.
+
+    Зоны одного размера с одними и теми же слайдами не декодируют их
+    повторно: кадр берётся у соседней зоны (QImage разделяет пиксели
+    между копиями).
+    """
+    _instances: "weakref.WeakSet[ImageSlideshow]" = weakref.WeakSet()
+
+    def __init__(self, parent=None, interval: int = SLIDESHOW_INTERVAL,
+                 cache_size: int = SLIDESHOW_CACHE_SIZE, workers: int = SLIDESHOW_DECODE_WORKERS):
+        super().__init__(parent)
+        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.setStyleSheet("background-color: black;")
+        self.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+
+        self.cache_size = max(cache_size, 2)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slideshow")
+        self._frames: "OrderedDict[str, QImage]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._paths: List[str] = []
+        self._index = -1
+        self._current_path: Optional[str] = None
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.show_next)
+        self._timer.start(interval * 1000)
+        ImageSlideshow._instances.add(self)
+
+    def _target_size(self):
+        return self.size() * self.devicePixelRatio()
+
+    def set_images(self, paths: List[str]) -> None:
+        """Новый список слайдов (от новых к старым); показ начинается с первого"""
+        self._paths = list(paths)
+        for path in list(self._frames):
+            if path not in self._paths:
+                self._frames.pop(path)
+        self._index = -1
+        self.show_next()
+
+    def show_next(self) -> None:
+        if not self._paths:
+            return
+        next_index = (self._index + 1) % len(self._paths)
+        path = self._paths[next_index]
+        frame = self._frames.get(path)
+        if frame is not None:
+            self._index = next_index
+            self._show(path, frame)
+        elif path not in self._pending:
+            # Кадр не готов: готовим и показываем, как только будет декодирован
+            asyncio.ensure_future(self._prepare_and_show(path))
+        self._prefetch()
+
+    def _show(self, path: str, frame: QImage) -> None:
+        self._frames.move_to_end(path)
+        self._current_path = path
+        pixmap = QPixmap.fromImage(frame)
+        pixmap.setDevicePixelRatio(self.devicePixelRatio())
+        self.setPixmap(pixmap)
+
+    def _prefetch(self) -> None:
+        """Подготовка следующих слайдов в фоне"""
+        for offset in range(1, min(self.cache_size, len(self._paths))):
+            path = self._paths[(self._index + offset) % len(self._paths)]
+            if path not in self._frames and path not in self._pending:
+                asyncio.ensure_future(self._prepare(path))
+
+    async def _prepare_and_show(self, path: str) -> None:
+        frame = await self._prepare(path)
+        # За время декодирования список слайдов мог смениться
+        if frame is not None and path in self._paths:
+            self._index = self._paths.index(path)
+            self._show(path, frame)
+
+    async def _prepare(self, path: str) -> Optional[QImage]:
+        if path in self._frames:
+            return self._frames[path]
+        shared = self._shared_frame(path)
+        if shared is not None:
+            if path in self._paths:
+                self._frames[path] = shared
+                self._evict()
+            return shared
+        if path not in self._pending:
+            size = self._target_size()
+            self._pending[path] = asyncio.get_running_loop().run_in_executor(
+                self._executor, decode_scaled, path, size.width(), size.height()
+            )
+        try:
+            frame = await self._pending[path]
+        except Exception as e:
+            logger.error(f"Ошибка подготовки слайда {path}: {e}")
+            frame = None
+        finally:
+            self._pending.pop(path, None)
+        if frame is not None and path in self._paths:
+            self._frames[path] = frame
+            self._evict()
+        return frame
+
+    def _shared_frame(self, path: str) -> Optional[QImage]:
+        """Готовый кадр соседней зоны того же размера"""
+        size = self._target_size()
+        for other in ImageSlideshow._instances:
+            if other is not self and path in other._frames and other._target_size() == size:
+                return other._frames[path]
+        return None
+
+    def _evict(self) -> None:
+        while len(self._frames) > self.cache_size:
+            oldest = next(path for path in self._frames if path != self._current_path)
+            self._frames.pop(oldest)
+
+    def resizeEvent(self, event):
+        """Кадры подготовлены под старый размер — готовим заново"""
+        super().resizeEvent(event)
+        if event.oldSize() != event.size() and self._paths:
+            self._frames.clear()
+            # Показываем текущий слайд заново в новом размере
+            if self._index >= 0:
+                self._index -= 1
+            self.show_next()
+
+    def release(self) -> None:
+        ImageSlideshow._instances.discard(self)
+        self._timer.stop()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._frames.clear()
@@ -0,0 +1,151 @@
+"""
+Сторож воспроизведения и бюджет ресурсов процесса.
+
+PlaybackWatchdog (по одному на видеозону) раз в interval секунд проверяет,
+что видео действительно идёт: позиция плеера меняется между проверками.
+Позиция читается по таймеру сторожа, а не из обработчика каждого кадра —
+так проверка стоит одного вызова раз в несколько секунд. Ошибки плеера (errorOccurred/InvalidMedia) обрабатывает
+зона; сторож ловит то, о чём плеер не сообщает, — тихую остановку
+декодера или зависшую загрузку. Восстановление по нарастающей:
+повторная загрузка того же файла, затем пересоздание плеера.
+
+ResourceBudget (один на процесс) следит за RSS и загрузкой CPU: если
+бюджет превышен budget_checks проверок подряд, плееры пересоздаются —
+утечки в QtMultimedia/декодере освобождаются без перезапуска киоска.
+"""
+import time
+from typing import Callable, Optional
+from PyQt6.QtCore import QTimer
+from config import WATCHDOG, logger
+from metrics import REGISTRY, process_rss
+
+
+class PlaybackWatchdog:
+    """
+    Обнаружение остановки воспроизведения DoubleBufferedPlayer.
+
+    Остановка — позиция не меняется дольше stall_seconds или загрузка
+    нового видео длится дольше load_timeout. Следующий шаг восстановления
+    делается не раньше чем через stall_seconds после предыдущего, чтобы
+    плеер успел заработать. Время от обнаружения остановки до того, как
+    позиция снова пошла, пишется в watchdog_recovery_seconds.
+    """
+
+    def __init__(self, player, name: Optional[str] = None, interval: float = WATCHDOG["interval"],
+                 stall_seconds: float = WATCHDOG["stall_seconds"], load_timeout: float = WATCHDOG["load_timeout"]):
+        self.player = player
+        self.name = name or "main"
+        self.stall_seconds = stall_seconds
+        self.load_timeout = load_timeout
+        self._last_position: Optional[int] = None
+        self._moved_at = 0.0
+        self._stalled_since: Optional[float] = None
+        self._last_action_at = 0.0
+        self._attempt = 0
+        self._timer = QTimer()
+        self._timer.timeout.connect(self.check)
+        self._timer.start(int(interval * 1000))
+
+    def _stall_kind(self, now: float) -> Optional[str]:
+        """Вид остановки или None, если воспроизведение идёт (или ещё может пойти)"""
+        loading_since = self.player.loading_since
+        if loading_since is not None:
+            # Отсчёт остановки для нового видео начнётся с его первой проверки
+            self._last_position = None
+            return "load_timeout" if now - loading_since > self.load_timeout else None
+        position = self.player.position
+        if position != self._last_position:
+            self._last_position = position
+            self._moved_at = now
+            return None
+        return "position" if now - self._moved_at > self.stall_seconds else None
+
+    def check(self) -> None:
+        if not self.player.current_path:
+            return
+        now = time.perf_counter()
+        kind = self._stall_kind(now)
+        if kind is None:
+            if self._stalled_since is not None and self.player.loading_since is None \
+                    and self._moved_at >= self._stalled_since:
+                recovery = now - self._stalled_since
+                REGISTRY.histogram("watchdog_recovery_seconds",
+                                   "Время от обнаружения остановки видео до возобновления").observe(recovery)
+                logger.info(f"Видео в зоне {self.name} снова идёт, восстановление за {recovery:.1f} с")
+                self._stalled_since = None
+                self._attempt = 0
+            return
+
+        if self._stalled_since is None:
+            self._stalled_since = now
+            REGISTRY.counter("watchdog_stalls_total", "Остановки видео, найденные сторожем", kind=kind).inc()
+            logger.warning(f"Видео в зоне {self.name} остановилось ({kind})")
+        if now - self._last_action_at < self.stall_seconds:
+            return
+        self._last_action_at = now
+        self._attempt += 1
+        if self._attempt == 1:
+            logger.warning(f"Зона {self.name}: повторная загрузка {self.player.current_path}")
+            REGISTRY.counter("watchdog_actions_total", "Действия сторожа видео", action="reload").inc()
+            self.player.load(self.player.current_path)
+        else:
+            logger.warning(f"Зона {self.name}: пересоздание плеера (попытка {self._attempt})")
+            REGISTRY.counter("watchdog_actions_total", "Действия сторожа видео", action="rebuild").inc()
+            self.player.rebuild(reason="stall")
+
+    def stop(self) -> None:
+        self._timer.stop()
+
+
+class ResourceBudget:
+    """
+    Бюджет RSS (МБ) и CPU (% одного ядра) процесса; 0 — без ограничения.
+
+    on_exceeded(kind) вызывается после budget_checks превышений подряд,
+    затем проверка бюджета пропускается cooldown секунд: память после
+    пересоздания плееров освобождается не сразу.
+    """
+
+    def __init__(self, on_exceeded: Callable[[str], None], interval: float = WATCHDOG["interval"],
+                 max_rss_mb: float = WATCHDOG["max_rss_mb"], max_cpu_percent: float = WATCHDOG["max_cpu_percent"],
+                 budget_checks: int = WATCHDOG["budget_checks"], cooldown: float = WATCHDOG["cooldown"]):
+        self.on_exceeded = on_exceeded
+        self.limits = {"rss": max_rss_mb, "cpu": max_cpu_percent}
+        self.budget_checks = budget_checks
+        self.cooldown = cooldown
+        self._over = {"rss": 0, "cpu": 0}
+        self._quiet_until = 0.0
+        self._cpu_sample = (time.process_time(), time.perf_counter())
+        self._timer = QTimer()
+        self._timer.timeout.connect(self.check)
+        self._timer.start(int(interval * 1000))
+
+    def sample(self) -> dict:
+        cpu_time, wall_time = time.process_time(), time.perf_counter()
+        previous_cpu, previous_wall = self._cpu_sample
+        self._cpu_sample = (cpu_time, wall_time)
+        cpu = (cpu_time - previous_cpu) / max(wall_time - previous_wall, 1e-6) * 100
+        rss = process_rss()
+        REGISTRY.gauge("process_rss_bytes", "RSS процесса").set(rss)
+        REGISTRY.gauge("process_cpu_percent", "Загрузка CPU процессом, % одного ядра").set(round(cpu, 1))
+        return {"rss": rss / 1024 ** 2, "cpu": cpu}
+
+    def check(self) -> None:
+        values = self.sample()
+        if time.perf_counter() < self._quiet_until:
+            return
+        for kind, limit in self.limits.items():
+            if not limit or values[kind] <= limit:
+                self._over[kind] = 0
+                continue
+            self._over[kind] += 1
+            if self._over[kind] >= self.budget_checks:
+                logger.error(f"Превышен бюджет {kind}: {values[kind]:.0f} при лимите {limit:.0f}, пересоздание плееров")
+                REGISTRY.counter("watchdog_budget_exceeded_total", "Превышения бюджета ресурсов", kind=kind).inc()
+                self._over = {key: 0 for key in self._over}
+                self._quiet_until = time.perf_counter() + self.cooldown
+                self.on_exceeded(kind)
+                return
+
+    def stop(self) -> None:
+        self._timer.stop()
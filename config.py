@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import socket
 
 load_dotenv()
 
@@ -8,42 +9,162 @@ DATE_BASE_CONNECT = {"host": os.getenv("DB_IP"),
              "password": os.getenv("DB_PASSWORD"), 
              "database": os.getenv("DB_DB")}
 
+# Общий пул соединений на процесс (DB_POOL=0 — старый режим "соединение на запрос")
+DB_POOL = {"enabled": os.getenv("DB_POOL", "1") != "0",
+           "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+           "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+           "max_inactive_connection_lifetime": float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300")),
+           "health_check": os.getenv("DB_POOL_HEALTH_CHECK", "1") != "0",
+           # SELECT 1 перед выдачей только для соединений, простоявших в пуле дольше (секунд)
+           "health_check_idle": float(os.getenv("DB_POOL_HEALTH_CHECK_IDLE", "30")),
+           # Кэш подготовленных запросов asyncpg на каждое соединение (LRU)
+           "statement_cache_size": int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256")),
+           "statement_cache_lifetime": float(os.getenv("DB_STATEMENT_CACHE_LIFETIME", "0")),
+           # Предел на установку соединения и на каждую команду: "чёрная дыра" в сети
+           # не должна держать загрузку контента бесконечно
+           "connect_timeout": float(os.getenv("DB_CONNECT_TIMEOUT", "10")),
+           "command_timeout": float(os.getenv("DB_COMMAND_TIMEOUT", "60"))}
 
+# Переподключение к БД: экспоненциальная задержка с джиттером (секунды) и
+# circuit breaker — после breaker_threshold ошибок подряд подключения
+# отклоняются сразу, а БД проверяет один вызывающий раз в breaker_reset+ секунд
+DB_BACKOFF = {"base": float(os.getenv("DB_BACKOFF_BASE", "0.5")),
+              "cap": float(os.getenv("DB_BACKOFF_CAP", "60")),
+              "breaker_threshold": int(os.getenv("DB_BREAKER_THRESHOLD", "5")),
+              "breaker_reset": float(os.getenv("DB_BREAKER_RESET", "5")),
+              "probe_timeout": float(os.getenv("DB_PROBE_TIMEOUT", "30"))}
 
+# Канал LISTEN/NOTIFY для уведомлений о новом контенте
+MEDIA_NOTIFY_CHANNEL = os.getenv("MEDIA_NOTIFY_CHANNEL", "media_updates")
+# Резервный периодический опрос БД (секунды), если уведомление потерялось
+REFRESH_INTERVAL = int(os.getenv("REFRESH_INTERVAL", "1800"))
 
+# Размер чанка при хранении медиа в БД и число чанков в одной пачке COPY
+MEDIA_CHUNK_SIZE = int(os.getenv("MEDIA_CHUNK_SIZE", str(1024 * 1024)))
+MEDIA_COPY_BATCH = int(os.getenv("MEDIA_COPY_BATCH", "8"))
+# Скачивание диапазонами: чанков в диапазоне и параллельных соединений
+MEDIA_RANGE_CHUNKS = int(os.getenv("MEDIA_RANGE_CHUNKS", "8"))
+MEDIA_DOWNLOAD_CONNECTIONS = int(os.getenv("MEDIA_DOWNLOAD_CONNECTIONS", "4"))
 
+# Постоянный дисковый кэш медиа на клиенте
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "cache")
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
 
-import logging
-from logging.handlers import RotatingFileHandler
+# Подготовка нового видео во втором плеере до переключения (без чёрного экрана)
+PLAYER_PRELOAD = os.getenv("PLAYER_PRELOAD", "1") != "0"
+# Сторож воспроизведения (client/watchdog.py): проверка раз в interval секунд,
+# остановка — нет кадров stall_seconds или загрузка дольше load_timeout.
+# Бюджет процесса: RSS в МБ и CPU в % одного ядра (0 — без ограничения);
+# после budget_checks превышений подряд плееры пересоздаются
+WATCHDOG = {"interval": float(os.getenv("WATCHDOG_INTERVAL", "2")),
+            "stall_seconds": float(os.getenv("WATCHDOG_STALL_SECONDS", "6")),
+            "load_timeout": float(os.getenv("WATCHDOG_LOAD_TIMEOUT", "30")),
+            # Предел на одну загрузку контента зоны (метаданные + скачивание); скачивание
+            # большого видео после отмены продолжается с места обрыва
+            "content_timeout": float(os.getenv("WATCHDOG_CONTENT_TIMEOUT", "300")),
+            "max_rss_mb": float(os.getenv("WATCHDOG_MAX_RSS_MB", "1536")),
+            "max_cpu_percent": float(os.getenv("WATCHDOG_MAX_CPU_PERCENT", "0")),
+            "budget_checks": int(os.getenv("WATCHDOG_BUDGET_CHECKS", "5")),
+            "cooldown": float(os.getenv("WATCHDOG_COOLDOWN", "300"))}
+# Файл, который показывается при старте, если в кэше ещё ничего нет и БД недоступна
+FALLBACK_MEDIA_PATH = os.getenv("FALLBACK_MEDIA_PATH", "")
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+# Режим дисплея: video — последнее видео, slideshow — слайд-шоу последних изображений
+DISPLAY_MODE = os.getenv("DISPLAY_MODE", "video")
+# Несколько окон/зон из одного процесса: JSON или путь к JSON-файлу (см. client/layout.py);
+# пусто — одно окно DISPLAY_MODE на основном экране
+DISPLAY_LAYOUT = os.getenv("DISPLAY_LAYOUT", "")
+SLIDESHOW_INTERVAL = int(os.getenv("SLIDESHOW_INTERVAL", "10"))  # секунд на слайд
+SLIDESHOW_LIMIT = int(os.getenv("SLIDESHOW_LIMIT", "10"))
+SLIDESHOW_CACHE_SIZE = int(os.getenv("SLIDESHOW_CACHE_SIZE", "4"))  # готовых кадров в памяти
+SLIDESHOW_DECODE_WORKERS = int(os.getenv("SLIDESHOW_DECODE_WORKERS", "2"))
 
-formatter = logging.Formatter(
-    '%(asctime)s - %(levelname)s - %(name)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# За сколько секунд до начала слота расписания скачивать его медиа
+SCHEDULE_PREFETCH_SECONDS = int(os.getenv("SCHEDULE_PREFETCH_SECONDS", "300"))
 
-all_logs_handler = RotatingFileHandler(
-    'logs/all_logs.log',
-    maxBytes=5*1024*1024,  # 5 MB
-    backupCount=3,
-    encoding='utf-8'
-)
-all_logs_handler.setFormatter(formatter)
+# Метрики: /metrics в формате Prometheus (METRICS_PORT=0 — выключено) и/или JSON-дамп
+KIOSK_ID = os.getenv("KIOSK_ID", socket.gethostname())
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_JSON_PATH = os.getenv("METRICS_JSON_PATH", "")
+METRICS_JSON_INTERVAL = int(os.getenv("METRICS_JSON_INTERVAL", "60"))
+
+# Локальный relay-сервер медиа для группы киосков (server/relay.py)
+RELAY_HOST = os.getenv("RELAY_HOST", "0.0.0.0")
+RELAY_PORT = int(os.getenv("RELAY_PORT", "8765"))
+RELAY_CACHE_DIR = os.getenv("RELAY_CACHE_DIR", "relay_cache")
+RELAY_CACHE_MAX_BYTES = int(os.getenv("RELAY_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+RELAY_LONG_POLL = int(os.getenv("RELAY_LONG_POLL", "55"))
+# Сколько клиент ждёт ответа relay (заголовков, тела или очередного блока файла), с
+RELAY_READ_TIMEOUT = float(os.getenv("RELAY_READ_TIMEOUT", "30"))
+# Адрес relay для клиента (например, http://10.0.0.5:8765); пусто — клиент ходит в БД напрямую
+MEDIA_RELAY_URL = os.getenv("MEDIA_RELAY_URL", "")
+
+# Версии видео, создаваемые при загрузке: "имя:ШxВ:битрейт,..."; пусто (по умолчанию) —
+# без перекодирования. Например: 1080p:1920x1080:4M,720p:1280x720:2M
+TRANSCODE_RENDITIONS = [
+    {"name": name, "width": int(size.split("x")[0]), "height": int(size.split("x")[1]), "bitrate": bitrate}
+    for name, size, bitrate in (
+        item.split(":") for item in os.getenv("TRANSCODE_RENDITIONS", "").split(",") if item
+    )
+]
+TRANSCODE_CODEC = os.getenv("TRANSCODE_CODEC", "libx264")
+TRANSCODE_WORKERS = int(os.getenv("TRANSCODE_WORKERS", "2"))
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+FFPROBE_PATH = os.getenv("FFPROBE_PATH", "ffprobe")
+
+# Версии изображений, создаваемые при загрузке: "имя:ШxВ,..."; пусто — только оригинал.
+# Формат версий (webp/jpeg) и качество 1-100
+IMAGE_RENDITIONS = [
+    {"name": name, "width": int(size.split("x")[0]), "height": int(size.split("x")[1])}
+    for name, size in (
+        item.split(":") for item in os.getenv("IMAGE_RENDITIONS", "1080p:1920x1080,720p:1280x720,thumb:320x320").split(",") if item
+    )
+]
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp")
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+# Политика хранения медиа в БД (server/retention.py): keep_last новейших
+# оригиналов, записи моложе max_age_days (0 — без учёта возраста),
+# закреплённые и стоящие в расписании не удаляются. Удаляемое сначала
+# сохраняется в archive_dir (пусто — удалять без архива)
+RETENTION = {"keep_last": int(os.getenv("RETENTION_KEEP_LAST", "20")),
+             "max_age_days": float(os.getenv("RETENTION_MAX_AGE_DAYS", "90")),
+             "archive_dir": os.getenv("RETENTION_ARCHIVE_DIR", "archive"),
+             "batch_size": int(os.getenv("RETENTION_BATCH", "20")),
+             "batch_pause": float(os.getenv("RETENTION_BATCH_PAUSE", "1")),
+             "lock_timeout": float(os.getenv("RETENTION_LOCK_TIMEOUT", "2")),
+             # Медиа уже сжато: быстрый уровень, выигрыш от сильного сжатия мал
+             "gzip_level": int(os.getenv("RETENTION_GZIP_LEVEL", "1"))}
 
-error_handler = RotatingFileHandler(
-    'logs/errors.log',
-    maxBytes=5*1024*1024,
-    backupCount=3,
-    encoding='utf-8'
-)
-error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(formatter)
 
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
 
-logger.addHandler(all_logs_handler)
-logger.addHandler(error_handler)
-logger.addHandler(console_handler)
\ No newline at end of file
+
+
+
+# Логирование: запись в файлы и консоль в фоновом потоке (см. log_pipeline.py)
+# LOG_FORMAT: "text" или "json"; повторяющиеся ошибки — не больше
+# LOG_RATE_LIMIT_BURST за LOG_RATE_LIMIT_INTERVAL секунд (0 — без ограничения)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "3"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_RATE_LIMIT_INTERVAL = float(os.getenv("LOG_RATE_LIMIT_INTERVAL", "60"))
+LOG_RATE_LIMIT_BURST = int(os.getenv("LOG_RATE_LIMIT_BURST", "5"))
+
+from log_pipeline import setup_logging
+
+logger = setup_logging(
+    level=LOG_LEVEL,
+    log_dir=LOG_DIR,
+    log_format=LOG_FORMAT,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    queue_size=LOG_QUEUE_SIZE,
+    rate_limit_interval=LOG_RATE_LIMIT_INTERVAL,
+    rate_limit_burst=LOG_RATE_LIMIT_BURST,
+    static_fields={"kiosk": KIOSK_ID},
+)
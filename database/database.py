@@ -1,40 +1,216 @@
+import re
 import json
+import time
 import asyncio
-from typing import Union, List, Dict, Optional
-from asyncpg import Connection, connect, Record, PostgresConnectionError
-from config import DATE_BASE_CONNECT, logger
+from functools import lru_cache
+from typing import Union, List, Dict, Optional, AsyncIterator, Iterable
+from asyncpg import Connection, connect, create_pool, Record, PostgresConnectionError, InterfaceError
+from asyncpg.pool import Pool
+from config import DATE_BASE_CONNECT, DB_POOL, logger
+from metrics import REGISTRY, timed
+from database.health import DB_HEALTH, Backoff
+
+_QUERY_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|COPY)\s+(\w+)", re.IGNORECASE)
+# Пробелы, комментарии и открывающие скобки перед первым ключевым словом: "(SELECT ...) UNION ..."
+_LEADING_NOISE = re.compile(r"^(?:\s+|--[^\n]*\n?|/\*.*?\*/|\()*", re.DOTALL)
+_RETURNING = re.compile(r"\bRETURNING\b", re.IGNORECASE)
+_ROW_KEYWORDS = ("SELECT", "WITH", "VALUES", "TABLE", "SHOW")
+
+
+@lru_cache(maxsize=512)
+def returns_rows(sql: str) -> bool:
+    """
+    Возвращает ли запрос строки: SELECT/WITH/VALUES/TABLE/SHOW (после
+    комментариев и скобок) или DML с RETURNING. Результат кэшируется по
+    тексту запроса.
+    """
+    body = _LEADING_NOISE.sub("", sql, count=1)
+    keyword = body[:6].upper()
+    return keyword.startswith(_ROW_KEYWORDS) or bool(_RETURNING.search(body))
+
+
+def _statement_cache_options() -> dict:
+    """
+    Параметры кэша подготовленных запросов asyncpg: запросы с параметрами
+    разбираются сервером один раз на соединение пула, дальше выполняются по
+    готовому плану. Lifetime 0 — без принудительного устаревания (схема
+    меняется только в init_db).
+    """
+    return {"statement_cache_size": DB_POOL["statement_cache_size"],
+            "max_cached_statement_lifetime": DB_POOL["statement_cache_lifetime"]}
+
+
+def _connection_options() -> dict:
+    """Параметры каждого соединения (пула и прямого): кэш запросов и пределы ожидания"""
+    return {**_statement_cache_options(), "timeout": DB_POOL["connect_timeout"],
+            "command_timeout": DB_POOL["command_timeout"]}
+
+
+@lru_cache(maxsize=512)
+def _query_label(sql: str) -> str:
+    """Короткая метка запроса для метрик: глагол и первая таблица ("SELECT videos")"""
+    words = sql.split(None, 1)
+    if not words:
+        return ""
+    match = _QUERY_TABLE.search(sql)
+    return f"{words[0].upper()} {match.group(1)}" if match else words[0].upper()
+
+
+def _timed_query(method: str, sql: str):
+    return timed("db_query_seconds", "Время выполнения запросов к БД", method=method, query=_query_label(sql))
+
 
 class Database:
     MAX_RETRIES = 30
-    RETRY_DELAY = 1  # seconds
 
-    def __init__(self):
+    _pool: Optional[Pool] = None
+    _pool_loop: Optional[asyncio.AbstractEventLoop] = None
+    _pool_lock: Optional[asyncio.Lock] = None
+    # Когда соединение пула (по pid backend'а) последний раз вернулось в пул
+    _released_at: Dict[int, float] = {}
+
+    def __init__(self, readonly: bool = False):
         self.connection: Optional[Connection] = None
         self.transaction = None
+        self.readonly = readonly
         self._retry_count = 0
+        self._pool_ref: Optional[Pool] = None
+
+    @classmethod
+    async def get_pool(cls) -> Pool:
+        """Ленивое создание общего для процесса пула соединений"""
+        loop = asyncio.get_running_loop()
+        if cls._pool_loop is not loop:
+            # Пул привязан к циклу событий: при новом asyncio.run() создаём заново.
+            # Старый цикл уже не выполнит close(), поэтому соединения обрываем сразу
+            if cls._pool is not None:
+                try:
+                    cls._pool.terminate()
+                except Exception as e:
+                    logger.error(f"Ошибка при закрытии пула прежнего цикла событий: {e}")
+            cls._pool = None
+            cls._released_at.clear()
+            cls._pool_loop = loop
+            cls._pool_lock = asyncio.Lock()
+        if cls._pool is not None and not cls._pool.is_closing():
+            return cls._pool
+        async with cls._pool_lock:
+            if cls._pool is None or cls._pool.is_closing():
+                cls._pool = await create_pool(
+                    **DATE_BASE_CONNECT,
+                    min_size=DB_POOL["min_size"],
+                    max_size=DB_POOL["max_size"],
+                    max_inactive_connection_lifetime=DB_POOL["max_inactive_connection_lifetime"],
+                    **_connection_options(),
+                )
+        return cls._pool
+
+    @classmethod
+    async def close_pool(cls) -> None:
+        """Закрытие общего пула (при завершении процесса)"""
+        if cls._pool is not None:
+            try:
+                await cls._pool.close()
+            except Exception as e:
+                logger.error(f"Ошибка при закрытии пула соединений: {e}")
+            finally:
+                cls._pool = None
+
+    async def _acquire(self) -> Connection:
+        """Получение соединения из пула или открытие нового"""
+        self._pool_ref = None
+        if not DB_POOL["enabled"]:
+            return await connect(**DATE_BASE_CONNECT, **_connection_options())
+
+        pool = await self.get_pool()
+        connection = await pool.acquire()
+        self._pool_ref = pool
+        released_at = self._released_at.pop(connection.get_server_pid(), None)
+        # Лишний запрос на каждое получение удвоил бы число обращений к БД:
+        # проверяем только соединения, которые долго простаивали (или ещё не выдавались)
+        idle = released_at is None or time.monotonic() - released_at > DB_POOL["health_check_idle"]
+        if DB_POOL["health_check"] and idle:
+            try:
+                await connection.execute("SELECT 1")
+            except Exception:
+                # Битое соединение не возвращаем в пул, а закрываем принудительно
+                connection.terminate()
+                await pool.release(connection)
+                raise
+        return connection
+
+    async def _release(self) -> None:
+        """Возврат соединения в пул или его закрытие"""
+        if self._pool_ref is not None:
+            if len(self._released_at) > 4 * DB_POOL["max_size"]:
+                # Записи закрытых пулом соединений не копим
+                self._released_at.clear()
+            self._released_at[self.connection.get_server_pid()] = time.monotonic()
+            await self._pool_ref.release(self.connection)
+        else:
+            await self.connection.close()
 
     async def __aenter__(self):
-        """Установка соединения с автоматическим переподключением"""
+        """
+        Установка соединения с автоматическим переподключением.
+        
+        Без соединения возвращается тот же объект с connection = None: его
+        методы вернут None (iterate — ConnectionError), как при любой ошибке БД.
+        """
         self.connection = None
         self.transaction = None
+        started = time.perf_counter()
+        backoff = Backoff()
         
         while self._retry_count < self.MAX_RETRIES:
+            # Пока БД заведомо недоступна, не ждём и не нагружаем её попытками
+            if not await DB_HEALTH.allow():
+                logger.error(f"БД недоступна, подключение отклонено (проверка через {DB_HEALTH.retry_after():.0f} с)")
+                REGISTRY.counter("db_connect_rejected_total", "Подключения, отклонённые circuit breaker").inc()
+                return self
             try:
-                self.connection = await connect(**DATE_BASE_CONNECT)
-                self.transaction = self.connection.transaction()
-                await self.transaction.start()
+                self.connection = await self._acquire()
+                if not self.readonly:
+                    self.transaction = self.connection.transaction()
+                    await self.transaction.start()
                 self._retry_count = 0  # Сброс счетчика при успешном подключении
+                DB_HEALTH.record_success()
+                REGISTRY.histogram("db_connect_seconds", "Время получения соединения с БД с учётом повторов",
+                                   pooled=self._pool_ref is not None).observe(time.perf_counter() - started)
                 return self
-            except PostgresConnectionError as e:
+            except (PostgresConnectionError, OSError, asyncio.TimeoutError, InterfaceError) as e:
+                await self._discard_connection()
+                DB_HEALTH.record_failure()
                 self._retry_count += 1
                 logger.error(f"Попытка подключения {self._retry_count}/{self.MAX_RETRIES} failed: {e}")
-                await asyncio.sleep(self.RETRY_DELAY)
+                if DB_HEALTH.state != DB_HEALTH.CLOSED:
+                    # Breaker открылся (или не прошла наша же проверка): не ждём здесь,
+                    # следующую проверку сделает тот, кто придёт после open_until
+                    REGISTRY.counter("db_connect_rejected_total", "Подключения, отклонённые circuit breaker").inc()
+                    return self
+                REGISTRY.counter("db_connect_retries_total", "Повторные попытки подключения к БД").inc()
+                await asyncio.sleep(backoff.next())
             except Exception as e:
+                await self._discard_connection()
+                DB_HEALTH.record_failure()
                 logger.error(f"Неожиданная ошибка подключения: {e}")
                 break
 
         logger.error("Превышено максимальное количество попыток подключения")
-        return None
+        REGISTRY.counter("db_connect_failures_total", "Неудачные подключения к БД после всех попыток").inc()
+        return self
+
+    async def _discard_connection(self) -> None:
+        """Соединение, на котором не удалось начать транзакцию, не оставляем висеть"""
+        if self.connection is not None:
+            try:
+                self.connection.terminate()
+                if self._pool_ref is not None:
+                    await self._pool_ref.release(self.connection)
+            except Exception:
+                pass
+            self.connection = None
+            self.transaction = None
 
     async def __aexit__(self, exc_type, exc_value, traceback):
         """Безопасное закрытие соединения"""
@@ -54,7 +230,7 @@ class Database:
         finally:
             if self.connection:
                 try:
-                    await self.connection.close()
+                    await self._release()
                 except Exception as e:
                     logger.error(f"Ошибка при закрытии соединения: {e}")
                 finally:
@@ -68,9 +244,11 @@ class Database:
                 await self.transaction.commit()
             except Exception as e:
                 logger.error(f"Ошибка при коммите при закрытии: {e}")
+            finally:
+                self.transaction = None
         if self.connection and not self.connection.is_closed():
             try:
-                await self.connection.close()
+                await self._release()
             except Exception as e:
                 logger.error(f"Ошибка при закрытии соединения: {e}")
             finally:
@@ -93,41 +271,52 @@ class Database:
                 return {key: self.serialize(value) for key, value in data.items()}
                 
             if isinstance(data, Record):
-                return {key: self.serialize(data[key]) for key in data.keys()}
+                # Обычная строка без вложенных структур — копируем одним вызовом
+                row = dict(data.items())
+                if any(isinstance(value, (list, dict, Record)) for value in row.values()):
+                    return {key: self.serialize(value) for key, value in row.items()}
+                return row
                 
             return data
         except (TypeError, json.JSONDecodeError) as e:
             logger.error(f"Ошибка сериализации данных: {e}")
             return None
 
-    async def execute_all(self, sql: str, params: tuple = ()) -> Optional[List[Dict]]:
-        """Выполнение SELECT-запросов с множественным результатом"""
+    async def execute_all(self, sql: str, params: tuple = (), raw: bool = False) -> Optional[List[Union[Dict, Record]]]:
+        """
+        Выполнение SELECT-запросов с множественным результатом.
+        
+        raw=True — строки asyncpg.Record как есть, без копирования в словари
+        (доступ по ключу тот же; для bytea-колонок и горячих путей).
+        """
         if not await self._check_connection():
             return None
             
         try:
-            if sql.strip().lower().startswith('select'):
-                result = await self.connection.fetch(sql, *params)
-                return self.serialize(result)
-            else:
-                await self.connection.execute(sql, *params)
-                return []
+            with _timed_query("execute_all", sql):
+                if returns_rows(sql):
+                    result = await self.connection.fetch(sql, *params)
+                    return result if raw else self.serialize(result)
+                else:
+                    await self.connection.execute(sql, *params)
+                    return []
         except Exception as e:
             self._handle_exception(e, sql)
             return None
 
-    async def execute(self, sql: str, params: tuple = ()) -> Optional[Dict]:
-        """Выполнение SELECT-запросов с единичным результатом"""
+    async def execute(self, sql: str, params: tuple = (), raw: bool = False) -> Optional[Union[Dict, Record]]:
+        """Выполнение SELECT-запросов с единичным результатом (raw — см. execute_all)"""
         if not await self._check_connection():
             return None
             
         try:
-            if sql.strip().lower().startswith('select'):
-                result = await self.connection.fetchrow(sql, *params)
-                return self.serialize(result)
-            else:
-                await self.connection.execute(sql, *params)
-                return {}
+            with _timed_query("execute", sql):
+                if returns_rows(sql):
+                    result = await self.connection.fetchrow(sql, *params)
+                    return result if raw else self.serialize(result)
+                else:
+                    await self.connection.execute(sql, *params)
+                    return {}
         except Exception as e:
             self._handle_exception(e, sql)
             return None
@@ -138,10 +327,11 @@ class Database:
             return None
             
         try:
-            if "RETURNING" not in sql.upper():
+            if not _RETURNING.search(sql):
                 sql = f"{sql} RETURNING id"
                 
-            return await self.connection.fetchval(sql, *params)
+            with _timed_query("fetchval", sql):
+                return await self.connection.fetchval(sql, *params)
         except Exception as e:
             self._handle_exception(e, sql)
             return None
@@ -152,15 +342,53 @@ class Database:
             return None
             
         try:
-            if sql.strip().lower().startswith('select'):
+            if returns_rows(sql) and not _RETURNING.search(sql):
                 logger.error("Используйте execute() для SELECT-запросов")
                 return None
-            await self.connection.executemany(sql, params)
+            with _timed_query("executemany", sql):
+                await self.connection.executemany(sql, params)
             return True
         except Exception as e:
             self._handle_exception(e, sql)
             return None
 
+    async def copy_records(self, table: str, records: Iterable[tuple], columns: List[str]) -> Optional[bool]:
+        """Массовая вставка через COPY (быстрее executemany для больших данных)"""
+        if not await self._check_connection():
+            return None
+            
+        try:
+            with timed("db_query_seconds", "Время выполнения запросов к БД", method="copy_records", query=f"COPY {table}"):
+                await self.connection.copy_records_to_table(table, records=records, columns=columns)
+            return True
+        except Exception as e:
+            self._handle_exception(e, f"COPY {table} ({', '.join(columns)})")
+            return None
+
+    async def iterate(self, sql: str, params: tuple = (), prefetch: int = 4) -> AsyncIterator[Record]:
+        """Потоковое чтение результата через курсор (в памяти не более prefetch строк).
+        
+        В отличие от остальных методов ошибку пробрасывает дальше: молча
+        оборванный поток нельзя отличить от конца данных.
+        """
+        if not await self._check_connection():
+            raise ConnectionError("Соединение с БД не установлено")
+
+        try:
+            # Время считается от открытия курсора до последней строки, включая обработку потребителем
+            with _timed_query("iterate", sql):
+                if self.transaction is None:
+                    # Курсоры в Postgres работают только внутри транзакции
+                    async with self.connection.transaction():
+                        async for record in self.connection.cursor(sql, *params, prefetch=prefetch):
+                            yield record
+                else:
+                    async for record in self.connection.cursor(sql, *params, prefetch=prefetch):
+                        yield record
+        except Exception as e:
+            self._handle_exception(e, sql)
+            raise
+
     async def _check_connection(self) -> bool:
         """Проверка активности соединения"""
         if not self.connection or self.connection.is_closed():
@@ -1,8 +1,51 @@
+from typing import Optional
 from database.database import Database
+from database.media import MEDIA_TABLES
+from config import MEDIA_NOTIFY_CHANNEL, logger
 
-async def init_db():
+# Увеличивается при каждом изменении схемы ниже: init_db применяет DDL,
+# только если в БД записана более старая версия
+SCHEMA_VERSION = 3
+
+
+async def _schema_version(db: Database) -> Optional[int]:
+    """Записанная в БД версия схемы; 0 — схема ещё не создавалась, None — ошибка"""
+    table = await db.execute("SELECT to_regclass('public.schema_version') IS NOT NULL AS present")
+    if not table:
+        return None
+    if not table["present"]:
+        return 0
+    current = await db.execute("SELECT max(version) AS version FROM public.schema_version")
+    if not current:
+        return None
+    return current["version"] or 0
+
+
+async def init_db() -> bool:
+    """
+    Создание и миграция схемы. DDL выполняется один раз на версию схемы:
+    если в schema_version уже записана SCHEMA_VERSION, выходим сразу, не
+    беря блокировку и не выполняя DDL.
+    
+    Returns:
+        True, если схема актуальна
+    """
     async with Database() as db:
+        if db.connection is None:
+            return False
         try:
+            version = await _schema_version(db)
+            if version is not None and version >= SCHEMA_VERSION:
+                return True
+
+            # Одновременно загрузившиеся киоски не выполняют DDL параллельно;
+            # пока ждали блокировку, схему мог обновить другой киоск
+            await db.execute("SELECT pg_advisory_xact_lock(hashtext('init_db'))")
+            await db.execute("CREATE TABLE IF NOT EXISTS public.schema_version (version integer NOT NULL)")
+            version = await _schema_version(db)
+            if version is not None and version >= SCHEMA_VERSION:
+                return True
+
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS public.images
 (
@@ -18,5 +61,105 @@ async def init_db():
     video bytea NOT NULL,
     CONSTRAINT videos_pkey PRIMARY KEY (id)
 )""")
+
+            # Чанковое хранение: строка-заголовок в images/videos и упорядоченные
+            # чанки фиксированного размера. Старые строки с данными в самой
+            # колонке image/video остаются читаемыми (chunk_count IS NULL).
+            for spec in MEDIA_TABLES.values():
+                await db.execute(f"""
+                ALTER TABLE public.{spec.table} ALTER COLUMN {spec.blob_column} DROP NOT NULL;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS chunk_size integer;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS chunk_count integer;
+                CREATE TABLE IF NOT EXISTS public.{spec.chunk_table}
+(
+    media_id bigint NOT NULL,
+    seq integer NOT NULL,
+    data bytea NOT NULL,
+    CONSTRAINT {spec.chunk_table}_pkey PRIMARY KEY (media_id, seq),
+    CONSTRAINT {spec.chunk_table}_media_fkey FOREIGN KEY (media_id)
+        REFERENCES public.{spec.table} (id) ON DELETE CASCADE
+);
+                -- Медиа уже сжато: без pglz, чтобы не тратить CPU на сжатие
+                ALTER TABLE public.{spec.chunk_table} ALTER COLUMN data SET STORAGE EXTERNAL""")
+
+                # Метаданные рядом с данными: по ним клиент дёшево проверяет,
+                # есть ли что-то новое, и сверяет скачанный файл
+                await db.execute(f"""
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS size bigint;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS sha256 text;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS mime_type text;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS created_at timestamptz NOT NULL DEFAULT now();
+                UPDATE public.{spec.table}
+                   SET size = octet_length({spec.blob_column}),
+                       sha256 = encode(sha256({spec.blob_column}), 'hex')
+                 WHERE {spec.blob_column} IS NOT NULL AND sha256 IS NULL;
+                -- Поиск дубликатов по содержимому при загрузке
+                CREATE INDEX IF NOT EXISTS {spec.table}_sha256_idx ON public.{spec.table} (sha256)""")
+
+                # Версии (renditions) хранятся строками той же таблицы со ссылкой
+                # на оригинал; "новейшая запись" ищется только среди оригиналов
+                await db.execute(f"""
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS parent_id bigint
+                    REFERENCES public.{spec.table} (id) ON DELETE CASCADE;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS rendition text;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS width integer;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS height integer;
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS bitrate bigint;
+                CREATE INDEX IF NOT EXISTS {spec.table}_parent_id_idx ON public.{spec.table} (parent_id)""")
+
+                # sha256 каждого чанка: клиент сверяет скачанные диапазоны по
+                # отдельности (у старых чанков NULL — сумма считается при чтении)
+                await db.execute(f"""
+                ALTER TABLE public.{spec.chunk_table} ADD COLUMN IF NOT EXISTS sha256 text""")
+
+                # Закреплённые записи политика хранения не удаляет (server/retention.py)
+                await db.execute(f"""
+                ALTER TABLE public.{spec.table} ADD COLUMN IF NOT EXISTS pinned boolean NOT NULL DEFAULT false""")
+
+            # Расписание показа: окна времени по дням недели с приоритетами.
+            # weekdays — битовая маска (пн = 1, вт = 2, ..., вс = 64); окно с
+            # end_time <= start_time переходит через полночь.
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS public.schedule_items
+(
+    id bigint NOT NULL GENERATED ALWAYS AS IDENTITY ( INCREMENT 1 START 1 MINVALUE 1 MAXVALUE 99999999999999 CACHE 1 ),
+    media_table text NOT NULL,
+    media_id bigint NOT NULL,
+    weekdays smallint NOT NULL DEFAULT 127,
+    start_time time NOT NULL,
+    end_time time NOT NULL,
+    priority integer NOT NULL DEFAULT 0,
+    enabled boolean NOT NULL DEFAULT true,
+    title text,
+    CONSTRAINT schedule_items_pkey PRIMARY KEY (id),
+    CONSTRAINT schedule_items_media_table_check CHECK (media_table IN ('videos', 'images')),
+    CONSTRAINT schedule_items_weekdays_check CHECK (weekdays BETWEEN 0 AND 127)
+)""")
+
+            # Проверка "запись в расписании" при очистке старого медиа
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS schedule_items_media_idx ON public.schedule_items (media_table, media_id)""")
+
+            # Любое изменение расписания сразу рассылается клиентам
+            await db.execute(f"""
+                CREATE OR REPLACE FUNCTION public.notify_schedule_change() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('{MEDIA_NOTIFY_CHANNEL}', '{{"table": "schedule_items"}}');
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql;
+                DROP TRIGGER IF EXISTS schedule_items_notify ON public.schedule_items;
+                CREATE TRIGGER schedule_items_notify
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON public.schedule_items
+                    FOR EACH STATEMENT EXECUTE FUNCTION public.notify_schedule_change()""")
+
+            # Если какой-то шаг выше упал, транзакция уже прервана: запись версии
+            # не пройдёт, и при следующем запуске DDL выполнится заново
+            result = await db.execute("INSERT INTO public.schema_version (version) VALUES ($1)", (SCHEMA_VERSION,))
+            if result is None:
+                return False
+            logger.info(f"Схема БД обновлена до версии {SCHEMA_VERSION}")
+            return True
         except Exception as e:
-            print(f"Ошибка при создании таблицы: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка при создании таблицы: {e}")
+            return False
\ No newline at end of file
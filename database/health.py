@@ -0,0 +1,128 @@
+import time
+import random
+import asyncio
+from typing import Optional
+from config import DB_BACKOFF, logger
+from metrics import REGISTRY
+
+
+class Backoff:
+    """
+    Экспоненциальная задержка с полным джиттером: случайное значение от 0 до
+    min(cap, base * 2^attempt). Джиттер разводит во времени повторы киосков,
+    потерявших БД одновременно.
+    """
+
+    def __init__(self, base: float = DB_BACKOFF["base"], cap: float = DB_BACKOFF["cap"]):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def delay(self, attempt: Optional[int] = None) -> float:
+        attempt = self.attempt if attempt is None else attempt
+        return random.uniform(0, min(self.cap, self.base * 2 ** min(attempt, 32)))
+
+    def next(self) -> float:
+        """Задержка перед следующей попыткой (счётчик попыток растёт)"""
+        delay = self.delay()
+        self.attempt += 1
+        return delay
+
+    def reset(self) -> None:
+        self.attempt = 0
+
+
+class ConnectionHealth:
+    """
+    Общее для процесса состояние доступности БД (circuit breaker).
+
+    closed    — БД доступна, подключения идут как обычно;
+    open      — после threshold ошибок подряд БД считается недоступной:
+                подключения сразу отказываются, не нагружая сервер;
+    half_open — время открытого состояния вышло: ровно один вызывающий
+                проверяет БД, остальные ждут результата этой проверки.
+    Время открытого состояния растёт экспоненциально (с джиттером) с каждой
+    неудачной проверкой.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = DB_BACKOFF["breaker_threshold"],
+                 probe_timeout: float = DB_BACKOFF["probe_timeout"]):
+        self.threshold = threshold
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self._backoff = Backoff(DB_BACKOFF["breaker_reset"], DB_BACKOFF["cap"])
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._probe_done: Optional[asyncio.Event] = None
+
+    def _event(self) -> asyncio.Event:
+        # Event привязан к циклу событий: при новом asyncio.run() создаём заново
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._probe_done = asyncio.Event()
+            if self.state == self.HALF_OPEN:
+                # Проверка, начатая в другом цикле, уже не завершится
+                self.state = self.OPEN
+        return self._probe_done
+
+    def retry_after(self) -> float:
+        """Секунд до следующей проверки БД (0 — можно подключаться)"""
+        if self.state == self.OPEN:
+            return max(self.open_until - time.monotonic(), 0.0)
+        return 0.0
+
+    async def allow(self) -> bool:
+        """
+        Можно ли пытаться подключиться. False — БД заведомо недоступна
+        (или проверка, которой мы дождались, не удалась).
+        """
+        probe_done = self._event()
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() < self.open_until:
+                return False
+            # Первый после паузы становится проверяющим
+            self.state = self.HALF_OPEN
+            probe_done.clear()
+            logger.info("БД: проверка доступности после паузы")
+            return True
+        try:
+            await asyncio.wait_for(probe_done.wait(), timeout=self.probe_timeout)
+        except asyncio.TimeoutError:
+            # Проверяющий пропал (например, задачу отменили) — следующий вызов проверит сам
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.open_until = time.monotonic()
+            return False
+        return self.state == self.CLOSED
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info("БД снова доступна")
+            REGISTRY.counter("db_breaker_transitions_total", "Смены состояния circuit breaker БД",
+                             state=self.CLOSED).inc()
+        self.state = self.CLOSED
+        self.failures = 0
+        self._backoff.reset()
+        if self._probe_done is not None:
+            self._probe_done.set()
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+            self.state = self.OPEN
+            # Не меньше base, чтобы джиттер не давал мгновенную повторную проверку
+            pause = max(self._backoff.next(), self._backoff.base)
+            self.open_until = time.monotonic() + pause
+            REGISTRY.counter("db_breaker_transitions_total", "Смены состояния circuit breaker БД",
+                             state=self.OPEN).inc()
+            logger.error(f"БД недоступна после {self.failures} ошибок подряд, следующая проверка через {pause:.1f} с")
+            if self._probe_done is not None:
+                self._probe_done.set()
+
+
+DB_HEALTH = ConnectionHealth()
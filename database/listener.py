@@ -0,0 +1,106 @@
+import json
+import asyncio
+from typing import Callable, Optional
+from asyncpg import Connection, connect
+from config import DATE_BASE_CONNECT, DB_POOL, MEDIA_NOTIFY_CHANNEL, logger
+from database.health import DB_HEALTH, Backoff
+
+
+class MediaListener:
+    """Долгоживущее соединение с LISTEN на канал уведомлений о новом контенте.
+
+    Соединение отдельное от пула: при возврате в пул asyncpg сбрасывает
+    подписки, а слушатель должен жить всё время работы приложения.
+    """
+    KEEPALIVE_INTERVAL = 30  # seconds
+
+    def __init__(self, callback: Callable[[Optional[dict]], None], channel: str = MEDIA_NOTIFY_CHANNEL):
+        """
+        Args:
+            callback: Вызывается с данными уведомления, либо с None после
+                (пере)подключения — на случай пропущенных за время обрыва событий
+            channel: Имя канала NOTIFY
+        """
+        self.callback = callback
+        self.channel = channel
+        self.connection: Optional[Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        self._terminated = asyncio.Event()
+        self._backoff = Backoff(base=1)
+
+    def start(self) -> None:
+        """Запуск фоновой задачи прослушивания"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка прослушивания и закрытие соединения"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+
+    async def _run(self) -> None:
+        while True:
+            # Через allow(), как и остальные подключения: при полуоткрытом breaker
+            # БД проверяет кто-то один, а не слушатель вместе с запросом из пула
+            if await DB_HEALTH.allow():
+                try:
+                    await self._listen()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Ошибка соединения LISTEN ({self.channel}): {e}")
+                finally:
+                    await self._close()
+            # Переподключение не раньше, чем circuit breaker разрешит проверку БД
+            await asyncio.sleep(max(self._backoff.next(), DB_HEALTH.retry_after()))
+
+    async def _listen(self) -> None:
+        self._terminated.clear()
+        try:
+            self.connection = await connect(**DATE_BASE_CONNECT, timeout=DB_POOL["connect_timeout"],
+                                            command_timeout=DB_POOL["command_timeout"])
+        except Exception:
+            DB_HEALTH.record_failure()
+            raise
+        DB_HEALTH.record_success()
+        self._backoff.reset()
+        self.connection.add_termination_listener(lambda _: self._terminated.set())
+        await self.connection.add_listener(self.channel, self._on_notification)
+        logger.info(f"Подписка на канал {self.channel} установлена")
+        self._dispatch(None)
+
+        # asyncpg не замечает "тихий" обрыв TCP без трафика — периодически пингуем
+        while not self._terminated.is_set():
+            try:
+                await asyncio.wait_for(self._terminated.wait(), timeout=self.KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                await self.connection.execute("SELECT 1", timeout=self.KEEPALIVE_INTERVAL)
+        raise ConnectionError("Соединение LISTEN закрыто сервером")
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try:
+            data = json.loads(payload) if payload else {}
+        except json.JSONDecodeError:
+            logger.error(f"Некорректные данные уведомления: {payload}")
+            data = {}
+        self._dispatch(data)
+
+    def _dispatch(self, data: Optional[dict]) -> None:
+        try:
+            self.callback(data)
+        except Exception as e:
+            logger.error(f"Ошибка обработчика уведомления: {e}")
+
+    async def _close(self) -> None:
+        if self.connection and not self.connection.is_closed():
+            try:
+                await self.connection.close(timeout=5)
+            except Exception:
+                self.connection.terminate()
+        self.connection = None
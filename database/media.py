@@ -0,0 +1,26 @@
+import hashlib
+from typing import NamedTuple
+from config import MEDIA_CHUNK_SIZE
+
+
+class MediaTable(NamedTuple):
+    """Описание таблицы медиа: заголовок в table, данные — в blob_column (старый
+    формат, одна строка) или в чанках chunk_table (media_id, seq, data)"""
+    table: str
+    blob_column: str
+    chunk_table: str
+
+
+MEDIA_TABLES = {
+    "videos": MediaTable("videos", "video", "video_chunks"),
+    "images": MediaTable("images", "image", "image_chunks"),
+}
+
+
+def file_sha256(path: str) -> str:
+    """Потоковый sha256 файла блоками MEDIA_CHUNK_SIZE (вызывается через asyncio.to_thread)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(MEDIA_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
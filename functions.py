@@ -1,42 +1,389 @@
+import os
+import json
+import asyncio
+import hashlib
+from typing import AsyncIterator, List, Optional
 from database.database import Database
+from database.media import MEDIA_TABLES, file_sha256
+from database.health import Backoff
+from config import MEDIA_CHUNK_SIZE, MEDIA_RANGE_CHUNKS, MEDIA_DOWNLOAD_CONNECTIONS, logger
+from metrics import REGISTRY
 
 last_id = -1
 last_video_id = -1
 
-async def get_photo():
+
+async def stream_media(table: str, media_id: int) -> AsyncIterator[bytes]:
+    """
+    Потоково читает данные медиа из БД, отдавая их кусками.
+    
+    Чанковые записи читаются курсором по media_chunks, старые однострочные —
+    по частям через substring(). В памяти одновременно не больше
+    нескольких чанков, независимо от размера файла.
+    """
+    spec = MEDIA_TABLES[table]
+    received = REGISTRY.counter("db_bytes_total", "Байт медиа, переданных через БД", direction="read", table=table)
+    async with Database(readonly=True) as db:
+        header = await db.execute(
+            f"SELECT chunk_count, octet_length({spec.blob_column}) AS blob_size FROM {spec.table} WHERE id = $1",
+            (media_id,), raw=True
+        )
+        if not header:
+            return
+
+        if header["chunk_count"] is not None:
+            async for record in db.iterate(
+                f"SELECT data FROM {spec.chunk_table} WHERE media_id = $1 ORDER BY seq",
+                (media_id,)
+            ):
+                received.inc(len(record["data"]))
+                yield record["data"]
+        else:
+            # Старый формат: весь файл в одной колонке bytea
+            for offset in range(0, header["blob_size"] or 0, MEDIA_CHUNK_SIZE):
+                result = await db.execute(
+                    f"SELECT substring({spec.blob_column} FROM $2 FOR $3) AS data FROM {spec.table} WHERE id = $1",
+                    (media_id, offset + 1, MEDIA_CHUNK_SIZE), raw=True
+                )
+                if result is None:
+                    raise ConnectionError(f"Не удалось прочитать {spec.table} id={media_id}")
+                received.inc(len(result["data"]))
+                yield result["data"]
+
+
+async def download_media(table: str, media_id: int, path: str) -> Optional[int]:
+    """
+    Скачивает медиа в файл потоково: сначала во временный path + '.part',
+    затем атомарно переименовывает.
+    
+    Returns:
+        Число записанных байт или None в случае ошибки
+    """
+    part_path = f"{path}.part"
+    written = 0
+    try:
+        with open(part_path, 'wb') as file:
+            async for chunk in stream_media(table, media_id):
+                file.write(chunk)
+                written += len(chunk)
+        if written == 0:
+            os.remove(part_path)
+            return None
+        os.replace(part_path, path)
+        return written
+    except Exception as e:
+        logger.error(f"Ошибка при скачивании {table} id={media_id}: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return None
+
+
+class _RangeDownload:
+    """Состояние скачивания одной записи диапазонами (см. download_media_ranges)"""
+    RANGE_ATTEMPTS = 3
+
+    def __init__(self, table: str, media_id: int, path: str, header: dict):
+        self.spec = MEDIA_TABLES[table]
+        self.table = table
+        self.media_id = media_id
+        self.path = path
+        self.part_path = f"{path}.part"
+        self.state_path = f"{path}.state"
+        self.sha256 = header["sha256"]
+        self.size = header["size"]
+        self.chunked = header["chunk_count"] is not None
+        if self.chunked:
+            self.chunk_size = header["chunk_size"]
+            self.range_count = -(-header["chunk_count"] // MEDIA_RANGE_CHUNKS)
+            self.chunk_count = header["chunk_count"]
+        else:
+            self.chunk_size = MEDIA_CHUNK_SIZE
+            self.chunk_count = -(-self.size // MEDIA_CHUNK_SIZE)
+            self.range_count = -(-self.chunk_count // MEDIA_RANGE_CHUNKS)
+        self.done = set()
+        self.fd = -1
+        self._state_lock = asyncio.Lock()
+        self._received = REGISTRY.counter("db_bytes_total", "Байт медиа, переданных через БД",
+                                          direction="read", table=table)
+
+    def open(self) -> None:
+        """Открытие файла .part; готовые диапазоны из .state засчитываются, если запись не изменилась"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                state = json.load(file)
+            if (state.get("sha256") == self.sha256 and state.get("size") == self.size
+                    and os.path.getsize(self.part_path) == self.size):
+                self.done = set(state.get("done", []))
+        except (OSError, ValueError):
+            self.done = set()
+        self.fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if not self.done:
+            os.ftruncate(self.fd, self.size)
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def _write_state(self, data: str) -> None:
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(data)
+        os.replace(tmp_path, self.state_path)
+
+    async def mark_done(self, index: int) -> None:
+        async with self._state_lock:
+            self.done.add(index)
+            # Данные диапазона должны попасть на диск раньше отметки о нём
+            await asyncio.to_thread(os.fsync, self.fd)
+            data = json.dumps({"sha256": self.sha256, "size": self.size, "done": sorted(self.done)})
+            await asyncio.to_thread(self._write_state, data)
+
+    def _write_verified(self, data: bytes, offset: int, expected: str) -> None:
+        # Выполняется в пуле потоков: hashlib и pwrite отпускают GIL
+        if hashlib.sha256(data).hexdigest() != expected:
+            raise ValueError(f"sha256 чанка по смещению {offset} не совпадает")
+        os.pwrite(self.fd, data, offset)
+
+    async def fetch_range(self, index: int) -> None:
+        first = index * MEDIA_RANGE_CHUNKS
+        last = min(first + MEDIA_RANGE_CHUNKS, self.chunk_count)
+        async with Database(readonly=True) as db:
+            if self.chunked:
+                expected_seq = first
+                # У старых чанков sha256 не записан — считаем на сервере
+                async for record in db.iterate(
+                    f"""SELECT seq, data, coalesce(sha256, encode(sha256(data), 'hex')) AS sha256
+                          FROM {self.spec.chunk_table}
+                         WHERE media_id = $1 AND seq >= $2 AND seq < $3 ORDER BY seq""",
+                    (self.media_id, first, last)
+                ):
+                    if record["seq"] != expected_seq:
+                        raise ValueError(f"нет чанка {expected_seq}")
+                    await asyncio.to_thread(self._write_verified, record["data"],
+                                            record["seq"] * self.chunk_size, record["sha256"])
+                    self._received.inc(len(record["data"]))
+                    expected_seq += 1
+                if expected_seq != last:
+                    raise ValueError(f"получено {expected_seq - first} чанков из {last - first}")
+            else:
+                for seq in range(first, last):
+                    offset = seq * MEDIA_CHUNK_SIZE
+                    result = await db.execute(
+                        f"""SELECT piece AS data, encode(sha256(piece), 'hex') AS sha256
+                              FROM (SELECT substring({self.spec.blob_column} FROM $2 FOR $3) AS piece
+                                      FROM {self.spec.table} WHERE id = $1) AS range""",
+                        (self.media_id, offset + 1, MEDIA_CHUNK_SIZE), raw=True
+                    )
+                    if result is None:
+                        raise ConnectionError(f"Не удалось прочитать {self.spec.table} id={self.media_id}")
+                    await asyncio.to_thread(self._write_verified, result["data"], offset, result["sha256"])
+                    self._received.inc(len(result["data"]))
+
+    async def worker(self, pending: asyncio.Queue) -> None:
+        while not pending.empty():
+            index = pending.get_nowait()
+            backoff = Backoff()
+            for attempt in range(1, self.RANGE_ATTEMPTS + 1):
+                try:
+                    await self.fetch_range(index)
+                    await self.mark_done(index)
+                    break
+                except (ConnectionError, ValueError, OSError) as e:
+                    logger.error(f"Диапазон {index} {self.table} id={self.media_id}, попытка {attempt}: {e}")
+                    if attempt == self.RANGE_ATTEMPTS:
+                        raise
+                    await asyncio.sleep(backoff.next())
+
+    async def finish(self) -> None:
+        """Проверка всего файла и атомарное переименование"""
+        if self.sha256 and await asyncio.to_thread(file_sha256, self.part_path) != self.sha256:
+            # Собранный файл не сходится — следующая попытка начнёт заново
+            os.remove(self.state_path)
+            raise ValueError("sha256 файла не совпадает с записью")
+        os.replace(self.part_path, self.path)
+        os.remove(self.state_path)
+
+
+async def download_media_ranges(table: str, media_id: int, path: str,
+                                connections: int = MEDIA_DOWNLOAD_CONNECTIONS) -> Optional[int]:
+    """
+    Скачивает медиа в файл диапазонами параллельно по нескольким соединениям пула.
+    
+    Диапазон — MEDIA_RANGE_CHUNKS чанков (у старых однострочных записей —
+    столько же кусков через substring()). Каждый чанк сверяется со своим
+    sha256, готовый файл — с sha256 записи. Готовые диапазоны отмечаются в
+    path + '.state', поэтому после обрыва или перезапуска скачивание
+    продолжается с места остановки, а не с нуля.
+    
+    Returns:
+        Число байт или None в случае ошибки (недокачанный файл остаётся для продолжения)
+    """
+    spec = MEDIA_TABLES[table]
+    async with Database(readonly=True) as db:
+        header = await db.execute(
+            f"""SELECT chunk_count, chunk_size, sha256,
+                       coalesce(size, octet_length({spec.blob_column})) AS size
+                  FROM {spec.table} WHERE id = $1""",
+            (media_id,), raw=True
+        )
+    if not header or not header["size"]:
+        return None
+
+    download = _RangeDownload(table, media_id, path, header)
+    try:
+        await asyncio.to_thread(download.open)
+        pending = asyncio.Queue()
+        for index in range(download.range_count):
+            if index not in download.done:
+                pending.put_nowait(index)
+        if download.done:
+            logger.info(f"Продолжение скачивания {table} id={media_id}: "
+                        f"{len(download.done)}/{download.range_count} диапазонов уже есть")
+        workers = [asyncio.ensure_future(download.worker(pending))
+                   for _ in range(max(1, min(connections, pending.qsize())))]
+        try:
+            # Сбой одного диапазона не отменяет остальные: всё скачанное пригодится при докачке
+            results = await asyncio.gather(*workers, return_exceptions=True)
+        except asyncio.CancelledError:
+            for task in workers:
+                task.cancel()
+            raise
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+        download.close()
+        await download.finish()
+        return download.size
+    except Exception as e:
+        logger.error(f"Ошибка при скачивании {table} id={media_id} диапазонами: {e}")
+        return None
+    finally:
+        download.close()
+
+
+MEDIA_META_COLUMNS = "id, size, sha256, mime_type, created_at, parent_id, rendition, width, height"
+
+
+async def get_latest_media_meta(table: str, known_id: Optional[int] = None,
+                                known_sha256: Optional[str] = None) -> Optional[dict]:
+    """
+    Метаданные самой новой записи, если она отличается от известной клиенту.
+    
+    Один запрос с LIMIT 1 по первичному ключу; сами данные не читаются.
+    
+    Returns:
+        Словарь id/size/sha256/mime_type/created_at, если есть что-то новое;
+        пустой словарь, если новее ничего нет; None в случае ошибки
+    """
+    spec = MEDIA_TABLES[table]
+    async with Database(readonly=True) as db:
+        # LEFT JOIN к пробной строке: ответ есть всегда, поэтому "ничего нового"
+        # (пустые колонки) отличимо от ошибки запроса (None)
+        result = await db.execute(
+            f"""SELECT m.* FROM (SELECT 1) AS probe
+                LEFT JOIN LATERAL (
+                    SELECT {MEDIA_META_COLUMNS} FROM {spec.table}
+                     WHERE parent_id IS NULL ORDER BY id DESC LIMIT 1
+                ) AS m ON NOT (m.id IS NOT DISTINCT FROM $1::bigint
+                               AND ($2::text IS NULL OR m.sha256 IS NOT DISTINCT FROM $2::text))""",
+            (known_id, known_sha256)
+        )
+        if result is None:
+            return None
+        return result if result["id"] is not None else {}
+
+
+async def get_recent_media_meta(table: str, limit: int) -> Optional[List[dict]]:
+    """Метаданные limit последних записей (только оригиналы), от новых к старым"""
+    async with Database(readonly=True) as db:
+        return await db.execute_all(
+            f"""SELECT {MEDIA_META_COLUMNS} FROM {MEDIA_TABLES[table].table}
+                 WHERE parent_id IS NULL ORDER BY id DESC LIMIT $1""",
+            (limit,)
+        )
+
+
+async def get_media_meta(table: str, media_id: int) -> Optional[dict]:
+    """Метаданные записи по ID"""
+    async with Database(readonly=True) as db:
+        return await db.execute(
+            f"SELECT {MEDIA_META_COLUMNS} FROM {MEDIA_TABLES[table].table} WHERE id = $1",
+            (media_id,)
+        )
+
+
+async def get_best_rendition(table: str, media_id: int, width: int, height: int) -> Optional[dict]:
+    """
+    Метаданные версии записи, лучше всего подходящей под экран width x height.
+    
+    Выбирается наименьшая версия, закрывающая экран хотя бы по одной
+    стороне; если таких нет — наибольшая из имеющихся. При равенстве
+    перекодированная версия предпочтительнее оригинала.
+    """
+    async with Database(readonly=True) as db:
+        return await db.execute(
+            f"""SELECT {MEDIA_META_COLUMNS} FROM {MEDIA_TABLES[table].table}
+                 WHERE id = $1 OR parent_id = $1
+                 ORDER BY width IS NULL,
+                          (width >= $2 OR height >= $3) DESC,
+                          CASE WHEN width >= $2 OR height >= $3
+                               THEN width::bigint * height ELSE -width::bigint * height END,
+                          parent_id IS NULL,
+                          id
+                 LIMIT 1""",
+            (media_id, width, height)
+        )
+
+
+async def get_schedule_items() -> Optional[List[dict]]:
+    """Включённые элементы расписания показа"""
+    async with Database(readonly=True) as db:
+        return await db.execute_all(
+            """SELECT id, media_table, media_id, weekdays, start_time, end_time, priority, title
+                 FROM schedule_items WHERE enabled ORDER BY id"""
+        )
+
+
+async def _read_all(table: str, media_id: int) -> bytes:
+    return b"".join([chunk async for chunk in stream_media(table, media_id)])
+
+
+async def get_photo(width: Optional[int] = None, height: Optional[int] = None):
+    """
+    Новое изображение целиком или None, если новее ничего нет.
+    
+    Если задан размер экрана width x height, читается ближайшая к нему
+    версия (см. get_best_rendition), а не оригинал.
+    """
     global last_id
     try:
-        async with Database() as db:
-            # Сначала получаем последний ID
-            result = await db.execute("SELECT id FROM images ORDER BY id DESC")
-            if result["id"]:
-                
-                # Если изображение обновилось, получаем новые данные
-                if last_id != result["id"]:
-                    last_id = result["id"]
-                    result = await db.execute("SELECT image FROM images ORDER BY id DESC")
-                    return result["image"]
+        # Одним запросом проверяем, появилось ли новое изображение
+        meta = await get_latest_media_meta("images", last_id)
+        if meta:
+            rendition = meta
+            if width and height:
+                rendition = await get_best_rendition("images", meta["id"], width, height) or meta
+            data = await _read_all("images", rendition["id"])
+            last_id = meta["id"]
+            return data
             
         return None
     except Exception as e:
-        print(f"Ошибка при получении фото из БД: {e}")
+        logger.error(f"Ошибка при получении фото из БД: {e}")
         return None
     
 async def get_video():
     global last_video_id
     try:
-        async with Database() as db:
-            # Получаем последний ID из таблицы videos
-            result = await db.execute("SELECT id FROM videos ORDER BY id DESC")
-            if result["id"]:
-                
-                # Если видео обновилось (id изменился), загружаем новое значение
-                if last_video_id != result["id"]:
-                    last_video_id = result["id"]
-                    result = await db.execute("SELECT video FROM videos ORDER BY id DESC")
-                    return result["video"]
+        # Одним запросом проверяем, появилось ли новое видео
+        meta = await get_latest_media_meta("videos", last_video_id)
+        if meta:
+            data = await _read_all("videos", meta["id"])
+            last_video_id = meta["id"]
+            return data
             
         return None
     except Exception as e:
-        print(f"Ошибка при получении видео из БД: {e}")
-        return None
\ No newline at end of file
+        logger.error(f"Ошибка при получении видео из БД: {e}")
+        return None
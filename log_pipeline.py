@@ -0,0 +1,156 @@
+"""
+Неблокирующая запись логов.
+
+Вызов logger.* в цикле событий только кладёт запись в очередь
+(QueueHandler); форматирование, запись в файлы и ротацию выполняет
+фоновый поток QueueListener. Так логирование не тормозит воспроизведение,
+даже когда во время недоступности БД ошибки сыплются потоком.
+
+Модуль не импортирует config: настройки передаются в setup_logging.
+"""
+import os
+import re
+import json
+import queue
+import atexit
+import logging
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+_DIGITS = re.compile(r"\d+")
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON (для сбора логов с киосков)"""
+
+    def __init__(self, static_fields: Optional[dict] = None):
+        super().__init__()
+        self.static_fields = static_fields or {}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+            **self.static_fields,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничение повторяющихся сообщений уровня WARNING и выше.
+
+    Сообщения считаются одинаковыми, если совпадают с точностью до чисел
+    ("Попытка подключения 3/30" и "Попытка подключения 4/30"). За interval
+    секунд пропускается не больше burst одинаковых сообщений; число
+    подавленных дописывается к первому сообщению следующего окна.
+    """
+
+    def __init__(self, interval: float = 60, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._windows: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        key = (record.name, record.levelno, _DIGITS.sub("#", str(record.msg)))
+        now = time.monotonic()
+        with self._lock:
+            # [начало окна, пропущено в окне, подавлено в окне]
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 1000:
+                    self._drop_stale(now)
+                if suppressed:
+                    record.msg = f"{record.getMessage()} (ещё {suppressed} таких же сообщений подавлено)"
+                    record.args = None
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+    def _drop_stale(self, now: float) -> None:
+        for key in [key for key, window in self._windows.items() if now - window[0] >= self.interval]:
+            del self._windows[key]
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который при переполненной очереди отбрасывает запись вместо ожидания"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str = "INFO", log_dir: str = "logs", log_format: str = "text",
+                  max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3, queue_size: int = 10000,
+                  rate_limit_interval: float = 60, rate_limit_burst: int = 5,
+                  static_fields: Optional[dict] = None) -> logging.Logger:
+    """
+    Настройка корневого логгера: очередь в вызывающем потоке, файлы и консоль
+    в фоновом потоке. Повторный вызов ничего не делает.
+    """
+    logger = logging.getLogger()
+    if any(isinstance(handler, DroppingQueueHandler) for handler in logger.handlers):
+        return logger
+    logger.setLevel(level.upper())
+
+    if log_format == "json":
+        formatter = JsonFormatter(static_fields)
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(levelname)s - %(name)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+
+    os.makedirs(log_dir, exist_ok=True)
+    all_logs_handler = RotatingFileHandler(
+        os.path.join(log_dir, 'all_logs.log'),
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding='utf-8'
+    )
+    all_logs_handler.setFormatter(formatter)
+
+    error_handler = RotatingFileHandler(
+        os.path.join(log_dir, 'errors.log'),
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding='utf-8'
+    )
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(formatter)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(RateLimitFilter(rate_limit_interval, rate_limit_burst))
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, all_logs_handler, error_handler, console_handler,
+                             respect_handler_level=True)
+    listener.start()
+    # При выходе дописываем то, что осталось в очереди
+    atexit.register(listener.stop)
+    return logger
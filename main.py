@@ -1,189 +1,523 @@
-import os
+import time
+
+# Отсчёт времени запуска — до тяжёлых импортов
+PROCESS_STARTED_AT = time.perf_counter()
+
 import sys
-import tempfile
 import asyncio
-from PyQt6.QtCore import Qt, QUrl, QTimer, pyqtSignal
-from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QSizePolicy
-from PyQt6.QtMultimedia import QMediaPlayer, QAudioOutput
-from PyQt6.QtMultimediaWidgets import QVideoWidget
+from typing import Awaitable, Callable, Dict, List, Optional
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget
 from qasync import QEventLoop
-from database.functions import init_db
-from functions import get_video
+from config import (REFRESH_INTERVAL, MEDIA_RELAY_URL, DISPLAY_MODE, DISPLAY_LAYOUT, SLIDESHOW_LIMIT,
+                    FALLBACK_MEDIA_PATH, METRICS_HOST, METRICS_PORT, METRICS_JSON_PATH, METRICS_JSON_INTERVAL,
+                    WATCHDOG, logger)
+from client.layout import load_layout, zone_slot
+from client.media_cache import MediaCache
+from client.schedule import ScheduleEngine
+from client.watchdog import PlaybackWatchdog, ResourceBudget
+from database.health import DB_HEALTH, Backoff
+from metrics import REGISTRY, serve_metrics, dump_json_periodically
 
+# Источник контента: relay-сервер здания или напрямую БД
+if MEDIA_RELAY_URL:
+    from client.relay_client import (get_latest_media_meta, get_recent_media_meta, get_media_meta,
+                                     get_best_rendition, get_schedule_items, stream_media,
+                                     download_media_ranges, RelayListener as MediaListener)
+else:
+    from functions import (get_latest_media_meta, get_recent_media_meta, get_media_meta,
+                           get_best_rendition, get_schedule_items, stream_media, download_media_ranges)
+    from database.listener import MediaListener
 
-class VideoDisplayApp(QMainWindow):
-    def __init__(self):
-        super().__init__()
 
-        self.setWindowState(Qt.WindowState.WindowFullScreen)
-        self.setWindowFlags(
-            Qt.WindowType.FramelessWindowHint |
-            Qt.WindowType.WindowStaysOnTopHint
-        )
-        QApplication.setOverrideCursor(Qt.CursorShape.BlankCursor)
+def record_startup(stage: str) -> float:
+    """Время от запуска процесса до этапа stage (секунды) — в лог и метрики"""
+    elapsed = time.perf_counter() - PROCESS_STARTED_AT
+    REGISTRY.histogram("startup_seconds", "Время от запуска процесса до этапа", stage=stage).observe(elapsed)
+    logger.info(f"Запуск: {stage} через {elapsed * 1000:.0f} мс")
+    return elapsed
 
-        # ---------- видео виджет ----------
-        self.video_widget = QVideoWidget()
-        self.video_widget.setSizePolicy(
-            QSizePolicy.Policy.Expanding,
-            QSizePolicy.Policy.Expanding
-        )
 
-        # ---------- медиа плеер ----------
-        self.media_player = QMediaPlayer(self)
-        self.audio_output = QAudioOutput(self)
-        self.audio_output.setVolume(0.0)
-        
-        # Настройка медиаплеера
-        self.media_player.setPlaybackRate(1.0)
-        self.media_player.setAudioOutput(self.audio_output)
-        self.media_player.setVideoOutput(self.video_widget)
-        
-        # Подключаем обработчики
-        self.media_player.mediaStatusChanged.connect(self.on_media_status_changed)
-        self.media_player.errorOccurred.connect(self.on_media_error)
-        self.media_player.playbackStateChanged.connect(self.on_playback_state_changed)
-        
-        # Для отслеживания позиции при перезапуске
-        self.video_duration = 0
-        self.video_temp_path = None
-        
-        # Таймер для отслеживания позиции видео
-        self.position_timer = QTimer()
-        self.position_timer.timeout.connect(self.check_position_and_loop)
-        self.position_timer.start(100)  # проверяем каждые 100мс
-        
-        # Устанавливаем видео виджет как центральный
-        self.setCentralWidget(self.video_widget)
-        
-        # Таймер для обновления видео
+class ContentHub:
+    """
+    Общая для всех окон и зон процесса часть: дисковый кэш, одна подписка
+    на уведомления, расписание, подготовка схемы БД и метрики.
+
+    Одинаковые запросы метаданных от разных зон выполняются один раз
+    (shared), а одна и та же запись скачивается один раз и лежит в кэше
+    одним файлом (MediaCache.once).
+    """
+
+    def __init__(self):
+        # Дисковый кэш: после перезапуска сразу показываем последний контент без повторной загрузки
+        self.media_cache = MediaCache()
+        self.zones: List["DisplayZone"] = []
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._metrics_tasks = []
+        self._first_frame_recorded = False
+        # Повторы после ошибок: растущая задержка с джиттером, не раньше проверки БД
+        self.retry_backoff = Backoff(base=5)
+        # Пока схема БД не проверена, контент из БД не запрашиваем
+        self.db_ready = bool(MEDIA_RELAY_URL)
+
+    def add_zone(self, zone: "DisplayZone") -> None:
+        self.zones.append(zone)
+
+    def start(self) -> None:
+        # Таймер для обновления контента (резервный опрос)
         self.setup_refresh_timer()
-        
-        # Запускаем загрузку видео через небольшой таймер
-        QTimer.singleShot(100, self.start_video_loading)
 
-    def start_video_loading(self):
-        """Запуск загрузки видео через asyncio"""
-        asyncio.create_task(self.load_and_play_video())
+        # Push-уведомления о новом контенте через LISTEN/NOTIFY — одно соединение на процесс
+        self.media_listener = MediaListener(self.on_media_notification)
+        QTimer.singleShot(0, self.media_listener.start)
+
+        # Метрики: эндпоинт Prometheus и/или периодический JSON-дамп
+        QTimer.singleShot(0, self.start_metrics)
+
+        # Проверка схемы БД в фоне; после неё загружаем расписание и контент
+        QTimer.singleShot(0, self.start_database_preparation)
+
+        # Бюджет памяти/CPU процесса: при превышении плееры пересоздаются
+        self.resource_budget = ResourceBudget(self.on_budget_exceeded)
+
+    def on_budget_exceeded(self, kind):
+        for zone in self.zones:
+            zone.rebuild_player(f"budget_{kind}")
+
+    def start_database_preparation(self):
+        asyncio.create_task(self.prepare_database())
+
+    async def prepare_database(self):
+        """Однократная проверка/создание схемы БД (при работе через relay ею занимается relay)"""
+        if not self.db_ready:
+            from database.functions import init_db
+            if not await init_db():
+                logger.error("Схема БД не подготовлена, повтор позже")
+                self.schedule_retry(self.start_database_preparation)
+                return
+            self.db_ready = True
+            self.retry_backoff.reset()
+            record_startup("БД готова")
+        self.start_schedule_loading()
+        self.start_content_loading()
+
+    def schedule_retry(self, callback):
+        """Отложенный повтор после ошибки"""
+        delay = max(self.retry_backoff.next(), DB_HEALTH.retry_after())
+        QTimer.singleShot(int(delay * 1000), callback)
+
+    def start_metrics(self):
+        if METRICS_PORT:
+            self._metrics_tasks.append(asyncio.ensure_future(serve_metrics(METRICS_HOST, METRICS_PORT)))
+        if METRICS_JSON_PATH:
+            self._metrics_tasks.append(
+                asyncio.ensure_future(dump_json_periodically(METRICS_JSON_PATH, METRICS_JSON_INTERVAL))
+            )
 
     def setup_refresh_timer(self):
-        """Настройка таймера для периодического обновления видео"""
-        # Проверяем каждые 30 минут, нужно ли обновить видео
+        """Настройка таймера для периодического обновления контента"""
+        # Резервный опрос на случай потерянного уведомления (REFRESH_INTERVAL секунд)
         self.refresh_timer = QTimer()
-        self.refresh_timer.timeout.connect(lambda: asyncio.create_task(self.load_and_play_video()))
-        self.refresh_timer.start(30 * 60 * 1000)  # 30 минут
+        self.refresh_timer.timeout.connect(self.start_content_loading)
+        self.refresh_timer.timeout.connect(self.start_schedule_loading)
+        self.refresh_timer.start(REFRESH_INTERVAL * 1000)
 
-    async def load_and_play_video(self):
-        """Загружает и воспроизводит видео из БД"""
+    def start_content_loading(self, table: Optional[str] = None):
+        """Загрузка контента во всех зонах (или только в зонах таблицы table)"""
+        for zone in self.zones:
+            if table is None or zone.media_table == table:
+                zone.start_loading()
+
+    def on_media_notification(self, payload):
+        """Обработка уведомления о новом контенте (None — после переподключения)"""
+        if payload is None or payload.get("table") == "schedule_items":
+            self.start_schedule_loading()
+        if payload is None:
+            self.start_content_loading()
+        elif payload.get("table") != "schedule_items":
+            self.start_content_loading(payload.get("table"))
+
+    def start_schedule_loading(self):
+        if not self.db_ready:
+            return
+        asyncio.create_task(self.load_schedule())
+
+    async def load_schedule(self):
+        """Загружает расписание и перестраивает временные шкалы всех зон"""
         try:
-            video_data = await get_video()
-            if not video_data:
-                print("Ошибка: Не удалось получить видео из базы данных")
-                QTimer.singleShot(5000, self.start_video_loading)
+            items = await get_schedule_items()
+            if items is None:
+                logger.error("Не удалось получить расписание из базы данных")
                 return
+            for zone in self.zones:
+                zone.schedule.set_items(items)
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке расписания: {e}")
 
-            # Удаляем предыдущий временный файл, если существует
-            if self.video_temp_path and os.path.exists(self.video_temp_path):
-                try:
-                    os.remove(self.video_temp_path)
-                except (PermissionError, OSError):
-                    pass
-
-            # Создаем новый временный файл
-            with tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.mp4') as tmp:
-                tmp.write(video_data)
-                self.video_temp_path = tmp.name
-
-            # Останавливаем текущее воспроизведение
-            if self.media_player.playbackState() != QMediaPlayer.PlaybackState.StoppedState:
-                self.media_player.stop()
-            
-            # Загружаем новое видео
-            self.media_player.setSource(QUrl.fromLocalFile(self.video_temp_path))
-            
-            print("Видео успешно загружено")
+    async def shared(self, key: tuple, factory: Callable[[], Awaitable]):
+        """
+        Один запрос на процесс: зоны, одновременно спросившие одно и то же
+        (например, после уведомления), получают результат одного запроса.
+        """
+        if key not in self._inflight:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(self._inflight[key])
 
-        except Exception as e:
-            print(f"Ошибка при загрузке видео: {e}")
-            QTimer.singleShot(10000, self.start_video_loading)
-
-    def on_media_status_changed(self, status):
-        """Обработка изменений статуса медиа"""
-        if status == QMediaPlayer.MediaStatus.LoadedMedia:
-            # Получаем длительность видео
-            self.video_duration = self.media_player.duration()
-            print(f"Медиа загружено, длительность: {self.video_duration} мс")
-            
-            # Запускаем воспроизведение
-            self.media_player.play()
-            
-        elif status == QMediaPlayer.MediaStatus.BufferedMedia:
-            print("Медиа буферизировано")
-            
-        elif status == QMediaPlayer.MediaStatus.InvalidMedia:
-            print("Неверный медиафайл, попытка перезагрузки")
-            self.start_video_loading()
-
-    def check_position_and_loop(self):
-        """Проверяет текущую позицию и перематывает видео до конца, если нужно"""
-        if self.video_duration > 0:
-            current_pos = self.media_player.position()
-            # Если текущая позиция близка к концу (например, за 200мс до конца)
-            if current_pos >= (self.video_duration - 200):
-                self.media_player.setPosition(0)
-
-    def on_media_error(self, error, error_string):
-        """Обработка ошибок воспроизведения"""
-        print(f"Ошибка медиаплеера ({error}): {error_string}")
-        QTimer.singleShot(3000, self.start_video_loading)
-
-    def on_playback_state_changed(self, state):
-        """Обработка изменений состояния воспроизведения"""
-        states = {
-            QMediaPlayer.PlaybackState.StoppedState: "Остановлено",
-            QMediaPlayer.PlaybackState.PlayingState: "Воспроизводится",
-            QMediaPlayer.PlaybackState.PausedState: "На паузе"
-        }
-        print(f"Состояние воспроизведения: {states.get(state, 'Неизвестно')}")
+    async def fetch_to_cache(self, table, meta, width, height):
+        """Путь к версии записи под размер width x height в кэше; при необходимости скачивает её"""
+        rendition = await self.shared(
+            ("best", table, meta["id"], width, height),
+            lambda: get_best_rendition(table, meta["id"], width, height)
+        ) or meta
+        rendition_id = rendition["id"]
+
+        # Чего нет в кэше, скачивается потоково прямо в файл кэша
+        # и сверяется с sha256 из метаданных
+        path = self.media_cache.get(table, rendition_id)
+        if path and rendition["sha256"] and self.media_cache.get_sha256(table, rendition_id) != rendition["sha256"]:
+            path = None
+        if not path and table == "videos":
+            # Видео — диапазонами с докачкой: после обрыва Wi-Fi скачивание продолжится с места остановки
+            download_path = self.media_cache.download_path(table, rendition_id)
+
+            async def download():
+                if not await download_media_ranges(table, rendition_id, download_path):
+                    return None
+                return await self.media_cache.store_file(
+                    table, rendition_id, download_path, rendition["sha256"], suffix='.mp4'
+                )
+            path = await self.media_cache.once(table, rendition_id, download)
+        elif not path:
+            path = await self.media_cache.store(
+                table, rendition_id, stream_media(table, rendition_id), expected_sha256=rendition["sha256"]
+            )
+        return rendition_id, path
+
+    def record_first_frame(self):
+        if not self._first_frame_recorded:
+            self._first_frame_recorded = True
+            record_startup("первый кадр")
 
     def cleanup_resources(self):
         """Очистка ресурсов при закрытии"""
         if hasattr(self, 'refresh_timer'):
             self.refresh_timer.stop()
-        if hasattr(self, 'position_timer'):
-            self.position_timer.stop()
-        
-        if self.media_player:
-            self.media_player.stop()
-            self.media_player.setVideoOutput(None)
-            self.media_player.setSource(QUrl())
-        
-        if self.video_temp_path and os.path.exists(self.video_temp_path):
-            try:
-                # Даем время на освобождение файла
-                QTimer.singleShot(100, lambda: self.safe_remove_file(self.video_temp_path))
-            except Exception as e:
-                print(f"Ошибка при удалении временного файла: {e}")
-
-    def safe_remove_file(self, filepath):
-        """Безопасное удаление файла"""
+        if hasattr(self, 'resource_budget'):
+            self.resource_budget.stop()
+        if hasattr(self, 'media_listener'):
+            asyncio.ensure_future(self.media_listener.stop())
+        for task in self._metrics_tasks:
+            task.cancel()
+        for zone in self.zones:
+            zone.release()
+        self.zones = []
+
+
+class DisplayZone(QWidget):
+    """
+    Зона экрана: видео (двойная буферизация) или слайд-шоу изображений.
+
+    Контент и расписание берутся через общий ContentHub; версия медиа
+    выбирается под размер самой зоны, а не всего экрана.
+    """
+
+    def __init__(self, hub: ContentHub, zone: dict, parent=None):
+        super().__init__(parent)
+        self.hub = hub
+        self.name = zone["name"]
+        self.display_mode = zone["mode"]
+        self.media_table = "images" if self.display_mode == "slideshow" else "videos"
+        # Ключ зоны в индексе кэша: у каждой зоны своё последнее видео и свои слайды
+        self.slot = zone_slot(zone, self.media_table)
+        self.current_video_id = None
+        self.current_video_path = None
+        self.current_image_ids = []
+        self.player = None
+        self.slideshow = None
+        self.watchdog = None
+        self._fetch_started_at = None
+        # Одна загрузка на зону: повторные вызовы во время загрузки сливаются в один следующий
+        self._load_task: Optional[asyncio.Task] = None
+        self._reload_requested = False
+        self.retry_backoff = Backoff(base=5)
+        self.setStyleSheet("background-color: black;")
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        # Модули нужны только для своего режима: QtMultimedia без видеозон не загружаем
+        cache = hub.media_cache
+        if self.display_mode == "slideshow":
+            # ---------- слайд-шоу изображений ----------
+            from client.slideshow import ImageSlideshow
+            self.slideshow = ImageSlideshow(self)
+            paths = [path for _, path in cache.pinned("images", self.slot) or cache.pinned("images")]
+            self.slideshow.set_images(paths or ([FALLBACK_MEDIA_PATH] if FALLBACK_MEDIA_PATH else []))
+            layout.addWidget(self.slideshow)
+        else:
+            # ---------- видео с двойной буферизацией ----------
+            from client.player import DoubleBufferedPlayer
+            self.player = DoubleBufferedPlayer(self)
+            self.player.failed.connect(self.on_media_error)
+            self.player.swapped.connect(self.on_video_swapped)
+
+            # Сразу показываем последнее видео из кэша (или резервное), не дожидаясь БД
+            cached = cache.latest("videos", self.slot) or cache.latest("videos")
+            if cached:
+                self.current_video_path = cached[1]
+            elif FALLBACK_MEDIA_PATH:
+                self.current_video_path = FALLBACK_MEDIA_PATH
+            if self.current_video_path:
+                self.player.load(self.current_video_path)
+            layout.addWidget(self.player)
+
+            # Тихие остановки декодера и зависшие загрузки, о которых плеер не сообщает
+            self.watchdog = PlaybackWatchdog(self.player, self.name)
+
+        # Расписание: контент по времени уроков/перемен, переключение по таймеру
+        self.scheduled_item = None
+        self.schedule = ScheduleEngine(
+            self.on_schedule_change, self.on_schedule_prefetch, media_table=self.media_table
+        )
+        hub.add_zone(self)
+
+    def target_size(self):
+        """Размер зоны в физических пикселях (до раскладки окна — размер экрана)"""
+        size = self.size() if self.width() > 1 and self.height() > 1 else self.screen().size()
+        size = size * self.devicePixelRatio()
+        return size.width(), size.height()
+
+    def schedule_retry(self, callback):
+        """Отложенный повтор после ошибки (общий для всех путей загрузки зоны)"""
+        delay = max(self.retry_backoff.next(), DB_HEALTH.retry_after())
+        QTimer.singleShot(int(delay * 1000), callback)
+
+    def start_loading(self):
+        """
+        Запуск загрузки контента через asyncio.
+
+        Вызывается из уведомлений, таймеров, расписания и повторов; пока
+        идёт загрузка, новые вызовы не запускают вторую, а помечают, что
+        после текущей нужна ещё одна. Загрузка длится не дольше
+        WATCHDOG["content_timeout"]: зависшее соединение не должно навсегда
+        остановить обновление контента зоны.
+        """
+        if not self.hub.db_ready:
+            return
+        if self._load_task is not None and not self._load_task.done():
+            self._reload_requested = True
+            REGISTRY.counter("zone_loads_coalesced_total", "Запуски загрузки, слитые с уже идущей").inc()
+            return
+        self._reload_requested = False
+        load = self.load_slideshow() if self.display_mode == "slideshow" else self.load_and_play_video()
+        self._load_task = asyncio.create_task(asyncio.wait_for(load, timeout=WATCHDOG["content_timeout"]))
+        self._load_task.add_done_callback(self._on_load_done)
+
+    def _on_load_done(self, task):
+        self._load_task = None
+        if not task.cancelled() and isinstance(task.exception(), asyncio.TimeoutError):
+            logger.error(f"Загрузка контента зоны {self.name or 'main'} не завершилась за "
+                         f"{WATCHDOG['content_timeout']:.0f} с, прервана")
+            REGISTRY.counter("watchdog_stalls_total", "Остановки видео, найденные сторожем", kind="content_load").inc()
+            self.schedule_retry(self.start_loading)
+        if self._reload_requested:
+            self.start_loading()
+
+    def rebuild_player(self, reason):
+        """Пересоздание плеера зоны (сторож или бюджет ресурсов)"""
+        if self.player:
+            self.player.rebuild(reason)
+
+    def on_schedule_change(self, item):
+        """Смена активного элемента расписания (None — показываем новейший контент)"""
+        self.scheduled_item = item
+        self.start_loading()
+
+    def on_schedule_prefetch(self, item):
+        """Заблаговременная загрузка медиа следующего слота расписания"""
+        async def prefetch():
+            meta = await self._get_media_meta(item["media_table"], item["media_id"])
+            if meta:
+                await self.hub.fetch_to_cache(item["media_table"], meta, *self.target_size())
+        asyncio.create_task(prefetch())
+
+    async def _get_media_meta(self, table, media_id):
+        return await self.hub.shared(("meta", table, media_id), lambda: get_media_meta(table, media_id))
+
+    async def load_slideshow(self):
+        """Загружает последние изображения и обновляет слайд-шоу"""
         try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
+            if self.scheduled_item:
+                # По расписанию — только изображение текущего слота
+                meta = await self._get_media_meta("images", self.scheduled_item["media_id"])
+                metas = [meta] if meta else None
+            else:
+                metas = await self.hub.shared(
+                    ("recent", "images", SLIDESHOW_LIMIT), lambda: get_recent_media_meta("images", SLIDESHOW_LIMIT)
+                )
+            if metas is None:
+                logger.error("Не удалось получить изображения из базы данных")
+                self.schedule_retry(self.start_loading)
+                return
+            self.retry_backoff.reset()
+            image_ids = [meta["id"] for meta in metas]
+            if image_ids == self.current_image_ids:
+                return
+
+            paths, cached_ids = [], []
+            for meta in metas:
+                rendition_id, path = await self.hub.fetch_to_cache("images", meta, *self.target_size())
+                if path:
+                    paths.append(path)
+                    cached_ids.append(rendition_id)
+            self.hub.media_cache.pin("images", cached_ids, self.slot)
+            self.slideshow.set_images(paths)
+            if len(paths) == len(metas):
+                self.current_image_ids = image_ids
+            else:
+                # Часть изображений не скачалась — попробуем позже
+                self.schedule_retry(self.start_loading)
+            logger.info(f"Слайд-шоу обновлено: {len(paths)} изображений")
+
         except Exception as e:
-            print(f"Не удалось удалить файл {filepath}: {e}")
+            logger.error(f"Ошибка при загрузке изображений: {e}")
+            self.schedule_retry(self.start_loading)
+
+    async def load_and_play_video(self):
+        """Загружает и воспроизводит видео из БД"""
+        try:
+            if self.scheduled_item:
+                # По расписанию — видео текущего слота
+                if self.scheduled_item["media_id"] == self.current_video_id:
+                    return
+                meta = await self._get_media_meta("videos", self.scheduled_item["media_id"])
+            else:
+                # Дешёвая проверка по метаданным: новое ли что-то появилось
+                known_id = self.current_video_id
+                meta = await self.hub.shared(
+                    ("latest", "videos", known_id), lambda: get_latest_media_meta("videos", known_id)
+                )
+            if meta is None:
+                logger.error("Не удалось получить видео из базы данных")
+                self.schedule_retry(self.start_loading)
+                return
+            self.retry_backoff.reset()
+            if not meta:
+                return
+
+            # Версия видео под размер этой зоны (из кэша или из БД)
+            self._fetch_started_at = time.perf_counter()
+            rendition_id, video_path = await self.hub.fetch_to_cache("videos", meta, *self.target_size())
+            if not video_path:
+                logger.error("Не удалось скачать видео из базы данных")
+                self.schedule_retry(self.start_loading)
+                return
+
+            # Новое видео готовится в фоновом плеере и сменит текущее без чёрного экрана
+            self.current_video_id = meta["id"]
+            self.hub.media_cache.set_latest("videos", rendition_id, self.slot)
+            if video_path == self.current_video_path:
+                # После перезапуска из кэша уже играет этот же файл
+                self._fetch_started_at = None
+                return
+            self.player.load(video_path)
+            self.current_video_path = video_path
+
+            logger.info("Видео успешно загружено")
+
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке видео: {e}")
+            self.schedule_retry(self.start_loading)
+
+    def on_video_swapped(self, ttff_ms, gap_ms):
+        """Новое видео на экране: время до первого кадра и пауза при переключении"""
+        self.hub.record_first_frame()
+        if self._fetch_started_at is not None:
+            REGISTRY.histogram(
+                "player_fetch_to_first_frame_seconds", "Время от начала загрузки видео до первого кадра на экране"
+            ).observe(time.perf_counter() - self._fetch_started_at)
+            self._fetch_started_at = None
+        logger.info(f"Видео на экране: первый кадр через {ttff_ms:.0f} мс, пауза при смене {gap_ms:.0f} мс")
+
+    def on_media_error(self, error_string):
+        """Обработка ошибок воспроизведения"""
+        logger.error(f"Ошибка медиаплеера: {error_string}")
+        # Повторно загружаем видео, даже если id в БД не изменился
+        self.current_video_id = None
+        self.current_video_path = None
+        # С той же задержкой, что и остальные повторы зоны: при недоступной БД
+        # повтор не раньше, чем разрешит circuit breaker
+        self.schedule_retry(self.start_loading)
+
+    def release(self):
+        self.schedule.stop()
+        if self.watchdog:
+            self.watchdog.stop()
+        if self.player:
+            self.player.release()
+        if self.slideshow:
+            self.slideshow.release()
+
+
+class ZoneContainer(QWidget):
+    """Зоны окна, размещённые по долям его ширины и высоты"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setStyleSheet("background-color: black;")
+        self._zones = []
+
+    def add_zone(self, zone: DisplayZone, rect) -> None:
+        zone.setParent(self)
+        self._zones.append((zone, rect))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        width, height = self.width(), self.height()
+        for zone, (x, y, zone_width, zone_height) in self._zones:
+            # Края соседних зон считаются от одних и тех же долей — без щелей и наложений
+            left, top = round(x * width), round(y * height)
+            zone.setGeometry(left, top, round((x + zone_width) * width) - left,
+                             round((y + zone_height) * height) - top)
+
+
+class DisplayWindow(QMainWindow):
+    """Полноэкранное окно на одном экране с зонами из раскладки"""
+
+    def __init__(self, hub: ContentHub, screen, zones: List[dict]):
+        super().__init__()
+        self.hub = hub
+        self.setWindowFlags(
+            Qt.WindowType.FramelessWindowHint |
+            Qt.WindowType.WindowStaysOnTopHint
+        )
+        # Окно открывается на своём экране и разворачивается на весь экран
+        self.setGeometry(screen.geometry())
+        self.setWindowState(Qt.WindowState.WindowFullScreen)
+
+        container = ZoneContainer(self)
+        self.zones = []
+        for zone in zones:
+            display_zone = DisplayZone(hub, zone)
+            container.add_zone(display_zone, zone["rect"])
+            self.zones.append(display_zone)
+        self.setCentralWidget(container)
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Escape:
             self.cleanup_and_exit()
 
     def closeEvent(self, event):
-        self.cleanup_resources()
+        for zone in self.zones:
+            if zone in self.hub.zones:
+                self.hub.zones.remove(zone)
+            zone.release()
         super().closeEvent(event)
 
     def cleanup_and_exit(self):
         """Очистка и выход из приложения"""
-        self.cleanup_resources()
+        self.hub.cleanup_resources()
         QApplication.restoreOverrideCursor()
         QApplication.quit()
 
@@ -194,15 +528,27 @@ def main():
     loop = QEventLoop(app)
     asyncio.set_event_loop(loop)
 
-    # Инициализация БД
-    loop.run_until_complete(init_db())
+    QApplication.setOverrideCursor(Qt.CursorShape.BlankCursor)
+    hub = ContentHub()
+    screens = app.screens()
+    windows = []
+    for window in load_layout(DISPLAY_LAYOUT, DISPLAY_MODE):
+        if window["screen"] < len(screens):
+            screen = screens[window["screen"]]
+        else:
+            logger.error(f"Экран {window['screen']} не найден (всего {len(screens)}), окно открыто на основном")
+            screen = app.primaryScreen()
+        windows.append(DisplayWindow(hub, screen, window["zones"]))
 
-    window = VideoDisplayApp()
-    window.show()
+    # Окна показываются сразу; схема БД проверяется в фоне (ContentHub.prepare_database)
+    for window in windows:
+        window.show()
+    record_startup("окно показано")
+    hub.start()
 
     with loop:
         loop.run_forever()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
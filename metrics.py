@@ -0,0 +1,191 @@
+"""
+Встроенные метрики: счётчики, текущие значения (gauge) и гистограммы задержек.
+
+Метрики доступны в текстовом формате Prometheus (serve_metrics, GET
+/metrics) и как периодический JSON-дамп (dump_json_periodically).
+Регистрация ленивая: метрика создаётся при первом обращении по имени и
+набору меток.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import resource
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+from config import KIOSK_ID, logger
+
+# Границы корзин по умолчанию, секунды: от 1 мс до 2 мин
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, dict] = {}
+
+    def _get(self, kind: str, name: str, help_text: str, labels: Dict[str, object], factory):
+        with self._lock:
+            family = self._metrics.setdefault(name, {"type": kind, "help": help_text, "children": {}})
+            key = _label_key(labels)
+            if key not in family["children"]:
+                family["children"][key] = factory()
+            return family["children"][key]
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str = "", **labels) -> Gauge:
+        return self._get("gauge", name, help_text, labels, Gauge)
+
+    def histogram(self, name: str, help_text: str = "", buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+        return self._get("histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus 0.0.4"""
+        lines = []
+        with self._lock:
+            for name, family in sorted(self._metrics.items()):
+                lines.append(f"# HELP {name} {family['help']}")
+                lines.append(f"# TYPE {name} {family['type']}")
+                for key, metric in family["children"].items():
+                    if family["type"] != "histogram":
+                        lines.append(f"{name}{_format_labels(key)} {metric.value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, metric.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {metric.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {metric.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {metric.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        """Снимок метрик для JSON-дампа"""
+        result = {}
+        with self._lock:
+            for name, family in self._metrics.items():
+                children = []
+                for key, metric in family["children"].items():
+                    entry = {"labels": dict(key)}
+                    if family["type"] != "histogram":
+                        entry["value"] = metric.value
+                    else:
+                        entry.update(count=metric.count, sum=metric.sum,
+                                     buckets=dict(zip(map(str, metric.buckets), metric.counts)))
+                    children.append(entry)
+                result[name] = {"type": family["type"], "values": children}
+        return result
+
+
+REGISTRY = Registry()
+
+
+def process_rss() -> int:
+    """Текущий RSS процесса в байтах (Linux /proc, иначе пиковый ru_maxrss)"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+@contextmanager
+def timed(name: str, help_text: str = "", **labels) -> Iterator[None]:
+    """Замер длительности блока в гистограмму name (секунды)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.histogram(name, help_text, **labels).observe(time.perf_counter() - started)
+
+
+async def serve_metrics(host: str, port: int) -> asyncio.AbstractServer:
+    """HTTP-эндпоинт GET /metrics в формате Prometheus"""
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", REGISTRY.render_prometheus().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b""
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Ошибка отдачи метрик: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
+
+
+async def dump_json_periodically(path: str, interval: float) -> None:
+    """Периодическая запись снимка метрик в JSON-файл (атомарно)"""
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = {"kiosk": KIOSK_ID, "timestamp": time.time(), "metrics": REGISTRY.to_dict()}
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(snapshot, file, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Не удалось записать метрики в {path}: {e}")
@@ -0,0 +1,196 @@
+"""
+Массовая загрузка медиа в БД.
+
+Принимает каталоги и glob-шаблоны, загружает файлы параллельно (не более
+--concurrency одновременно) через общий пул соединений. Дубликаты
+отсеиваются по sha256 ещё до отправки данных: и среди уже загруженного в
+БД, и внутри самой пачки. Прогресс сохраняется в файл состояния, поэтому
+после прерывания уже загруженные файлы повторно не отправляются.
+
+Запуск: python -m server.bulk_upload media/2024-autumn/ "notices/**/*.png" --concurrency 4
+"""
+import os
+import glob
+import json
+import time
+import asyncio
+import argparse
+import mimetypes
+from typing import Dict, List, Optional
+from database.database import Database
+from database.media import MEDIA_TABLES, file_sha256
+from server.uploader import upload_image_to_db, upload_video_to_db
+from config import logger
+
+UPLOADERS = {"images": upload_image_to_db, "videos": upload_video_to_db}
+PROGRESS_INTERVAL = 5  # seconds
+
+
+def detect_table(path: str) -> Optional[str]:
+    """Таблица для файла по его MIME-типу"""
+    mime_type = mimetypes.guess_type(path)[0] or ""
+    if mime_type.startswith("video/"):
+        return "videos"
+    if mime_type.startswith("image/"):
+        return "images"
+    return None
+
+
+def collect_files(patterns: List[str]) -> List[str]:
+    """Раскрытие каталогов и glob-шаблонов в список файлов без повторов"""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                files += [os.path.join(root, name) for name in sorted(names)]
+        else:
+            files += sorted(glob.glob(pattern, recursive=True))
+    return list(dict.fromkeys(os.path.abspath(path) for path in files if os.path.isfile(path)))
+
+
+class BulkUploader:
+    def __init__(self, state_path: str, concurrency: int = 4, table: Optional[str] = None):
+        self.state_path = state_path
+        self.table = table
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.state: Dict[str, dict] = self._load_state()
+        self._hashes_in_progress = set()
+        self.stats = {"uploaded": 0, "skipped": 0, "failed": 0, "bytes": 0}
+        self.started_at = time.perf_counter()
+
+    def _load_state(self) -> Dict[str, dict]:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Файл состояния {self.state_path} не читается, начинаем заново: {e}")
+            return {}
+
+    def _save_state(self) -> None:
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def _is_done(self, path: str, stat: os.stat_result) -> bool:
+        entry = self.state.get(path)
+        return bool(entry) and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+    def _mark_done(self, path: str, stat: os.stat_result, sha256: str, media_id: int) -> None:
+        self.state[path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256, "id": media_id}
+        self._save_state()
+
+    async def _find_duplicate(self, table: str, sha256: str) -> Optional[int]:
+        """
+        ID уже загруженной записи с тем же содержимым или None.
+
+        Подзапрос всегда возвращает строку, поэтому "дубликата нет" ({"id": None})
+        отличается от ошибки БД (None): при недоступной БД файл считается
+        неудачным и не загружается повторно как новый.
+        """
+        async with Database(readonly=True) as db:
+            result = await db.execute(
+                f"""SELECT (SELECT id FROM {MEDIA_TABLES[table].table}
+                             WHERE sha256 = $1 AND parent_id IS NULL LIMIT 1) AS id""", (sha256,)
+            )
+        if result is None:
+            raise ConnectionError("не удалось проверить дубликаты в БД")
+        return result["id"]
+
+    async def upload_file(self, path: str) -> None:
+        """Загрузка одного файла; ошибка считается неудачей этого файла и не прерывает пачку"""
+        try:
+            await self._upload_file(path)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки {path}: {e}")
+            self.stats["failed"] += 1
+
+    async def _upload_file(self, path: str) -> None:
+        table = self.table or detect_table(path)
+        if table is None:
+            logger.info(f"Пропуск (неизвестный тип): {path}")
+            self.stats["skipped"] += 1
+            return
+
+        async with self.semaphore:
+            stat = os.stat(path)
+            if self._is_done(path, stat):
+                self.stats["skipped"] += 1
+                return
+
+            sha256 = await asyncio.to_thread(file_sha256, path)
+            if sha256 in self._hashes_in_progress:
+                logger.info(f"Пропуск (дубликат в пачке): {path}")
+                self.stats["skipped"] += 1
+                return
+            self._hashes_in_progress.add(sha256)
+            try:
+                duplicate_id = await self._find_duplicate(table, sha256)
+                if duplicate_id is not None:
+                    logger.info(f"Пропуск (уже в БД, id={duplicate_id}): {path}")
+                    self._mark_done(path, stat, sha256, duplicate_id)
+                    self.stats["skipped"] += 1
+                    return
+
+                started_at = time.perf_counter()
+                # sha256 уже посчитан — загрузчик не читает файл ради него повторно
+                media_id = await UPLOADERS[table](path, sha256=sha256)
+                if media_id is None:
+                    raise RuntimeError("загрузчик вернул ошибку")
+            except Exception:
+                # Другой файл с тем же содержимым ещё может загрузиться
+                self._hashes_in_progress.discard(sha256)
+                raise
+
+            elapsed = time.perf_counter() - started_at
+            self._mark_done(path, stat, sha256, media_id)
+            self.stats["uploaded"] += 1
+            self.stats["bytes"] += stat.st_size
+            logger.info(
+                f"Загружен {path} -> {table} id={media_id}: "
+                f"{stat.st_size / 1024 ** 2:.1f} МБ за {elapsed:.1f} с "
+                f"({stat.st_size / 1024 ** 2 / max(elapsed, 1e-6):.1f} МБ/с)"
+            )
+
+    def report(self, total: int) -> str:
+        elapsed = time.perf_counter() - self.started_at
+        done = self.stats["uploaded"] + self.stats["skipped"] + self.stats["failed"]
+        return (
+            f"{done}/{total} файлов: загружено {self.stats['uploaded']}, "
+            f"пропущено {self.stats['skipped']}, ошибок {self.stats['failed']}; "
+            f"{self.stats['bytes'] / 1024 ** 2:.1f} МБ, "
+            f"{self.stats['bytes'] / 1024 ** 2 / max(elapsed, 1e-6):.1f} МБ/с"
+        )
+
+    async def run(self, files: List[str]) -> dict:
+        async def progress():
+            while True:
+                await asyncio.sleep(PROGRESS_INTERVAL)
+                logger.info(f"Прогресс: {self.report(len(files))}")
+
+        progress_task = asyncio.create_task(progress())
+        try:
+            await asyncio.gather(*(self.upload_file(path) for path in files))
+        finally:
+            progress_task.cancel()
+            await Database.close_pool()
+        logger.info(f"Готово: {self.report(len(files))}")
+        return self.stats
+
+
+async def main(patterns: List[str], concurrency: int, state_path: str, table: Optional[str]) -> dict:
+    files = collect_files(patterns)
+    logger.info(f"Найдено файлов: {len(files)}")
+    return await BulkUploader(state_path, concurrency, table).run(files)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовая загрузка медиа в БД")
+    parser.add_argument("paths", nargs="+", help="Каталоги или glob-шаблоны")
+    parser.add_argument("--concurrency", type=int, default=4, help="Число одновременных загрузок")
+    parser.add_argument("--state", default=".bulk_upload_state.json", help="Файл состояния для докачки")
+    parser.add_argument("--table", choices=sorted(MEDIA_TABLES), help="Таблица (по умолчанию — по типу файла)")
+    args = parser.parse_args()
+    asyncio.run(main(args.paths, args.concurrency, args.state, args.table))
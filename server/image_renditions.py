@@ -0,0 +1,102 @@
+"""
+Версии изображений под экраны дисплеев и миниатюры при загрузке.
+
+Каждая версия из IMAGE_RENDITIONS создаётся Pillow в отдельном процессе
+пула (IMAGE_WORKERS): поворот по EXIF, уменьшение с сохранением пропорций
+и сохранение в IMAGE_FORMAT (по умолчанию WebP) без метаданных (EXIF с
+геотегами, ICC, комментарии). Изображение не увеличивается: версии
+крупнее исходника пропускаются.
+"""
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from config import IMAGE_RENDITIONS, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_WORKERS, logger
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+# Форматы без альфа-канала: прозрачность заменяется белым фоном
+_NO_ALPHA_FORMATS = {"jpeg", "jpg"}
+
+
+def probe_image(path: str) -> dict:
+    """Ширина и высота изображения с учётом поворота по EXIF"""
+    from PIL import Image
+    with Image.open(path) as image:
+        width, height = image.size
+        # Ориентации 5-8 — поворот на 90°: стороны меняются местами
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):
+            width, height = height, width
+    return {"width": width, "height": height}
+
+
+def _render(source_path: str, target_path: str, rendition: dict) -> dict:
+    """Создание одной версии (выполняется в процессе пула)"""
+    from PIL import Image, ImageOps
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source)
+        image.thumbnail((rendition["width"], rendition["height"]), Image.Resampling.LANCZOS)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        if IMAGE_FORMAT.lower() in _NO_ALPHA_FORMATS and has_alpha:
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+            image = background
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        # Метаданные не переносятся: плагины Pillow берут их из info
+        image.info = {}
+        options = {"quality": IMAGE_QUALITY}
+        if IMAGE_FORMAT.lower() == "webp":
+            options["method"] = 4
+        elif IMAGE_FORMAT.lower() in _NO_ALPHA_FORMATS:
+            options.update(optimize=True, progressive=True)
+        image.save(target_path, format=IMAGE_FORMAT.upper().replace("JPG", "JPEG"), **options)
+        return {"rendition": rendition["name"], "width": image.width, "height": image.height}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+async def render_image(source_path: str, target_dir: str,
+                       renditions: List[dict] = IMAGE_RENDITIONS) -> Tuple[dict, List[Tuple[str, dict]]]:
+    """
+    Создаёт версии изображения в target_dir.
+
+    Returns:
+        Поля исходника (width/height) и список (путь, поля) готовых версий.
+        Если Pillow не установлен или исходник не читается — ({}, []):
+        загрузится только оригинал.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        source = await loop.run_in_executor(None, probe_image, source_path)
+    except ImportError:
+        logger.error("Pillow не установлен, версии изображений не создаются")
+        return {}, []
+    except (OSError, ValueError) as e:
+        logger.error(f"Не удалось прочитать изображение {source_path}, версии не создаются: {e}")
+        return {}, []
+
+    extension = IMAGE_FORMAT.lower().replace("jpeg", "jpg")
+    planned = [
+        rendition for rendition in renditions
+        if rendition["width"] <= source["width"] or rendition["height"] <= source["height"]
+    ]
+    paths = [os.path.join(target_dir, f"{rendition['name']}.{extension}") for rendition in planned]
+    tasks = [
+        loop.run_in_executor(_get_executor(), _render, source_path, path, rendition)
+        for path, rendition in zip(paths, planned)
+    ]
+    results = []
+    for path, rendition, result in zip(paths, planned, await asyncio.gather(*tasks, return_exceptions=True)):
+        if isinstance(result, Exception):
+            logger.error(f"Ошибка создания версии {rendition['name']} для {source_path}: {result}")
+            continue
+        results.append((path, result))
+        logger.info(f"Версия {rendition['name']} для {source_path}: {result['width']}x{result['height']}, "
+                    f"{os.path.getsize(path) // 1024} КБ")
+    return source, results
@@ -0,0 +1,327 @@
+"""
+Relay-сервер медиа для группы киосков.
+
+Скачивает каждую запись из БД один раз, хранит её на локальном диске и
+раздаёт киоскам по HTTP с поддержкой Range и ETag (sha256 содержимого).
+Так трафик из БД при смене контента — одна копия на здание, а не на экран.
+
+    GET /media/<table>/latest?known_id=&known_sha256=&wait=
+        Метаданные новой записи (200) или 204, если новее ничего нет.
+        wait — long polling: ждать изменения до wait секунд.
+    GET /media/<table>/recent?limit=
+        Метаданные последних limit записей.
+    GET|HEAD /media/<table>/<id>
+        Содержимое записи; поддерживаются Range и If-None-Match.
+    GET /media/<table>/<id>/meta
+        Метаданные записи.
+    GET /media/<table>/<id>/best?width=&height=
+        Метаданные версии, лучше всего подходящей под экран.
+    GET /schedule
+        Включённые элементы расписания показа.
+    GET /metrics
+        Метрики relay в формате Prometheus.
+
+Запуск: python -m server.relay [--host HOST] [--port PORT]
+"""
+import os
+import json
+import math
+import asyncio
+import argparse
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+from database.media import MEDIA_TABLES
+from database.listener import MediaListener
+from database.functions import init_db
+from functions import (get_latest_media_meta, get_recent_media_meta, get_media_meta, get_best_rendition,
+                       get_schedule_items, download_media_ranges)
+from client.media_cache import MediaCache
+from config import RELAY_HOST, RELAY_PORT, RELAY_CACHE_DIR, RELAY_CACHE_MAX_BYTES, logger
+from metrics import REGISTRY
+
+STATUS_TEXT = {
+    200: "OK", 204: "No Content", 206: "Partial Content", 304: "Not Modified",
+    400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    416: "Range Not Satisfiable", 502: "Bad Gateway",
+}
+MAX_WAIT = 120  # seconds
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message or STATUS_TEXT.get(status, ""))
+        self.status = status
+
+
+def parse_range(header: str, size: int) -> Tuple[int, int]:
+    """Разбор заголовка Range (один диапазон) в [start, end] включительно"""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise HTTPError(416)
+    start_text, _, end_text = spec.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # bytes=-N — последние N байт
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        raise HTTPError(416)
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise HTTPError(416)
+    return start, end
+
+
+class MediaRelay:
+    """HTTP relay с дисковым кэшем и однократной загрузкой каждой записи из БД"""
+
+    def __init__(self, cache_dir: str = RELAY_CACHE_DIR, max_bytes: int = RELAY_CACHE_MAX_BYTES):
+        self.cache = MediaCache(cache_dir, max_bytes)
+        self._latest: Dict[str, dict] = {}
+        self._changed: Dict[str, asyncio.Event] = {table: asyncio.Event() for table in MEDIA_TABLES}
+        self.listener = MediaListener(self._on_notification)
+
+    def _on_notification(self, payload: Optional[dict]) -> None:
+        """Новый контент в БД: сбрасываем метаданные и будим long polling"""
+        tables = [payload["table"]] if payload and payload.get("table") in MEDIA_TABLES else list(MEDIA_TABLES)
+        for table in tables:
+            self._latest.pop(table, None)
+            self._changed[table].set()
+            self._changed[table] = asyncio.Event()
+            if payload and payload.get("id"):
+                # Качаем заранее, чтобы киоски получили файл уже из кэша
+                asyncio.ensure_future(self._prefetch(table, payload["id"]))
+
+    async def _prefetch(self, table: str, media_id: int) -> None:
+        try:
+            await self._ensure_cached(table, media_id)
+        except Exception as e:
+            logger.error(f"Relay: не удалось заранее загрузить {table} id={media_id}: {e}")
+
+    async def _get_latest(self, table: str) -> dict:
+        if table not in self._latest:
+            meta = await get_latest_media_meta(table)
+            if meta is None:
+                raise HTTPError(502, "БД недоступна")
+            self._latest[table] = meta
+        return self._latest[table]
+
+    async def _ensure_cached(self, table: str, media_id: int) -> Tuple[str, str]:
+        """Путь и sha256 записи в кэше; одновременные запросы ждут одну загрузку (MediaCache.once)"""
+        path = self.cache.get(table, media_id)
+        if not path:
+            path = await self.cache.once(table, media_id, lambda: self._fetch(table, media_id))
+        return path, self.cache.get_sha256(table, media_id)
+
+    async def _known_sha256(self, table: str, media_id: int) -> Optional[str]:
+        """sha256 записи без скачивания: из кэша или из метаданных в БД"""
+        if self.cache.get(table, media_id):
+            return self.cache.get_sha256(table, media_id)
+        meta = await get_media_meta(table, media_id)
+        return meta["sha256"] if meta else None
+
+    async def _fetch(self, table: str, media_id: int) -> str:
+        meta = await get_media_meta(table, media_id)
+        if not meta:
+            raise HTTPError(404)
+        logger.info(f"Relay: загрузка {table} id={media_id} из БД")
+        # Диапазонами по нескольким соединениям, с докачкой после обрыва
+        download_path = self.cache.download_path(table, media_id)
+        path = None
+        if await download_media_ranges(table, media_id, download_path):
+            path = await self.cache.store_file(table, media_id, download_path, meta["sha256"])
+        if not path:
+            raise HTTPError(502, "Не удалось скачать запись из БД")
+        return path
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            try:
+                await self._route(method, target, headers, writer)
+            except HTTPError as e:
+                await self._send(writer, e.status, body=str(e).encode("utf-8"))
+        except (ValueError, ConnectionError):
+            pass
+        except Exception as e:
+            logger.error(f"Relay: ошибка обработки запроса: {e}")
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _route(self, method: str, target: str, headers: dict, writer: asyncio.StreamWriter) -> None:
+        url = urlsplit(target)
+        parts = url.path.strip("/").split("/")
+        if parts == ["schedule"] and method == "GET":
+            items = await get_schedule_items()
+            if items is None:
+                raise HTTPError(502, "БД недоступна")
+            await self._send_json(writer, items)
+            return
+        if parts == ["metrics"] and method == "GET":
+            body = REGISTRY.render_prometheus().encode("utf-8")
+            await self._send(writer, 200, {"Content-Type": "text/plain; version=0.0.4"}, body)
+            return
+        if len(parts) not in (3, 4) or parts[0] != "media" or parts[1] not in MEDIA_TABLES:
+            raise HTTPError(404)
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405)
+        table = parts[1]
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if parts[2] == "latest" and len(parts) == 3:
+            await self._serve_latest(table, query, writer)
+            return
+        if parts[2] == "recent" and len(parts) == 3:
+            await self._serve_recent(table, query, writer)
+            return
+        try:
+            media_id = int(parts[2])
+        except ValueError:
+            raise HTTPError(404)
+        if len(parts) == 3:
+            await self._serve_media(table, media_id, method, headers, writer)
+        elif parts[3] == "best":
+            await self._serve_best(table, media_id, query, writer)
+        elif parts[3] == "meta":
+            meta = await get_media_meta(table, media_id)
+            if not meta:
+                raise HTTPError(404)
+            await self._send_json(writer, meta)
+        else:
+            raise HTTPError(404)
+
+    async def _serve_latest(self, table: str, query: dict, writer: asyncio.StreamWriter) -> None:
+        try:
+            known_id = int(query["known_id"]) if query.get("known_id") else None
+            wait = float(query.get("wait") or 0)
+        except ValueError:
+            raise HTTPError(400, "Некорректный known_id или wait")
+        if not math.isfinite(wait):
+            raise HTTPError(400, "Некорректный wait")
+        wait = min(wait, MAX_WAIT)
+        known_sha256 = query.get("known_sha256") or None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+
+        while True:
+            changed = self._changed[table]
+            meta = await self._get_latest(table)
+            if meta and not (meta["id"] == known_id and (known_sha256 is None or meta["sha256"] == known_sha256)):
+                await self._send_json(writer, meta)
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                await self._send(writer, 204)
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _serve_recent(self, table: str, query: dict, writer: asyncio.StreamWriter) -> None:
+        try:
+            limit = min(int(query.get("limit", 10)), 100)
+        except ValueError:
+            raise HTTPError(400, "Некорректный limit")
+        metas = await get_recent_media_meta(table, limit)
+        if metas is None:
+            raise HTTPError(502, "БД недоступна")
+        await self._send_json(writer, metas)
+
+    async def _serve_best(self, table: str, media_id: int, query: dict, writer: asyncio.StreamWriter) -> None:
+        try:
+            width, height = int(query["width"]), int(query["height"])
+        except (KeyError, ValueError):
+            raise HTTPError(400, "Нужны параметры width и height")
+        meta = await get_best_rendition(table, media_id, width, height)
+        if meta is None:
+            raise HTTPError(404)
+        await self._send_json(writer, meta)
+
+    async def _serve_media(self, table: str, media_id: int, method: str,
+                           headers: dict, writer: asyncio.StreamWriter) -> None:
+        if "if-none-match" in headers:
+            # Проверка актуальности не должна вызывать скачивание файла из БД
+            sha256 = await self._known_sha256(table, media_id)
+            if sha256 and headers["if-none-match"] == f'"{sha256}"':
+                await self._send(writer, 304, {"ETag": f'"{sha256}"'})
+                return
+
+        path, sha256 = await self._ensure_cached(table, media_id)
+        size = os.path.getsize(path)
+        etag = f'"{sha256}"'
+        base_headers = {"ETag": etag, "Accept-Ranges": "bytes", "Content-Type": "application/octet-stream"}
+
+        status, start, end = 200, 0, size - 1
+        if "range" in headers and headers.get("if-range", etag) == etag:
+            try:
+                start, end = parse_range(headers["range"], size)
+            except HTTPError:
+                await self._send(writer, 416, {"Content-Range": f"bytes */{size}"})
+                return
+            status = 206
+            base_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        length = end - start + 1
+        await self._send(writer, status, base_headers, length=length)
+        if method == "HEAD" or length == 0:
+            return
+        with open(path, "rb") as file:
+            await writer.drain()
+            # sendfile отдаёт файл из page cache ядра без копирования в Python
+            await asyncio.get_running_loop().sendfile(writer.transport, file, start, length)
+        REGISTRY.counter("relay_bytes_served_total", "Байт медиа, отданных киоскам", table=table).inc(length)
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, headers: Optional[dict] = None,
+                    body: bytes = b"", length: Optional[int] = None) -> None:
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+        all_headers = {"Connection": "close", "Content-Length": str(len(body) if length is None else length)}
+        all_headers.update(headers or {})
+        lines += [f"{name}: {value}" for name, value in all_headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, data) -> None:
+        body = json.dumps(data, default=str).encode("utf-8")
+        await self._send(writer, 200, {"Content-Type": "application/json"}, body)
+
+    async def serve_forever(self, host: str = RELAY_HOST, port: int = RELAY_PORT) -> None:
+        self.listener.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Relay медиа слушает {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.listener.stop()
+
+
+async def main(host: str = RELAY_HOST, port: int = RELAY_PORT) -> None:
+    # Киоски за relay к БД не ходят — схему проверяет relay
+    if not await init_db():
+        logger.error("Схема БД не подготовлена, relay запускается без неё")
+    await MediaRelay().serve_forever(host, port)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Relay-сервер медиа для киосков")
+    parser.add_argument("--host", default=RELAY_HOST)
+    parser.add_argument("--port", type=int, default=RELAY_PORT)
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port))
@@ -0,0 +1,218 @@
+"""
+Очистка старого медиа в БД.
+
+Политика хранения (config.RETENTION) оставляет запись, если выполняется
+хотя бы одно условие:
+  - она среди keep_last новейших оригиналов таблицы;
+  - она моложе max_age_days (0 — возраст не учитывается);
+  - она закреплена (pinned = true);
+  - на неё ссылается расписание (schedule_items).
+Остальные оригиналы удаляются пачками по batch_size вместе со своими
+версиями и чанками (ON DELETE CASCADE). Перед удалением оригинал
+выгружается в archive_dir как gzip, если каталог задан.
+
+Каждая пачка удаляется в отдельной короткой транзакции с lock_timeout:
+если строки заняты (например, их сейчас читает киоск), пачка
+пропускается до следующего запуска, а не ждёт блокировку. Освобождённое
+место Postgres переиспользует после autovacuum; --vacuum запускает
+обычный VACUUM (без эксклюзивной блокировки) сразу.
+
+Запуск: python -m server.retention [--dry-run] [--table videos] [--vacuum] [--interval 3600]
+"""
+import os
+import gzip
+import json
+import time
+import asyncio
+import argparse
+import mimetypes
+from typing import List, Optional
+from database.database import Database
+from database.media import MEDIA_TABLES
+from functions import stream_media
+from config import RETENTION, logger
+from metrics import REGISTRY
+
+# Запись защищена, если на неё ссылается любой элемент расписания (и выключенный тоже)
+SCHEDULED = "EXISTS (SELECT 1 FROM schedule_items s WHERE s.media_table = $1 AND s.media_id = m.id)"
+
+
+async def relation_size(table: str) -> Optional[int]:
+    """Размер таблицы заголовков и таблицы чанков на диске вместе с TOAST и индексами"""
+    spec = MEDIA_TABLES[table]
+    async with Database(readonly=True) as db:
+        result = await db.execute(
+            "SELECT pg_total_relation_size($1::regclass) + pg_total_relation_size($2::regclass) AS size",
+            (spec.table, spec.chunk_table)
+        )
+    return result["size"] if result else None
+
+
+async def find_candidates(table: str, after_id: int, limit: int) -> Optional[List[dict]]:
+    """Следующие limit оригиналов с id > after_id, которые политика разрешает удалить"""
+    spec = MEDIA_TABLES[table]
+    async with Database(readonly=True) as db:
+        return await db.execute_all(
+            f"""SELECT m.id, m.sha256, m.mime_type, m.created_at,
+                       coalesce(m.size, 0) + coalesce(
+                           (SELECT sum(r.size) FROM {spec.table} r WHERE r.parent_id = m.id), 0
+                       ) AS total_size
+                  FROM {spec.table} m
+                 WHERE m.parent_id IS NULL AND NOT m.pinned AND m.id > $2
+                   AND m.id NOT IN (SELECT id FROM {spec.table} WHERE parent_id IS NULL
+                                     ORDER BY id DESC LIMIT $3)
+                   AND ($4::float8 = 0 OR m.created_at < now() - $4::float8 * interval '1 day')
+                   AND NOT {SCHEDULED}
+                 ORDER BY m.id
+                 LIMIT $5""",
+            (table, after_id, RETENTION["keep_last"], RETENTION["max_age_days"], limit)
+        )
+
+
+def _archive_name(table: str, item: dict) -> str:
+    suffix = mimetypes.guess_extension(item["mime_type"] or "") or ".bin"
+    return os.path.join(RETENTION["archive_dir"], table, f"{item['id']}-{item['sha256']}{suffix}.gz")
+
+
+async def archive(table: str, item: dict) -> bool:
+    """Выгрузка оригинала в gzip-файл (и метаданных рядом в .json); False — не удалять"""
+    path = _archive_name(table, item)
+    part_path = f"{path}.part"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with gzip.open(part_path, 'wb', compresslevel=RETENTION["gzip_level"]) as file:
+            async for chunk in stream_media(table, item["id"]):
+                await asyncio.to_thread(file.write, chunk)
+        os.replace(part_path, path)
+        with open(f"{path[:-3]}.json", 'w', encoding='utf-8') as file:
+            json.dump(item, file, ensure_ascii=False, default=str)
+        return True
+    except Exception as e:
+        logger.error(f"Не удалось архивировать {table} id={item['id']}: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return False
+
+
+async def delete_batch(table: str, ids: List[int]) -> Optional[List[int]]:
+    """
+    Удаление пачки в короткой транзакции. Условия политики проверяются
+    повторно: запись могли закрепить или поставить в расписание после отбора.
+    """
+    spec = MEDIA_TABLES[table]
+    async with Database() as db:
+        if await db.execute(f"SET LOCAL lock_timeout = '{int(RETENTION['lock_timeout'] * 1000)}ms'") is None:
+            return None
+        rows = await db.execute_all(
+            f"""DELETE FROM {spec.table} m
+                 WHERE m.id = ANY($2::bigint[]) AND NOT m.pinned AND NOT {SCHEDULED}
+                RETURNING m.id""",
+            (table, ids)
+        )
+        if rows is None:
+            # lock_timeout или другая ошибка: транзакция откатится, пачка — в следующий раз
+            logger.warning(f"Пачка {table} из {len(ids)} записей не удалена, повтор при следующем запуске")
+            return None
+        return [row["id"] for row in rows]
+
+
+async def apply_policy(table: str, dry_run: bool = False) -> dict:
+    """Один проход политики по таблице; возвращает отчёт"""
+    report = {"table": table, "candidates": 0, "archived": 0, "deleted": 0,
+              "bytes_reclaimed": 0, "skipped": 0, "size_before": await relation_size(table)}
+    after_id = 0
+    while True:
+        items = await find_candidates(table, after_id, RETENTION["batch_size"])
+        if not items:
+            if items is None:
+                report["error"] = "не удалось получить кандидатов"
+            break
+        after_id = items[-1]["id"]
+        report["candidates"] += len(items)
+        if dry_run:
+            report["bytes_reclaimed"] += sum(item["total_size"] for item in items)
+            continue
+
+        ready = []
+        for item in items:
+            if not RETENTION["archive_dir"] or await archive(table, item):
+                ready.append(item)
+                report["archived"] += bool(RETENTION["archive_dir"])
+            else:
+                report["skipped"] += 1
+        if not ready:
+            continue
+
+        deleted = await delete_batch(table, [item["id"] for item in ready])
+        if deleted is None:
+            report["skipped"] += len(ready)
+            continue
+        reclaimed = sum(item["total_size"] for item in ready if item["id"] in set(deleted))
+        report["deleted"] += len(deleted)
+        report["skipped"] += len(ready) - len(deleted)
+        report["bytes_reclaimed"] += reclaimed
+        REGISTRY.counter("retention_deleted_total", "Удалённые политикой хранения записи", table=table).inc(len(deleted))
+        REGISTRY.counter("retention_bytes_reclaimed_total", "Освобождённые политикой хранения байты",
+                         table=table).inc(reclaimed)
+        # Пауза между пачками: не занимаем БД подряд, пока киоски качают видео
+        await asyncio.sleep(RETENTION["batch_pause"])
+
+    report["size_after"] = await relation_size(table)
+    return report
+
+
+async def vacuum(table: str) -> None:
+    """Обычный VACUUM: помечает место удалённых строк для повторного использования"""
+    spec = MEDIA_TABLES[table]
+    # readonly — без транзакции: VACUUM внутри транзакции запрещён
+    async with Database(readonly=True) as db:
+        await db.execute(f"VACUUM (ANALYZE) {spec.chunk_table}")
+        await db.execute(f"VACUUM (ANALYZE) {spec.table}")
+
+
+def format_report(report: dict, dry_run: bool) -> str:
+    mb = report["bytes_reclaimed"] / 1024 ** 2
+    sizes = ""
+    if report.get("size_before") is not None and report.get("size_after") is not None:
+        sizes = f"; на диске {report['size_before'] / 1024 ** 2:.1f} -> {report['size_after'] / 1024 ** 2:.1f} МБ"
+    if dry_run:
+        return f"{report['table']}: к удалению {report['candidates']} записей, {mb:.1f} МБ (пробный запуск)"
+    return (f"{report['table']}: удалено {report['deleted']} из {report['candidates']}, "
+            f"в архиве {report['archived']}, пропущено {report['skipped']}, освобождено {mb:.1f} МБ{sizes}")
+
+
+async def run_once(tables: List[str], dry_run: bool, run_vacuum: bool) -> List[dict]:
+    reports = []
+    for table in tables:
+        started_at = time.perf_counter()
+        report = await apply_policy(table, dry_run)
+        if run_vacuum and not dry_run and report["deleted"]:
+            await vacuum(table)
+            report["size_after"] = await relation_size(table)
+        report["seconds"] = round(time.perf_counter() - started_at, 1)
+        logger.info(f"Хранение: {format_report(report, dry_run)}")
+        reports.append(report)
+    return reports
+
+
+async def main(tables: List[str], dry_run: bool, run_vacuum: bool, interval: float) -> List[dict]:
+    if RETENTION["keep_last"] < 1:
+        raise SystemExit("RETENTION_KEEP_LAST должен быть не меньше 1: новейшая запись показывается на экранах")
+    try:
+        while True:
+            reports = await run_once(tables, dry_run, run_vacuum)
+            if not interval:
+                return reports
+            await asyncio.sleep(interval)
+    finally:
+        await Database.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Очистка старого медиа по политике хранения")
+    parser.add_argument("--table", choices=sorted(MEDIA_TABLES), help="Только одна таблица")
+    parser.add_argument("--dry-run", action="store_true", help="Только показать, что будет удалено")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM после удаления")
+    parser.add_argument("--interval", type=float, default=0, help="Повторять каждые N секунд (0 — один проход)")
+    args = parser.parse_args()
+    asyncio.run(main([args.table] if args.table else sorted(MEDIA_TABLES), args.dry_run, args.vacuum, args.interval))
@@ -0,0 +1,111 @@
+"""
+Перекодирование видео в целевые профили дисплеев при загрузке.
+
+Каждая версия из TRANSCODE_RENDITIONS кодируется локальным ffmpeg в
+отдельном процессе пула (TRANSCODE_WORKERS): H.264 с ограничением
+битрейта, без звука (киоски играют без звука) и с moov-атомом в начале
+файла (faststart). Видео не увеличивается: версии крупнее исходника
+пропускаются.
+
+Перекодирование включается только заданным TRANSCODE_RENDITIONS. Каждая
+версия — полное кодирование видео заново, и загрузка ролика занимает CPU
+сервера на время всех кодирований; TRANSCODE_WORKERS стоит выбирать по
+числу свободных ядер.
+"""
+import os
+import json
+import asyncio
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from config import TRANSCODE_RENDITIONS, TRANSCODE_CODEC, TRANSCODE_WORKERS, FFMPEG_PATH, FFPROBE_PATH, logger
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def parse_bitrate(bitrate: str) -> int:
+    """'4M' / '2500k' / '800000' -> бит/с"""
+    multipliers = {"k": 1000, "m": 1000 ** 2, "g": 1000 ** 3}
+    suffix = bitrate[-1].lower()
+    if suffix in multipliers:
+        return int(float(bitrate[:-1]) * multipliers[suffix])
+    return int(bitrate)
+
+
+def probe_video(path: str) -> dict:
+    """Ширина, высота и битрейт первого видеопотока через ffprobe"""
+    output = subprocess.run(
+        [FFPROBE_PATH, "-v", "error", "-select_streams", "v:0",
+         "-show_entries", "stream=width,height:format=bit_rate", "-of", "json", path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    info = json.loads(output)
+    stream = info["streams"][0]
+    bitrate = info.get("format", {}).get("bit_rate")
+    return {"width": int(stream["width"]), "height": int(stream["height"]),
+            "bitrate": int(bitrate) if bitrate and bitrate != "N/A" else None}
+
+
+def _transcode(source_path: str, target_path: str, rendition: dict) -> dict:
+    """Кодирование одной версии (выполняется в процессе пула)"""
+    width, height = rendition["width"], rendition["height"]
+    bitrate = rendition["bitrate"]
+    subprocess.run(
+        [FFMPEG_PATH, "-y", "-v", "error", "-i", source_path,
+         # Вписываем в рамку с сохранением пропорций, размеры чётные для yuv420p
+         "-vf", f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"scale=trunc(iw/2)*2:trunc(ih/2)*2",
+         "-c:v", TRANSCODE_CODEC, "-preset", "medium", "-pix_fmt", "yuv420p",
+         "-b:v", bitrate, "-maxrate", bitrate, "-bufsize", f"{parse_bitrate(bitrate) * 2}",
+         "-an", "-movflags", "+faststart", target_path],
+        check=True, capture_output=True, text=True
+    )
+    info = probe_video(target_path)
+    return {"rendition": rendition["name"], "width": info["width"], "height": info["height"],
+            "bitrate": parse_bitrate(bitrate)}
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=TRANSCODE_WORKERS)
+    return _executor
+
+
+async def transcode_video(source_path: str, target_dir: str,
+                          renditions: List[dict] = TRANSCODE_RENDITIONS) -> Tuple[dict, List[Tuple[str, dict]]]:
+    """
+    Создаёт версии видео в target_dir.
+
+    Returns:
+        Поля исходника (width/height/bitrate) и список (путь, поля) готовых версий.
+        Если ffmpeg недоступен или исходник не читается — ({}, []): загрузится
+        только оригинал.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        source = await loop.run_in_executor(None, probe_video, source_path)
+    except (OSError, subprocess.CalledProcessError, ValueError, KeyError, IndexError) as e:
+        logger.error(f"Не удалось прочитать параметры видео {source_path}, перекодирование пропущено: {e}")
+        return {}, []
+
+    planned = [
+        rendition for rendition in renditions
+        if rendition["width"] <= source["width"] or rendition["height"] <= source["height"]
+    ]
+    tasks = [
+        loop.run_in_executor(
+            _get_executor(), _transcode, source_path,
+            os.path.join(target_dir, f"{rendition['name']}.mp4"), rendition
+        )
+        for rendition in planned
+    ]
+    results = []
+    for rendition, result in zip(planned, await asyncio.gather(*tasks, return_exceptions=True)):
+        if isinstance(result, Exception):
+            details = getattr(result, "stderr", "") or result
+            logger.error(f"Ошибка перекодирования {source_path} в {rendition['name']}: {details}")
+            continue
+        results.append((os.path.join(target_dir, f"{rendition['name']}.mp4"), result))
+        logger.info(f"Версия {rendition['name']} для {source_path}: {result['width']}x{result['height']}")
+    return {key: value for key, value in source.items() if value is not None}, results
@@ -1,15 +1,127 @@
 from database.database import Database
+from database.media import MEDIA_TABLES
 import os
-from typing import Union, Optional
-from config import logger
+import json
+import hashlib
+import tempfile
+import mimetypes
+from typing import Union, Optional, Sequence, Tuple
+from config import (logger, MEDIA_NOTIFY_CHANNEL, MEDIA_CHUNK_SIZE, MEDIA_COPY_BATCH, TRANSCODE_RENDITIONS,
+                    IMAGE_RENDITIONS)
+from metrics import REGISTRY
 
-async def upload_image_to_db(image_path: str, additional_fields: Optional[dict] = None) -> Optional[int]:
+
+async def notify_media_update(db: Database, table: str, media_id: int) -> bool:
+    """
+    Публикует уведомление о новом контенте в канал MEDIA_NOTIFY_CHANNEL.
+    
+    Вызывается внутри транзакции загрузки: Postgres доставит уведомление
+    подписчикам только после успешного коммита.
+    
+    Returns:
+        True, если уведомление поставлено в очередь, иначе False
+    """
+    payload = json.dumps({"table": table, "id": media_id})
+    return await db.execute("SELECT pg_notify($1, $2)", (MEDIA_NOTIFY_CHANNEL, payload)) is not None
+
+
+async def _write_media(db: Database, table: str, path: str, additional_fields: Optional[dict] = None,
+                       sha256: Optional[str] = None) -> Optional[int]:
+    """
+    Потоковая запись файла в БД в рамках транзакции db: строка-заголовок в
+    table и чанки по MEDIA_CHUNK_SIZE байт, отправляемые пачками через COPY.
+    В памяти одновременно не больше MEDIA_COPY_BATCH чанков, независимо от
+    размера файла. Размер и sha256 считаются по ходу чтения и сохраняются в
+    заголовке вместе с MIME-типом; если sha256 файла уже известен
+    вызывающему, он передаётся и повторно не считается.
+    """
+    spec = MEDIA_TABLES[table]
+
+    # Формируем SQL запрос для строки-заголовка
+    if additional_fields:
+        fields = list(additional_fields.keys())
+        placeholders = [f'${i+1}' for i in range(len(additional_fields))]
+        values = list(additional_fields.values())
+        
+        sql = f"""
+            INSERT INTO {spec.table} ({', '.join(fields)})
+            VALUES ({', '.join(placeholders)})
+            RETURNING id
+        """
+    else:
+        sql = f"INSERT INTO {spec.table} DEFAULT VALUES RETURNING id"
+        values = ()
+
+    media_id = await db.fetchval(sql, values)
+    if media_id is None:
+        return None
+
+    chunk_count = 0
+    size = 0
+    digest = None if sha256 else hashlib.sha256()
+    batch = []
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(MEDIA_CHUNK_SIZE)
+            if chunk:
+                batch.append((media_id, chunk_count, chunk, hashlib.sha256(chunk).hexdigest()))
+                chunk_count += 1
+                size += len(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+            if batch and (not chunk or len(batch) >= MEDIA_COPY_BATCH):
+                if not await db.copy_records(spec.chunk_table, batch, ['media_id', 'seq', 'data', 'sha256']):
+                    # Исключение откатит транзакцию в Database.__aexit__
+                    raise RuntimeError(f"Не удалось записать чанки файла {path}")
+                batch = []
+            if not chunk:
+                break
+
+    REGISTRY.counter("db_bytes_total", "Байт медиа, переданных через БД", direction="write", table=table).inc(size)
+    updated = await db.execute(
+        f"""UPDATE {spec.table}
+               SET chunk_size = $2, chunk_count = $3, size = $4, sha256 = $5, mime_type = $6
+             WHERE id = $1""",
+        (media_id, MEDIA_CHUNK_SIZE, chunk_count, size, sha256 or digest.hexdigest(),
+         mimetypes.guess_type(path)[0])
+    )
+    if updated is None:
+        raise RuntimeError(f"Не удалось обновить заголовок файла {path}")
+    return media_id
+
+
+async def _upload_media(table: str, path: str, additional_fields: Optional[dict] = None,
+                        renditions: Sequence[Tuple[str, dict]] = (), sha256: Optional[str] = None) -> Optional[int]:
+    """
+    Потоковая загрузка файла в БД с уведомлением клиентов.
+    
+    Вся загрузка идёт в одной транзакции, поэтому недокачанный файл
+    никогда не виден клиентам. Версии (renditions) — пары (путь, поля) —
+    записываются в ту же таблицу с parent_id оригинала и становятся
+    видны клиентам одновременно с ним.
+    """
+    async with Database() as db:
+        media_id = await _write_media(db, table, path, additional_fields, sha256)
+        if media_id is None:
+            return None
+        for rendition_path, fields in renditions:
+            if await _write_media(db, table, rendition_path, {**fields, "parent_id": media_id}) is None:
+                raise RuntimeError(f"Не удалось записать версию {rendition_path}")
+        if not await notify_media_update(db, table, media_id):
+            # Без уведомления киоски не узнают о новом файле до переподключения
+            raise RuntimeError(f"Не удалось отправить уведомление о {table} id={media_id}")
+        return media_id
+
+
+async def upload_image_to_db(image_path: str, additional_fields: Optional[dict] = None,
+                             sha256: Optional[str] = None) -> Optional[int]:
     """
     Загружает изображение в базу данных в таблицу images.
     
     Args:
         image_path: Путь к файлу изображения
         additional_fields: Дополнительные поля для вставки (если есть в таблице)
+        sha256: Уже посчитанный sha256 файла (если есть)
         
     Returns:
         ID вставленной записи или None в случае ошибки
@@ -20,32 +132,15 @@ async def upload_image_to_db(image_path: str, additional_fields: Optional[dict]
         return None
     
     try:
-        # Читаем файл изображения в бинарном режиме
-        with open(image_path, 'rb') as file:
-            image_data = file.read()
-        
-        # Формируем SQL запрос и параметры
-        if additional_fields:
-            # Если есть дополнительные поля
-            fields = ['image'] + list(additional_fields.keys())
-            placeholders = ['$1'] + [f'${i+2}' for i in range(len(additional_fields))]
-            values = [image_data] + list(additional_fields.values())
-            
-            sql = f"""
-                INSERT INTO images ({', '.join(fields)})
-                VALUES ({', '.join(placeholders)})
-                RETURNING id
-            """
-        else:
-            # Если только изображение
-            sql = "INSERT INTO images (image) VALUES ($1) RETURNING id"
-            values = (image_data,)
-        
-        # Выполняем запрос через класс Database
-        async with Database() as db:
-            image_id = await db.fetchval(sql, values)
-            return image_id
-            
+        if IMAGE_RENDITIONS:
+            # Версии под экраны и миниатюры (Pillow в пуле процессов)
+            from server.image_renditions import render_image
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                source_fields, renditions = await render_image(image_path, tmp_dir)
+                return await _upload_media(
+                    "images", image_path, {**(additional_fields or {}), **source_fields}, renditions, sha256
+                )
+        return await _upload_media("images", image_path, additional_fields, sha256=sha256)
     except FileNotFoundError:
         logger.error(f"Файл изображения не найден: {image_path}")
         return None
@@ -54,13 +149,15 @@ async def upload_image_to_db(image_path: str, additional_fields: Optional[dict]
         return None
 
 
-async def upload_video_to_db(video_path: str, additional_fields: Optional[dict] = None) -> Optional[int]:
+async def upload_video_to_db(video_path: str, additional_fields: Optional[dict] = None,
+                             sha256: Optional[str] = None) -> Optional[int]:
     """
     Загружает видео в базу данных в таблицу videos.
     
     Args:
         video_path: Путь к видеофайлу
         additional_fields: Дополнительные поля для вставки (если есть в таблице)
+        sha256: Уже посчитанный sha256 файла (если есть)
         
     Returns:
         ID вставленной записи или None в случае ошибки
@@ -71,30 +168,15 @@ async def upload_video_to_db(video_path: str, additional_fields: Optional[dict]
         return None
     
     try:
-        # Читаем файл видео в бинарном режиме
-        with open(video_path, 'rb') as file:
-            video_data = file.read()
-        
-        # Формируем SQL запрос и параметры
-        if additional_fields:
-            fields = ['video'] + list(additional_fields.keys())
-            placeholders = ['$1'] + [f'${i+2}' for i in range(len(additional_fields))]
-            values = [video_data] + list(additional_fields.values())
-            
-            sql = f"""
-                INSERT INTO videos ({', '.join(fields)})
-                VALUES ({', '.join(placeholders)})
-                RETURNING id
-            """
-        else:
-            sql = "INSERT INTO videos (video) VALUES ($1) RETURNING id"
-            values = (video_data,)
-        
-        # Выполняем запрос через класс Database
-        async with Database() as db:
-            video_id = await db.fetchval(sql, values)
-            return video_id
-            
+        if TRANSCODE_RENDITIONS:
+            # Перекодирование в целевые профили дисплеев (ffmpeg в пуле процессов)
+            from server.transcode import transcode_video
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                source_fields, renditions = await transcode_video(video_path, tmp_dir)
+                return await _upload_media(
+                    "videos", video_path, {**(additional_fields or {}), **source_fields}, renditions, sha256
+                )
+        return await _upload_media("videos", video_path, additional_fields, sha256=sha256)
     except FileNotFoundError:
         logger.error(f"Файл видео не найден: {video_path}")
         return None
@@ -0,0 +1,32 @@
+import os
+import asyncio
+from client.media_cache import MediaCache
+
+
+async def _chunks(data: bytes):
+    yield data
+
+
+def _store(cache: MediaCache, media_id: int, data: bytes):
+    return asyncio.run(cache.store("videos", media_id, _chunks(data)))
+
+
+def test_new_entry_larger_than_limit_is_kept(tmp_path):
+    cache = MediaCache(root=str(tmp_path), max_bytes=10)
+    old_path = _store(cache, 1, b"a" * 8)
+    new_path = _store(cache, 2, b"b" * 32)
+
+    assert new_path is not None and os.path.exists(new_path)
+    assert "videos:2" in cache.entries
+    # Старая запись вытеснена, новая осталась, хотя одна больше лимита
+    assert "videos:1" not in cache.entries
+    assert not os.path.exists(old_path)
+
+
+def test_eviction_stops_once_under_limit(tmp_path):
+    cache = MediaCache(root=str(tmp_path), max_bytes=20)
+    for media_id, byte in enumerate(b"abc", start=1):
+        _store(cache, media_id, bytes([byte]) * 8)
+
+    assert set(cache.entries) == {"videos:2", "videos:3"}
+    assert cache.total_size() == 16